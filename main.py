@@ -1,7 +1,10 @@
 import logging
+import os
 import sys
+from datetime import date
 
 from src.vending_machine.machine import VendingMachine
+from src.vending_machine.planogram import load_planogram
 from src.vending_machine.product import Product
 from src.vending_machine.utils import validate_integer_input
 
@@ -16,9 +19,12 @@ MENU_STR = "\n1. Insert Money" \
            "\n5. Add New Product" \
            "\n6. Reload Product" \
            "\n7. Reload Currency" \
-           "\n8. Exit\n"
+           "\n8. Reload Planogram" \
+           "\n9. Exit\n"
 
 PRODUCT_ID = "Product ID"
+DEFAULT_STATE_FILE = "vending_machine_state.json"
+PROFILE_ENV = "VENDING_MACHINE_PROFILE"
 
 
 def insert_money(vending_machine: VendingMachine) -> None:
@@ -110,7 +116,8 @@ def reload_product(vending_machine: VendingMachine) -> None:
         display_products(vending_machine)
         product_id = validate_integer_input("Enter product ID to reload: ", PRODUCT_ID)
         quantity = validate_integer_input("Enter product quantity: ", "Product quantity")
-        vending_machine.reload_product(product_id, quantity)
+        expiry = input("Enter expiry date (YYYY-MM-DD, leave blank if none): ").strip()
+        vending_machine.reload_product(product_id, quantity, date.fromisoformat(expiry) if expiry else None)
         logger.info(f"Product with ID {product_id} reloaded with quantity {quantity}.")
         logger.info(f"Updated product details: {vending_machine.select_product(product_id)}")
     except ValueError as e:
@@ -135,6 +142,22 @@ def reload_currency(vending_machine: VendingMachine) -> None:
         logger.error(f"Error reloading currency: {e}")
 
 
+def reload_planogram(vending_machine: VendingMachine) -> None:
+    """
+    Load a new planogram (products, prices, slots and accepted denominations) from a JSON file.
+
+    Args:
+        vending_machine (VendingMachine): The vending machine object
+    """
+    try:
+        path = input("Enter planogram file path: ").strip()
+        vending_machine.reload_planogram(load_planogram(path))
+        logger.info(f"Planogram {path} loaded. Current balance: {vending_machine.balance}p.")
+        display_products(vending_machine)
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f"Error reloading planogram: {e}")
+
+
 def dispense_change(vending_machine: VendingMachine) -> None:
     """
     Dispense change to the user when exiting the vending machine.
@@ -145,11 +168,7 @@ def dispense_change(vending_machine: VendingMachine) -> None:
     logger.info("Dispensing change...")
     try:
         change = vending_machine.dispense_change()
-        change_total = 0
-        for denom, count in change.items():
-            change_total -= denom * count  # Negative count means dispensing that denomination
-            change[denom] = -count  # Change count to positive for display
-        logger.info(f"Change {change_total}p dispensed successfully. Dispensed denominations: {change}")
+        logger.info(f"Change {change.total}p dispensed successfully. Dispensed denominations: {change.to_dict()}")
     except ValueError as e:
         logger.error(f"Error dispensing change: {e}")
 
@@ -172,28 +191,166 @@ def display_menu():
     print(MENU_STR)
 
 
-def main():
+def create_sample_products() -> list[Product]:
     """
-    The main entry point for the Vending Machine application.
+    Create the sample products loaded into a new vending machine.
 
-    Initializes the vending machine, loads sample products, and manages the main application loop
-    where the user selects options from a menu.
+    Returns:
+        list: A list of sample Product objects.
     """
-
-    print("\nWelcome to the Vending Machine!\n")
-    logger.info("Starting the Vending Machine application.")
-    vending_machine = VendingMachine()
-
-    # Sample products to load
-    sample_products = [
+    return [
         Product(id_=1, name="Soda", price=120, quantity=10),
         Product(id_=2, name="Chips", price=80, quantity=5),
         Product(id_=3, name="Bio Banana", price=200, quantity=20),  # :)
         Product(id_=4, name="Candy", price=100, quantity=8)
     ]
 
+
+def build_parser():
+    """
+    Build the parser for the non-interactive subcommands.
+
+    Returns:
+        argparse.ArgumentParser: The command line parser.
+    """
+    import argparse  # Only needed when running a subcommand
+
+    parser = argparse.ArgumentParser(description="Run a single vending machine operation against a state file.")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE,
+                        help="machine state file, created with sample products if missing "
+                             f"(default: {DEFAULT_STATE_FILE})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    insert_parser = subparsers.add_parser("insert", help="insert money")
+    insert_parser.add_argument("denominations", type=int, nargs="+", help="denominations to insert, in pence")
+
+    buy_parser = subparsers.add_parser("buy", help="purchase a product")
+    buy_parser.add_argument("product_id", type=int, help="ID of the product to purchase")
+
+    subparsers.add_parser("dispense", help="dispense change for the remaining balance")
+
+    reload_parser = subparsers.add_parser("reload", help="reload a product or a currency denomination")
+    reload_parser.add_argument("target", choices=("product", "currency"), help="what to reload")
+    reload_parser.add_argument("key", type=int, help="product ID or denomination (in pence)")
+    reload_parser.add_argument("quantity", type=int, help="quantity to add")
+    reload_parser.add_argument("--expiry", type=date.fromisoformat, help="sell-by date of reloaded products")
+
+    search_parser = subparsers.add_parser("search", help="search products by name")
+    search_parser.add_argument("query", help="product name or the start of it")
+    search_parser.add_argument("--in-stock", action="store_true", help="only show products in stock")
+
+    status_parser = subparsers.add_parser("status", help="show the machine state")
+    status_parser.add_argument("--json", action="store_true", help="print the product listing as JSON")
+    return parser
+
+
+def run_command(argv: list[str], timings=None) -> int:
+    """
+    Run a single subcommand: load the machine state, apply the operation, save the state and return.
+
+    Args:
+        argv (list): The command line arguments.
+        timings (OperationTimings): Optional timings to record the vending machine operations in.
+
+    Returns:
+        int: The process exit code.
+    """
+    from src.vending_machine.state_file import load_state, save_state  # Only needed when running a subcommand
+
+    args = build_parser().parse_args(argv)
+    try:
+        try:
+            vending_machine = load_state(args.state)
+        except FileNotFoundError:
+            vending_machine = VendingMachine()
+            vending_machine.add_products(create_sample_products())
+        if timings is not None:
+            timings.instrument(vending_machine)
+
+        if args.command == "insert":
+            for denom in args.denominations:
+                vending_machine.insert_money(denom)
+            print(f"Balance: {vending_machine.balance}p")
+        elif args.command == "buy":
+            vending_machine.purchase_product(args.product_id)
+            print(f"Purchased product {args.product_id}. Balance: {vending_machine.balance}p")
+        elif args.command == "dispense":
+            change = vending_machine.dispense_change()
+            print(f"Dispensed {change.total}p: {change.to_dict()}")
+        elif args.command == "reload" and args.target == "product":
+            vending_machine.reload_product(args.key, args.quantity, args.expiry)
+            print(vending_machine.select_product(args.key))
+        elif args.command == "reload":
+            vending_machine.reload_currency(args.key, args.quantity)
+            print(f"Denomination counts: {dict(vending_machine.get_denomination_counts())}")
+        elif args.command == "search":
+            for product in vending_machine.search_products(args.query, in_stock_only=args.in_stock):
+                print(product)
+            return 0
+        elif args.json:
+            print(vending_machine.list_products_json())
+            return 0
+        else:
+            print(f"Balance: {vending_machine.balance}p")
+            print(f"Denomination counts: {dict(vending_machine.get_denomination_counts())}")
+            print(f"Stored money: {dict(vending_machine.get_stored_money())}")
+            for product_info in vending_machine.list_products():
+                print(product_info)
+            return 0
+    except (TypeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    save_state(vending_machine, args.state)
+    return 0
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    The main entry point for the Vending Machine application.
+
+    With command line arguments, runs a single subcommand against a state file (see `run_command`). Otherwise
+    runs the interactive menu (see `run_interactive`). Either can be profiled with `--profile cprofile|sampling`
+    (and `--profile-output PATH`) or the `VENDING_MACHINE_PROFILE` environment variable.
+
+    Args:
+        argv (list): The command line arguments. Defaults to `sys.argv[1:]`.
+
+    Returns:
+        int: The process exit code.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if os.environ.get(PROFILE_ENV) or any(argument.startswith("--profile") for argument in argv):
+        from src.vending_machine.profiling import Profiler, split_profile_options  # Only needed when profiling
+
+        try:
+            mode, output, argv = split_profile_options(argv)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        if mode is not None:
+            with Profiler(mode, output) as profiler:
+                return run_command(argv, profiler.timings) if argv else run_interactive(profiler.timings)
+    return run_command(argv) if argv else run_interactive()
+
+
+def run_interactive(timings=None) -> int:
+    """
+    Initialize the vending machine, load sample products, and manage the main application loop
+    where the user selects options from a menu.
+
+    Args:
+        timings (OperationTimings): Optional timings to record the menu and vending machine operations in.
+
+    Returns:
+        int: The process exit code.
+    """
+    print("\nWelcome to the Vending Machine!\n")
+    logger.info("Starting the Vending Machine application.")
+    vending_machine = VendingMachine()
+
     # Load sample products into the vending machine
-    vending_machine.add_products(sample_products)
+    vending_machine.add_products(create_sample_products())
     logger.info("Sample products loaded into the vending machine.")
     logger.info(vending_machine)
     display_products(vending_machine)
@@ -207,19 +364,23 @@ def main():
         '5': add_product,
         '6': reload_product,
         '7': reload_currency,
+        '8': reload_planogram,
     }
+    if timings is not None:
+        timings.instrument(vending_machine)
+        options = {choice: timings.wrap(f"menu.{function.__name__}", function) for choice, function in options.items()}
     while True:
         display_menu()
         choice = input("Please choose an option: ")
 
         if choice in options:
             options[choice](vending_machine)
-        elif choice == '8':
+        elif choice == '9':
             exit_program(vending_machine)
-            break
+            return 0
         else:
             logger.warning("Invalid choice entered. Please try again.")
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,348 @@
+import logging
+import math
+import threading
+from array import array
+from collections import deque
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING, NamedTuple
+
+from .events import CASH, ChangeDispensed, CoinInserted, OperationFailed, ProductPurchased, Subscription
+
+if TYPE_CHECKING:
+    from .machine import VendingMachine
+
+logger = logging.getLogger(__name__)
+
+# Alert kinds
+CHANGE_WITHOUT_PURCHASE = "change_without_purchase"  # High-value coins inserted and returned as change, no sale
+REPEATED_REFUNDS = "repeated_refunds"  # The same amount refunded without a sale again and again
+REFUND_RATE = "refund_rate"  # Refunds without a sale, whatever the amount, at an unusual rate
+COIN_BURST = "coin_burst"  # More coins than a coin mechanism can take in a short time, e.g. spoofed pulses
+REJECTED_COINS = "rejected_coins"  # Invalid coins at an unusual rate, e.g. slugs or a jammed validator being probed
+
+_PRIME = (1 << 61) - 1
+# Fixed (not per-process) hash parameters, so sketches of different processes agree
+_HASH_PARAMETERS = ((0x9E3779B97F4A7C15, 0x632BE59BD9B4E019), (0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9),
+                    (0x27D4EB2F165667C5, 0x85EBCA77C2B2AE63), (0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53),
+                    (0x94D049BB133111EB, 0xBF58476D1CE4E5B9), (0x2545F4914F6CDD1D, 0x9FB21C651E98DF25))
+
+
+class Alert(NamedTuple):
+    """A violated anomaly rule on a machine."""
+    machine_id: object
+    kind: str
+    detail: str
+    timestamp: float
+
+
+class CountMinSketch:
+    """
+    Approximate counts of integer keys in a fixed number of counters.
+
+    Every key is counted in one counter per row, chosen by a different hash; the estimate is the smallest of them,
+    which never undercounts and overcounts by at most `e / width` of the total with probability `1 - exp(-depth)`.
+    """
+
+    def __init__(self, width: int = 64, depth: int = 4):
+        """
+        Initialize an empty sketch.
+
+        Args:
+            width (int): The number of counters per row.
+            depth (int): The number of rows, at most 6.
+
+        Raises:
+            ValueError: If the width or depth is out of range.
+        """
+        if width <= 0 or not 0 < depth <= len(_HASH_PARAMETERS):
+            raise ValueError(f"Width must be positive and depth between 1 and {len(_HASH_PARAMETERS)}.")
+        self._width = width
+        self._hashes = _HASH_PARAMETERS[:depth]
+        self._counts = array("L", bytes(array("L").itemsize * width * depth))
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._counts.itemsize * len(self._counts)
+
+    def add(self, key: int, count: int = 1) -> int:
+        """
+        Count a key.
+
+        Args:
+            key (int): The key.
+            count (int): The number of occurrences to add.
+
+        Returns:
+            int: The new estimate of the key's count.
+        """
+        estimate = None
+        for row, (a, b) in enumerate(self._hashes):
+            index = row * self._width + (a * key + b) % _PRIME % self._width
+            self._counts[index] += count
+            if estimate is None or self._counts[index] < estimate:
+                estimate = self._counts[index]
+        return estimate
+
+    def estimate(self, key: int) -> int:
+        """
+        Estimate the count of a key.
+
+        Args:
+            key (int): The key.
+
+        Returns:
+            int: The estimate, never lower than the true count.
+        """
+        return min(self._counts[row * self._width + (a * key + b) % _PRIME % self._width]
+                   for row, (a, b) in enumerate(self._hashes))
+
+    def halve(self) -> None:
+        """Halve every counter, so old occurrences fade out."""
+        for i in range(len(self._counts)):
+            self._counts[i] >>= 1
+
+
+class DecayedRate:
+    """An exponentially decayed count of events, i.e. the recent rate per `horizon` seconds."""
+
+    __slots__ = ("_horizon", "_value", "_last")
+
+    def __init__(self, horizon: float):
+        """
+        Initialize a zero rate.
+
+        Args:
+            horizon (float): The time constant of the decay in seconds.
+        """
+        self._horizon = horizon
+        self._value = 0.0
+        self._last = None
+
+    def update(self, timestamp: float, count: float = 1.0) -> float:
+        """
+        Decay the rate to a time and add events.
+
+        Args:
+            timestamp (float): The time of the events.
+            count (float): The number of events.
+
+        Returns:
+            float: The new rate.
+        """
+        if self._last is not None and timestamp > self._last:
+            self._value *= math.exp((self._last - timestamp) / self._horizon)
+        if self._last is None or timestamp > self._last:
+            self._last = timestamp
+        self._value += count
+        return self._value
+
+
+class _MachineState:
+    """The constant-size detector state of one machine."""
+
+    __slots__ = ("session_coins", "session_high_value", "insert_times", "insert_head", "refunds",
+                 "refunds_since_halving", "refund_rate", "rejection_rate", "last_alerts")
+
+    def __init__(self, burst_coins: int, rate_horizon: float, sketch_width: int, sketch_depth: int):
+        self.session_coins = 0  # Coins inserted since the last sale or refund
+        self.session_high_value = 0  # High-value coins among them
+        self.insert_times = array("d", [-math.inf]) * burst_coins  # Ring of the last insert times
+        self.insert_head = 0
+        self.refunds = CountMinSketch(sketch_width, sketch_depth)  # Refunds without a sale, by amount
+        self.refunds_since_halving = 0
+        self.refund_rate = DecayedRate(rate_horizon)
+        self.rejection_rate = DecayedRate(rate_horizon)
+        self.last_alerts = {}  # Alert time by kind, for the cooldown
+
+
+class AnomalyDetector:
+    """
+    Streaming detection of cash fraud and coin mechanism abuse across a fleet of machines.
+
+    The detector follows the `CoinInserted`, `ProductPurchased`, `ChangeDispensed` and failed `insert_money`
+    events of every attached machine and keeps, per machine, a count-min sketch of the amounts refunded without a
+    sale, exponentially decayed rates of such refunds and of rejected coins, and a short ring of insert times.
+    Every event is processed in constant time and the state of a machine never grows, so the detector can follow
+    every machine of a fleet. A rule that is violated raises an `Alert`, at most once per `cooldown` seconds per
+    machine and kind.
+    """
+
+    def __init__(self, on_alert: Callable[[Alert], None] = None, high_value: int = 200,
+                 min_high_value_coins: int = 2, repeat_threshold: int = 3, max_refund_rate: float = 5.0,
+                 burst_coins: int = 8, burst_seconds: float = 2.0, max_rejection_rate: float = 5.0,
+                 rate_horizon: float = 600.0, cooldown: float = 60.0, sketch_width: int = 64, sketch_depth: int = 4,
+                 sketch_halving: int = 256, max_alerts: int = 1024):
+        """
+        Initialize the detector without any machine state.
+
+        Args:
+            on_alert (Callable): Called with every alert, from the thread delivering the events. The latest alerts are
+                                 also kept in `alerts`.
+            high_value (int): The smallest denomination counted as a high-value coin.
+            min_high_value_coins (int): The number of high-value coins returned as change without a sale that
+                                        raises a `CHANGE_WITHOUT_PURCHASE` alert.
+            repeat_threshold (int): The number of refunds of the same amount without a sale that raises a
+                                    `REPEATED_REFUNDS` alert.
+            max_refund_rate (float): The decayed rate of refunds without a sale above which a `REFUND_RATE` alert
+                                     is raised.
+            burst_coins (int): The number of coins, at least two, that raise a `COIN_BURST` alert when inserted within
+                               `burst_seconds`.
+            burst_seconds (float): The sliding window of the burst rule in seconds.
+            max_rejection_rate (float): The decayed rate of rejected coins above which a `REJECTED_COINS` alert is
+                                        raised.
+            rate_horizon (float): The time constant of the decayed rates in seconds.
+            cooldown (float): The minimum time between alerts of the same kind on a machine in seconds.
+            sketch_width (int): The number of counters per row of the refund sketches.
+            sketch_depth (int): The number of rows of the refund sketches.
+            sketch_halving (int): The number of refunds after which a sketch is halved, so old refunds fade out.
+            max_alerts (int): The maximum number of alerts kept; the oldest are dropped.
+
+        Raises:
+            ValueError: If a count or duration is not positive.
+        """
+        if min(min_high_value_coins, repeat_threshold, sketch_halving, max_alerts) <= 0 or burst_coins < 2 \
+                or min(burst_seconds, rate_horizon) <= 0:
+            raise ValueError("Thresholds, windows and limits must be positive, and a burst at least two coins.")
+        self._on_alert = on_alert
+        self._high_value = high_value
+        self._min_high_value_coins = min_high_value_coins
+        self._repeat_threshold = repeat_threshold
+        self._max_refund_rate = max_refund_rate
+        self._burst_coins = burst_coins
+        self._burst_seconds = burst_seconds
+        self._max_rejection_rate = max_rejection_rate
+        self._rate_horizon = rate_horizon
+        self._cooldown = cooldown
+        self._sketch_width = sketch_width
+        self._sketch_depth = sketch_depth
+        self._sketch_halving = sketch_halving
+        self._states = {}
+        self._alerts = deque(maxlen=max_alerts)
+        self._alerts_lock = threading.Lock()
+
+    @property
+    def alerts(self) -> list[Alert]:
+        with self._alerts_lock:
+            return list(self._alerts)
+
+    def attach(self, vending_machine: "VendingMachine", machine_id, capacity: int = 1024) -> Subscription:
+        """
+        Follow the events of a machine.
+
+        Args:
+            vending_machine (VendingMachine): The machine.
+            machine_id: The identifier of the machine in alerts.
+            capacity (int): The maximum number of events buffered for the detector.
+
+        Returns:
+            Subscription: The subscription, used to flush or unsubscribe.
+        """
+        return vending_machine.events.subscribe(lambda batch: self.observe_all(machine_id, batch), capacity)
+
+    def observe_all(self, machine_id, events: Iterable) -> None:
+        """
+        Process events of a machine in order.
+
+        Args:
+            machine_id: The identifier of the machine.
+            events (Iterable): The events, e.g. a batch received from an `EventBus` subscription.
+        """
+        for event in events:
+            self.observe(machine_id, event)
+
+    def observe(self, machine_id, event) -> None:
+        """
+        Process an event of a machine in constant time; events other than coin, sale and change events are ignored.
+
+        Args:
+            machine_id: The identifier of the machine.
+            event: The event.
+        """
+        state = self._states.get(machine_id)
+        if state is None:
+            state = self._states[machine_id] = _MachineState(self._burst_coins, self._rate_horizon,
+                                                             self._sketch_width, self._sketch_depth)
+        if isinstance(event, CoinInserted):
+            self._coin_inserted(machine_id, state, event)
+        elif isinstance(event, ProductPurchased) and event.payment == CASH:  # A card sale leaves the coins unspent
+            state.session_coins = state.session_high_value = 0
+        elif isinstance(event, ChangeDispensed):
+            self._change_dispensed(machine_id, state, event)
+        elif isinstance(event, OperationFailed) and event.operation == "insert_money":
+            rate = state.rejection_rate.update(event.timestamp)
+            if rate > self._max_rejection_rate:
+                self._alert(machine_id, state, REJECTED_COINS, f"{rate:.1f} rejected coins per "
+                                                               f"{self._rate_horizon:g}s", event.timestamp)
+
+    def _coin_inserted(self, machine_id, state: _MachineState, event: CoinInserted) -> None:
+        """
+        Count an inserted coin in the session and check the burst rule.
+
+        Args:
+            machine_id: The identifier of the machine.
+            state (_MachineState): The state of the machine.
+            event (CoinInserted): The event.
+        """
+        state.session_coins += 1
+        if event.denom >= self._high_value:
+            state.session_high_value += 1
+        state.insert_times[state.insert_head] = event.timestamp
+        state.insert_head = (state.insert_head + 1) % self._burst_coins
+        oldest = state.insert_times[state.insert_head]  # Of the last `burst_coins` insert times
+        if event.timestamp - oldest < self._burst_seconds:
+            self._alert(machine_id, state, COIN_BURST, f"{self._burst_coins} coins in "
+                                                       f"{event.timestamp - oldest:.2f}s", event.timestamp)
+
+    def _change_dispensed(self, machine_id, state: _MachineState, event: ChangeDispensed) -> None:
+        """
+        Check the refund rules when change is dispensed, and end the session.
+
+        Args:
+            machine_id: The identifier of the machine.
+            state (_MachineState): The state of the machine.
+            event (ChangeDispensed): The event.
+        """
+        coins, high_value = state.session_coins, state.session_high_value
+        state.session_coins = state.session_high_value = 0
+        if not coins or not event.amount:  # Change after a sale, or nothing inserted
+            return
+        if high_value >= self._min_high_value_coins:
+            self._alert(machine_id, state, CHANGE_WITHOUT_PURCHASE,
+                        f"{high_value} coins of {self._high_value}p or more returned as change", event.timestamp)
+        repeats = state.refunds.add(event.amount)
+        state.refunds_since_halving += 1
+        if state.refunds_since_halving == self._sketch_halving:
+            state.refunds.halve()
+            state.refunds_since_halving = 0
+        if repeats >= self._repeat_threshold:
+            self._alert(machine_id, state, REPEATED_REFUNDS, f"{event.amount}p refunded without a sale "
+                                                             f"{repeats} times", event.timestamp)
+        rate = state.refund_rate.update(event.timestamp)
+        if rate > self._max_refund_rate:
+            self._alert(machine_id, state, REFUND_RATE, f"{rate:.1f} refunds without a sale per "
+                                                        f"{self._rate_horizon:g}s", event.timestamp)
+
+    def _alert(self, machine_id, state: _MachineState, kind: str, detail: str, timestamp: float) -> None:
+        """
+        Raise an alert unless one of the same kind was raised on the machine within the cooldown.
+
+        Args:
+            machine_id: The identifier of the machine.
+            state (_MachineState): The state of the machine.
+            kind (str): The alert kind.
+            detail (str): A description of the violation.
+            timestamp (float): The time of the event violating the rule.
+        """
+        last = state.last_alerts.get(kind)
+        if last is not None and timestamp - last < self._cooldown:
+            return
+        state.last_alerts[kind] = timestamp
+        alert = Alert(machine_id, kind, detail, timestamp)
+        with self._alerts_lock:
+            self._alerts.append(alert)
+        logger.warning("Anomaly on machine %s: %s (%s).", machine_id, kind, detail)
+        if self._on_alert is not None:
+            try:
+                self._on_alert(alert)
+            except Exception:
+                logger.exception("Alert handler %r failed.", self._on_alert)
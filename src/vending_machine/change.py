@@ -0,0 +1,104 @@
+from collections.abc import Iterator, Mapping
+
+DENOMINATIONS = (200, 100, 50, 20, 10, 5, 2, 1)  # In pence, descending; also `Currency.DENOMINATIONS`
+_INDEX = {denom: index for index, denom in enumerate(DENOMINATIONS)}
+
+
+class ChangeVector:
+    """
+    Coin counts for every denomination, e.g. the change paid out to a customer.
+
+    The counts are a fixed-width tuple aligned with `DENOMINATIONS` and the total value is computed once, so change
+    can be added, subtracted, compared and summed without building intermediate dictionaries.
+    """
+    __slots__ = ("_counts", "_total")
+
+    def __init__(self, counts: tuple = (0,) * len(DENOMINATIONS), total: int = None):
+        """
+        Initialize the vector.
+
+        Args:
+            counts (tuple): The non-negative coin count of every denomination, in `DENOMINATIONS` order.
+            total (int): The total value of the counts in pence, if the caller already knows it.
+
+        Raises:
+            ValueError: If the number of counts does not match the denominations or a count is negative.
+        """
+        counts = tuple(counts)
+        if len(counts) != len(DENOMINATIONS):
+            raise ValueError(f"Expected {len(DENOMINATIONS)} counts, got {len(counts)}.")
+        if min(counts) < 0:
+            raise ValueError("Coin counts must be non-negative.")
+        self._counts = counts
+        self._total = sum(map(int.__mul__, DENOMINATIONS, counts)) if total is None else total
+
+    @classmethod
+    def from_mapping(cls, counts: Mapping) -> "ChangeVector":
+        """
+        Create a vector from a mapping of denominations to counts.
+
+        Args:
+            counts (Mapping): Denominations as keys and counts as values; missing denominations count zero.
+
+        Returns:
+            ChangeVector: The vector.
+
+        Raises:
+            ValueError: If a denomination is invalid or a count is negative.
+        """
+        for denom in counts:
+            if denom not in _INDEX:
+                raise ValueError(f"{denom} is not a valid denomination.")
+        return cls(tuple(counts.get(denom, 0) for denom in DENOMINATIONS))
+
+    @property
+    def counts(self) -> tuple:
+        return self._counts
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def items(self) -> Iterator[tuple[int, int]]:
+        """
+        Iterate over the denominations with a non-zero count.
+
+        Returns:
+            Iterator: (denomination, count) pairs, largest denomination first.
+        """
+        return ((denom, count) for denom, count in zip(DENOMINATIONS, self._counts) if count)
+
+    def to_dict(self) -> dict[int, int]:
+        """
+        Return the non-zero counts as a dictionary, e.g. for display or JSON.
+
+        Returns:
+            dict: Denominations as keys and counts as values.
+        """
+        return dict(self.items())
+
+    def __getitem__(self, denom: int) -> int:
+        return self._counts[_INDEX[denom]]
+
+    def __add__(self, other: "ChangeVector") -> "ChangeVector":
+        return ChangeVector(tuple(a + b for a, b in zip(self._counts, other._counts)))
+
+    def __sub__(self, other: "ChangeVector") -> "ChangeVector":
+        return ChangeVector(tuple(a - b for a, b in zip(self._counts, other._counts)))
+
+    def __bool__(self) -> bool:
+        return self._total > 0
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ChangeVector):
+            return NotImplemented
+        return self._counts == other._counts
+
+    def __hash__(self) -> int:
+        return hash(self._counts)
+
+    def __repr__(self) -> str:
+        return f"ChangeVector({self.to_dict()}, total={self._total})"
+
+
+NO_CHANGE = ChangeVector()
@@ -1,9 +1,15 @@
+from types import MappingProxyType
+
+from .change import DENOMINATIONS, NO_CHANGE, ChangeVector
+from .snapshot import VersionConflict
+
+
 class Currency:
     """A class to represent currency and manage denominations."""
 
     # Define available denominations in pence (for simplicity)
     # Denominations are sorted in descending order for easier change calculation
-    DENOMINATIONS = (200, 100, 50, 20, 10, 5, 2, 1)
+    DENOMINATIONS = DENOMINATIONS
     INITIAL_DENOMINATION_COUNT = 10
     MAX_DENOMINATION_COUNT = 20
 
@@ -11,14 +17,56 @@ class Currency:
         """Initialize the Currency with default denomination counts."""
         self._denomination_counts = {denom: Currency.INITIAL_DENOMINATION_COUNT for denom in Currency.DENOMINATIONS}
         self._inserted_money = {}  # Stores the money inserted by the user
+        self._total = sum(denom * count for denom, count in self._denomination_counts.items())  # Value of the tubes
+        self._version = 0  # Incremented whenever the counts change
+        self._tube_versions = dict.fromkeys(Currency.DENOMINATIONS, 0)  # Incremented when that tube's count changes
+        self._tube_versions_view = None
+        self._rendered = None  # Cached string representation
+        self._counts_view = None  # Cached read-only view of the denomination counts
+        self._inserted_view = None  # Cached read-only view of the inserted money
+
+    @property
+    def denomination_counts(self) -> MappingProxyType:
+        # Read-only view of the counts at the current version, copied only once per change
+        if self._counts_view is None:
+            self._counts_view = MappingProxyType(self._denomination_counts.copy())
+        return self._counts_view
 
     @property
-    def denomination_counts(self) -> dict:
-        return self._denomination_counts.copy()  # Return a copy to prevent direct modification
+    def inserted_money(self) -> MappingProxyType:
+        # Read-only view of the inserted money at the current version, copied only once per change
+        if self._inserted_view is None:
+            self._inserted_view = MappingProxyType(self._inserted_money.copy())
+        return self._inserted_view
 
     @property
-    def inserted_money(self) -> dict:
-        return self._inserted_money.copy()  # Return a copy to prevent direct modification
+    def tube_versions(self) -> MappingProxyType:
+        if self._tube_versions_view is None:
+            self._tube_versions_view = MappingProxyType(self._tube_versions.copy())
+        return self._tube_versions_view
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def ensure_tube_version(self, denom: int, expected: int) -> None:
+        """
+        Ensure the count of a denomination has not changed since the caller read its version.
+
+        The check is only meaningful if nothing can change the tube before the caller's mutation, so
+        `VendingMachine` makes both while holding its lock.
+
+        Args:
+            denom (int): The denomination.
+            expected (int): The version the caller read.
+
+        Raises:
+            ValueError: If the denomination is invalid.
+            VersionConflict: If the tube is at a different version.
+        """
+        self.ensure_valid_denomination(denom)
+        if expected != self._tube_versions[denom]:
+            raise VersionConflict(f"denomination {denom}", expected, self._tube_versions[denom])
 
     def insert_to_storage(self, denom: int) -> None:
         """
@@ -32,6 +80,8 @@ class Currency:
         """
         self.ensure_valid_denomination(denom)
         self._inserted_money[denom] = self._inserted_money.get(denom, 0) + 1
+        self._inserted_view = None
+        self._touch()
 
     def is_valid_denomination(self, denom: int) -> bool:
         """
@@ -58,7 +108,7 @@ class Currency:
         if not self.is_valid_denomination(denom):
             raise ValueError(f"{denom} is not a valid denomination.")
 
-    def calculate_change(self, balance: int) -> dict[int, int]:
+    def calculate_change(self, balance: int) -> ChangeVector:
         """
         Calculate the change to return based on the balance.
 
@@ -66,24 +116,70 @@ class Currency:
             balance (int): The amount for which change is to be calculated.
 
         Returns:
-            dict: A dictionary with denominations as keys and their counts as values.
+            ChangeVector: The number of coins of each denomination to return.
 
         Raises:
             ValueError: If there are insufficient funds or if exact change cannot be returned.
         """
         if self.calculate_denominations_total() < balance:  # Should never occur if denom counts are updated when money is inserted (not implemented yet)
             raise ValueError("Insufficient change funds. Please reload currency denominations.")
-        change = {}
-        for denom in Currency.DENOMINATIONS:
-            if balance <= 0:
-                break
+        if balance <= 0:
+            return NO_CHANGE
+        total = balance
+        counts = [0] * len(Currency.DENOMINATIONS)
+        for index, denom in enumerate(Currency.DENOMINATIONS):
             count = min(balance // denom, self._denomination_counts[denom])
-            if count > 0:
-                balance -= denom * count
-                change[denom] = -count
+            balance -= denom * count
+            counts[index] = count
         if balance > 0:
             raise ValueError("Unable to return exact change. Please reload currency denominations.")
-        return change
+        return ChangeVector(tuple(counts), total)
+
+    def dispense(self, change: ChangeVector) -> None:
+        """
+        Take change out of the tubes.
+
+        Args:
+            change (ChangeVector): The coins to take, e.g. as calculated by `calculate_change`.
+
+        Raises:
+            ValueError: If a tube holds fewer coins than requested.
+        """
+        counts = change.counts
+        for index, denom in enumerate(Currency.DENOMINATIONS):
+            if counts[index] > self._denomination_counts[denom]:
+                raise ValueError(f"Cannot update {denom}: resulting count would be negative.")
+        for index, denom in enumerate(Currency.DENOMINATIONS):
+            if counts[index]:
+                self._denomination_counts[denom] -= counts[index]
+                self._tube_versions[denom] += 1
+        self._total -= change.total
+        self._counts_view = None
+        self._tube_versions_view = None
+        self._touch()
+
+    def restore(self, change: ChangeVector) -> None:
+        """
+        Put change back into the tubes, e.g. when it could not be paid out.
+
+        Args:
+            change (ChangeVector): The coins to put back, as taken by `dispense`.
+
+        Raises:
+            ValueError: If a tube would exceed the maximum allowed count.
+        """
+        counts = change.counts
+        for index, denom in enumerate(Currency.DENOMINATIONS):
+            if self._denomination_counts[denom] + counts[index] > Currency.MAX_DENOMINATION_COUNT:
+                raise ValueError(f"Cannot update {denom}: exceeds maximum allowed count.")
+        for index, denom in enumerate(Currency.DENOMINATIONS):
+            if counts[index]:
+                self._denomination_counts[denom] += counts[index]
+                self._tube_versions[denom] += 1
+        self._total += change.total
+        self._counts_view = None
+        self._tube_versions_view = None
+        self._touch()
 
     def update_denomination_counts(self, updates: dict[int, int]) -> None:
         """
@@ -102,6 +198,11 @@ class Currency:
 
         for denom, count_update in updates.items():
             self._denomination_counts[denom] += count_update
+            self._total += denom * count_update
+            self._tube_versions[denom] += 1
+        self._counts_view = None
+        self._tube_versions_view = None
+        self._touch()
 
     def update_denomination_count(self, denom: int, count_update: int) -> None:
         """
@@ -117,6 +218,11 @@ class Currency:
         """
         self._validate_denomination_count_update(denom, count_update)
         self._denomination_counts[denom] += count_update
+        self._total += denom * count_update
+        self._tube_versions[denom] += 1
+        self._counts_view = None
+        self._tube_versions_view = None
+        self._touch()
 
     def _validate_denomination_count_update(self, denom: int, count_update: int) -> None:
         """
@@ -140,16 +246,58 @@ class Currency:
         if new_count > Currency.MAX_DENOMINATION_COUNT:
             raise ValueError(f"Cannot update {denom}: exceeds maximum allowed count.")
 
+    def load_counts(self, denomination_counts: dict[int, int], inserted_money: dict[int, int],
+                    tube_versions: dict[int, int] = None) -> None:
+        """
+        Replace the denomination counts and the stored money, e.g. when restoring persisted state.
+
+        Args:
+            denomination_counts (dict): Denominations as keys and their counts as values.
+            inserted_money (dict): Denominations as keys and the counts of inserted money as values.
+            tube_versions (dict): The persisted versions of the tubes. If omitted, the version of every loaded
+                                  tube is incremented instead.
+
+        Raises:
+            ValueError: If a denomination is invalid or a count is out of range.
+        """
+        for denom, count in denomination_counts.items():
+            self.ensure_valid_denomination(denom)
+            if not 0 <= count <= Currency.MAX_DENOMINATION_COUNT:
+                raise ValueError(f"Cannot load {denom}: count {count} is out of range.")
+        for denom in inserted_money:
+            self.ensure_valid_denomination(denom)
+        for denom in tube_versions or ():
+            self.ensure_valid_denomination(denom)
+        self._denomination_counts.update(denomination_counts)
+        if tube_versions:
+            self._tube_versions.update(tube_versions)
+        else:
+            for denom in denomination_counts:
+                self._tube_versions[denom] += 1
+        self._total = sum(denom * count for denom, count in self._denomination_counts.items())
+        self._inserted_money = dict(inserted_money)
+        self._counts_view = None
+        self._tube_versions_view = None
+        self._inserted_view = None
+        self._touch()
+
     def calculate_denominations_total(self) -> int:
         """
-        Calculate the total value of the denominations.
+        Calculate the total value of the denominations, kept up to date by every count update.
 
         Returns:
             int: The total value of all denominations.
         """
-        return sum(denom * count for denom, count in self._denomination_counts.items())
+        return self._total
+
+    def _touch(self) -> None:
+        """Record a change to the counts and drop the cached string representation."""
+        self._version += 1
+        self._rendered = None
 
     def __str__(self):
-        return (f"Denomination counts: {self._denomination_counts}, "
-                f"Max denomination count: {Currency.MAX_DENOMINATION_COUNT}, "
-                f"Stored money: {self._inserted_money}")
+        if self._rendered is None:
+            self._rendered = (f"Denomination counts: {self._denomination_counts}, "
+                              f"Max denomination count: {Currency.MAX_DENOMINATION_COUNT}, "
+                              f"Stored money: {self._inserted_money}")
+        return self._rendered
@@ -0,0 +1,397 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, NamedTuple
+
+from .change import ChangeVector
+
+if TYPE_CHECKING:  # asyncio is slow to import and only needed by asynchronous subscribers
+    import asyncio
+
+logger = logging.getLogger(__name__)
+
+# Policies applied when a subscriber's buffer is full
+DROP_OLDEST = "drop_oldest"  # Overwrite the oldest buffered event (ring buffer)
+DROP_NEWEST = "drop_newest"  # Discard the event being published
+BLOCK = "block"  # Make the publisher wait for space
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+# Payment methods of a purchase
+CASH = "cash"  # Paid from the inserted balance
+CASHLESS = "cashless"  # Paid by card or mobile wallet
+
+
+class ProductAdded(NamedTuple):
+    """A product was added to the inventory."""
+    product_id: int
+    name: str
+    price: int
+    quantity: int
+    timestamp: float
+
+
+class CoinInserted(NamedTuple):
+    """A coin was inserted and credited to the balance."""
+    denom: int
+    balance: int
+    timestamp: float
+
+
+class ProductPurchased(NamedTuple):
+    """A product was purchased."""
+    product_id: int
+    price: int
+    balance: int
+    timestamp: float
+    payment: str = CASH  # `CASH` or `CASHLESS`; a cashless sale leaves the balance and the coins untouched
+
+
+class ChangeDispensed(NamedTuple):
+    """Change was dispensed, as returned by `dispense_change`."""
+    change: ChangeVector
+    amount: int
+    timestamp: float
+
+
+class PurchaseRefunded(NamedTuple):
+    """A cash purchase was undone because the product could not be vended; its price was credited back."""
+    product_id: int
+    price: int
+    balance: int
+    timestamp: float
+
+
+class ChangeRestored(NamedTuple):
+    """Change the hopper failed to pay out was returned to the tubes and credited back to the balance."""
+    change: ChangeVector
+    amount: int
+    timestamp: float
+
+
+class ProductReloaded(NamedTuple):
+    """A product was reloaded."""
+    product_id: int
+    quantity: int
+    stock: int
+    timestamp: float
+
+
+class CurrencyReloaded(NamedTuple):
+    """One or more denominations were reloaded."""
+    counts: dict
+    timestamp: float
+
+
+class PlanogramLoaded(NamedTuple):
+    """A new planogram was swapped in."""
+    product_ids: tuple
+    accepted_denominations: tuple
+    timestamp: float
+
+
+class OperationFailed(NamedTuple):
+    """A vending machine operation was rejected."""
+    operation: str
+    error: str
+    timestamp: float
+
+
+class Subscription:
+    """A subscriber's bounded buffer of events, delivered in batches (oldest first) by a worker thread."""
+
+    def __init__(self, handler, capacity: int, policy: str, batch_size: int):
+        """
+        Initialize the subscription.
+
+        Args:
+            handler: The callable receiving lists of events.
+            capacity (int): The maximum number of buffered events.
+            policy (str): What to do when the buffer is full: `DROP_OLDEST`, `DROP_NEWEST` or `BLOCK`.
+            batch_size (int): The maximum number of events delivered per handler call.
+
+        Raises:
+            ValueError: If the capacity, policy or batch size is invalid.
+        """
+        if capacity <= 0 or batch_size <= 0:
+            raise ValueError("Capacity and batch size must be positive integers.")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}. Expected one of {POLICIES}.")
+        self._handler = handler
+        self._capacity = capacity
+        self._policy = policy
+        self._batch_size = batch_size
+        self._buffer = deque(maxlen=capacity if policy == DROP_OLDEST else None)
+        self._condition = threading.Condition()
+        self._delivering = False
+        self._closed = False
+        self.dropped = 0
+
+    def offer(self, event) -> None:
+        """
+        Buffer an event for delivery, applying the overflow policy if the buffer is full. Events offered once the
+        subscription is closed are discarded.
+
+        Args:
+            event: The event to buffer.
+        """
+        with self._condition:
+            if self._closed:  # Unsubscribed; nothing would deliver the event
+                return
+            if len(self._buffer) >= self._capacity:
+                if self._policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self._policy == DROP_OLDEST:
+                    self.dropped += 1  # The deque discards the oldest event itself
+                else:
+                    self._condition.wait_for(lambda: len(self._buffer) < self._capacity or self._closed)
+                    if self._closed:
+                        return
+            self._buffer.append(event)
+            if len(self._buffer) == 1:  # Only wake the worker when the buffer was empty
+                self._wake()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until all buffered events have been delivered.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the buffer was drained, False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not (self._buffer or self._delivering), timeout)
+
+    def start(self) -> None:
+        """Start delivering events."""
+        threading.Thread(target=self._deliver_loop, daemon=True).start()
+
+    def close(self) -> None:
+        """Stop delivering events once the buffer is drained and release blocked publishers."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._wake()
+
+    def _wake(self) -> None:
+        """Wake the worker. Must be called with the condition held."""
+        self._condition.notify_all()
+
+    def _take_batch(self) -> list:
+        """
+        Take up to `batch_size` events from the buffer. Must be called with the condition held.
+
+        Returns:
+            list: The events taken.
+        """
+        batch = [self._buffer.popleft() for _ in range(min(self._batch_size, len(self._buffer)))]
+        self._delivering = bool(batch)
+        self._condition.notify_all()  # Space was freed for blocked publishers
+        return batch
+
+    def _delivered(self) -> None:
+        """Mark the current batch as delivered."""
+        with self._condition:
+            self._delivering = False
+            self._condition.notify_all()
+
+    def _deliver_loop(self) -> None:
+        """Deliver batches to the handler until closed."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._buffer or self._closed)
+                if not self._buffer:
+                    return
+                batch = self._take_batch()
+            try:
+                self._handler(batch)
+            except Exception:
+                logger.exception("Event subscriber %r failed.", self._handler)
+            self._delivered()
+
+
+class AsyncSubscription(Subscription):
+    """A subscription whose coroutine handler receives batches on an asyncio event loop."""
+
+    def __init__(self, handler, capacity: int, policy: str, batch_size: int, loop: "asyncio.AbstractEventLoop"):
+        """
+        Initialize the subscription.
+
+        Args:
+            handler: The coroutine function receiving lists of events.
+            capacity (int): The maximum number of buffered events.
+            policy (str): What to do when the buffer is full: `DROP_OLDEST` or `DROP_NEWEST`.
+            batch_size (int): The maximum number of events delivered per handler call.
+            loop (asyncio.AbstractEventLoop): The event loop running the handler.
+
+        Raises:
+            ValueError: If the policy is `BLOCK`, which could deadlock the event loop, or otherwise invalid.
+        """
+        if policy == BLOCK:
+            raise ValueError("Asynchronous subscribers cannot use the block policy.")
+        super().__init__(handler, capacity, policy, batch_size)
+        self._loop = loop
+        self._ready = None
+
+    def start(self) -> None:
+        self._loop.call_soon_threadsafe(self._start_task)
+
+    def _start_task(self) -> None:
+        import asyncio
+
+        with self._condition:  # Events offered before the task existed must still wake it
+            self._ready = asyncio.Event()
+            if self._buffer or self._closed:
+                self._ready.set()
+        self._loop.create_task(self._deliver_task())
+
+    def _wake(self) -> None:
+        if self._ready is not None:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def _deliver_task(self) -> None:
+        """Deliver batches to the handler until closed."""
+        while True:
+            await self._ready.wait()
+            with self._condition:
+                self._ready.clear()
+                if not self._buffer:
+                    if self._closed:
+                        return
+                    continue
+                batch = self._take_batch()
+                if self._buffer:
+                    self._ready.set()  # More batches are waiting
+            try:
+                await self._handler(batch)
+            except Exception:
+                logger.exception("Event subscriber %r failed.", self._handler)
+            self._delivered()
+
+
+class EventBus:
+    """
+    In-process fan-out of vending machine events to subscribers.
+
+    Publishing only appends the event to each subscriber's bounded buffer; handlers run on their own worker
+    thread (or asyncio task) and receive events in batches, so slow subscribers never run on the publisher's
+    path. When nobody is subscribed, `active` is False and the vending machine does not create events at all.
+    """
+
+    def __init__(self):
+        """Initialize the bus without subscribers."""
+        self._subscriptions = ()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscriptions)
+
+    def subscribe(self, handler, capacity: int = 1024, policy: str = DROP_OLDEST,
+                  batch_size: int = 64) -> Subscription:
+        """
+        Subscribe a callable, run on a dedicated worker thread.
+
+        Args:
+            handler: The callable receiving lists of events.
+            capacity (int): The maximum number of buffered events.
+            policy (str): What to do when the buffer is full: `DROP_OLDEST`, `DROP_NEWEST` or `BLOCK`.
+            batch_size (int): The maximum number of events delivered per handler call.
+
+        Returns:
+            Subscription: The subscription, used to flush or unsubscribe.
+        """
+        return self._add(Subscription(handler, capacity, policy, batch_size))
+
+    def subscribe_async(self, handler, loop: "asyncio.AbstractEventLoop" = None, capacity: int = 1024,
+                        policy: str = DROP_OLDEST, batch_size: int = 64) -> Subscription:
+        """
+        Subscribe a coroutine function, run on an asyncio event loop.
+
+        Args:
+            handler: The coroutine function receiving lists of events.
+            loop (asyncio.AbstractEventLoop): The event loop to run the handler on. Defaults to the running loop.
+            capacity (int): The maximum number of buffered events.
+            policy (str): What to do when the buffer is full: `DROP_OLDEST` or `DROP_NEWEST`.
+            batch_size (int): The maximum number of events delivered per handler call.
+
+        Returns:
+            Subscription: The subscription, used to flush or unsubscribe.
+        """
+        if loop is None:
+            import asyncio
+
+            loop = asyncio.get_running_loop()
+        return self._add(AsyncSubscription(handler, capacity, policy, batch_size, loop))
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Remove a subscription. Events already buffered are still delivered.
+
+        Args:
+            subscription (Subscription): The subscription to remove.
+        """
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        subscription.close()
+
+    def publish(self, event) -> None:
+        """
+        Publish an event to all subscribers.
+
+        Args:
+            event: The event to publish.
+        """
+        for subscription in self._subscriptions:
+            subscription.offer(event)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every subscriber has received all published events.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds, per subscriber.
+
+        Returns:
+            bool: True if all buffers were drained, False on timeout.
+        """
+        return all([subscription.flush(timeout) for subscription in self._subscriptions])
+
+    def close(self) -> None:
+        """Remove all subscriptions."""
+        for subscription in self._subscriptions:
+            self.unsubscribe(subscription)
+
+    def _add(self, subscription: Subscription) -> Subscription:
+        subscription.start()
+        with self._lock:
+            # Copy-on-write so publishing never needs the lock
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+
+def publishes_failures(method):
+    """
+    Decorate a `VendingMachine` method to publish an `OperationFailed` event when it raises any error, e.g. a
+    `VersionConflict`, a `PaymentDeclined` or a gateway or storage failure.
+
+    Args:
+        method: The method to decorate.
+
+    Returns:
+        The decorated method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except Exception as e:
+            if self._events.active:
+                with self._locked():
+                    self._pending_events.append(OperationFailed(method.__name__, str(e), time.time()))
+            raise
+    return wrapper
@@ -0,0 +1,352 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+
+from .change import ChangeVector
+from .inventory import SoldUnit
+from .machine import VendingMachine
+
+logger = logging.getLogger(__name__)
+
+
+class PartialPayout(Exception):
+    """Paying out change failed after part of it had already been paid out."""
+
+    def __init__(self, paid: ChangeVector):
+        """
+        Initialize the error.
+
+        Args:
+            paid (ChangeVector): The coins that were paid out before the failure.
+        """
+        super().__init__(f"Only {paid.total}p of change was paid out: {paid.to_dict()}.")
+        self.paid = paid
+
+
+class CoinValidator(ABC):
+    """Interface for the coin validator that measures inserted coins."""
+
+    @abstractmethod
+    async def validate(self, denom: int) -> int:
+        """
+        Measure an inserted coin.
+
+        Args:
+            denom (int): The denomination the coin claims to be, in pence.
+
+        Returns:
+            int: The denomination recognised by the validator.
+
+        Raises:
+            ValueError: If the coin is rejected.
+        """
+
+
+class SpiralMotor(ABC):
+    """Interface for the spiral motors that push products out of their slots."""
+
+    @abstractmethod
+    async def vend(self, product_id: int) -> None:
+        """
+        Turn the spiral holding the specified product.
+
+        The motor must raise only if the product was not vended, as it is then refunded.
+
+        Args:
+            product_id (int): The ID of the product to vend.
+        """
+
+
+class CoinHopper(ABC):
+    """Interface for the hopper that pays coins out of the change tubes."""
+
+    @abstractmethod
+    async def payout(self, change: ChangeVector) -> None:
+        """
+        Pay out the specified change.
+
+        The hopper must raise only if no coin was paid out, as the whole change is then credited back.
+
+        Args:
+            change (ChangeVector): The coins to pay out, as returned by `VendingMachine.dispense_change`.
+        """
+
+
+class Display(ABC):
+    """Interface for the customer-facing display."""
+
+    @abstractmethod
+    async def show(self, message: str) -> None:
+        """
+        Show a message on the display.
+
+        Args:
+            message (str): The message to show.
+        """
+
+
+class _SimulatedDevice:
+    """Base class for simulated devices that take a fixed time per operation."""
+
+    def __init__(self, delay: float):
+        """
+        Initialize the simulated device.
+
+        Args:
+            delay (float): The time in seconds each operation takes.
+        """
+        self.delay = delay
+        self.history = []  # (start, end) loop times of every completed operation
+
+    async def _operate(self) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.sleep(self.delay)
+        self.history.append((start, loop.time()))
+
+
+class SimulatedCoinValidator(_SimulatedDevice, CoinValidator):
+    """Coin validator simulation that accepts every coin unless told to reject it."""
+
+    def __init__(self, delay: float = 0.3, rejected: frozenset = frozenset()):
+        """
+        Initialize the simulated validator.
+
+        Args:
+            delay (float): The time in seconds it takes to measure a coin.
+            rejected (frozenset): Denominations the validator rejects (e.g. to simulate foreign coins).
+        """
+        super().__init__(delay)
+        self.rejected = rejected
+
+    async def validate(self, denom: int) -> int:
+        await self._operate()
+        if denom in self.rejected:
+            raise ValueError(f"Coin {denom}p rejected by the validator.")
+        return denom
+
+
+class SimulatedSpiralMotor(_SimulatedDevice, SpiralMotor):
+    """Spiral motor simulation."""
+
+    def __init__(self, delay: float = 0.8):
+        """
+        Initialize the simulated spiral motor.
+
+        Args:
+            delay (float): The time in seconds it takes to vend a product.
+        """
+        super().__init__(delay)
+        self.vended = []  # Product IDs in the order they were vended
+
+    async def vend(self, product_id: int) -> None:
+        await self._operate()
+        self.vended.append(product_id)
+
+
+class SimulatedCoinHopper(_SimulatedDevice, CoinHopper):
+    """Coin hopper simulation."""
+
+    def __init__(self, delay: float = 0.5):
+        """
+        Initialize the simulated coin hopper.
+
+        Args:
+            delay (float): The time in seconds it takes to pay out change.
+        """
+        super().__init__(delay)
+        self.paid_out = []  # Change vectors in the order they were paid out
+
+    async def payout(self, change: ChangeVector) -> None:
+        if not change:
+            return
+        await self._operate()
+        self.paid_out.append(change)
+
+
+class SimulatedDisplay(_SimulatedDevice, Display):
+    """Display simulation."""
+
+    def __init__(self, delay: float = 0.1):
+        """
+        Initialize the simulated display.
+
+        Args:
+            delay (float): The time in seconds it takes to update the display.
+        """
+        super().__init__(delay)
+        self.messages = []  # Messages in the order they were shown
+
+    async def show(self, message: str) -> None:
+        await self._operate()
+        self.messages.append(message)
+
+
+class AsyncVendingMachine:
+    """
+    Drives the vending machine hardware asynchronously around a `VendingMachine`.
+
+    The wrapped machine remains the single source of truth for balance, stock and currency; its state is
+    updated before any device is started, so a failed operation never moves hardware. Slow device work is
+    pipelined: display updates run in the background while the next coin is validated, and the spiral
+    vend runs while the customer decides what to do next, overlapping with the change payout. If the motor
+    fails, the product is returned to the slot and lot it was sold from and its price credited back to the balance;
+    if the hopper fails, the change is returned to the tubes and credited back, so the customer's money is never
+    lost.
+    """
+
+    def __init__(self,
+                 machine: VendingMachine = None,
+                 validator: CoinValidator = None,
+                 motor: SpiralMotor = None,
+                 hopper: CoinHopper = None,
+                 display: Display = None):
+        """
+        Initialize the asynchronous vending machine.
+
+        Args:
+            machine (VendingMachine): The machine holding the state. A new one is created if omitted.
+            validator (CoinValidator): The coin validator driver. Defaults to a simulated one.
+            motor (SpiralMotor): The spiral motor driver. Defaults to a simulated one.
+            hopper (CoinHopper): The coin hopper driver. Defaults to a simulated one.
+            display (Display): The display driver. Defaults to a simulated one.
+        """
+        self._machine = machine if machine is not None else VendingMachine()
+        self._validator = validator if validator is not None else SimulatedCoinValidator()
+        self._motor = motor if motor is not None else SimulatedSpiralMotor()
+        self._hopper = hopper if hopper is not None else SimulatedCoinHopper()
+        self._display = display if display is not None else SimulatedDisplay()
+        self._vends = []  # Vend tasks not yet awaited
+        self._background = set()  # Display tasks still running
+
+    @property
+    def machine(self) -> VendingMachine:
+        return self._machine
+
+    @property
+    def balance(self) -> int:
+        return self._machine.balance
+
+    async def insert_money(self, denom: int) -> None:
+        """
+        Validate an inserted coin and credit it to the balance.
+
+        The display update is not awaited, so the next coin can be validated while it is still running.
+
+        Args:
+            denom (int): The denomination inserted by the user, in pence.
+
+        Raises:
+            ValueError: If the coin is rejected or the denomination is invalid.
+        """
+        denom = await self._validator.validate(denom)
+        self._machine.insert_money(denom)
+        self._update_display(f"Balance: {self._machine.balance}p")
+
+    async def purchase_product(self, product_id: int) -> None:
+        """
+        Purchase a product and start vending it.
+
+        The spiral vend runs in the background and is awaited by `dispense_change` or `drain`. A failed vend is
+        logged and refunded to the balance.
+
+        Args:
+            product_id (int): The ID of the product to purchase.
+
+        Raises:
+            ValueError: If the product is unavailable or the balance is insufficient.
+        """
+        price = self._machine.select_product(product_id).price
+        unit = self._machine.purchase_product(product_id)
+        self._vends.append(asyncio.create_task(self._vend(product_id, price, unit)))
+        self._update_display(f"Vending product {product_id}. Balance: {self._machine.balance}p")
+
+    async def dispense_change(self) -> ChangeVector:
+        """
+        Dispense change, paying it out while any pending vends complete.
+
+        Prices refunded by vends failing meanwhile are paid out as well.
+
+        Returns:
+            ChangeVector: The number of coins of each denomination given.
+
+        Raises:
+            ValueError: If exact change cannot be provided.
+            PartialPayout: If the hopper failed paying out refunded prices after the change was paid out; the
+                           refunds have been credited back to the balance.
+            Exception: Any error raised by the hopper, after the change has been credited back to the balance.
+        """
+        change = self._machine.dispense_change()
+        vends, self._vends = self._vends, []
+        payout, *_ = await asyncio.gather(self._payout(change), *vends, return_exceptions=True)
+        if isinstance(payout, BaseException):
+            raise payout
+        if self._machine.balance:
+            try:
+                change += await self._payout(self._machine.dispense_change())
+            except Exception as e:
+                logger.error("Paying out refunds failed after %dp of change was paid out: %s.", change.total,
+                             change.to_dict())
+                raise PartialPayout(change) from e
+        self._update_display("Thank you!")
+        return change
+
+    async def drain(self) -> None:
+        """Wait for all pending vends and display updates to complete; their failures have already been logged."""
+        vends, self._vends = self._vends, []
+        await asyncio.gather(*vends, *self._background, return_exceptions=True)
+
+    async def _vend(self, product_id: int, price: int, unit: SoldUnit) -> None:
+        """
+        Vend a purchased product, refunding it and returning it to its slot and lot if the motor fails.
+
+        Args:
+            product_id (int): The ID of the product.
+            price (int): The price paid, in pence.
+            unit (SoldUnit): Where the unit was taken from, as returned by `VendingMachine.purchase_product`.
+        """
+        try:
+            await self._motor.vend(product_id)
+        except Exception:
+            logger.exception("Vending product %s failed; refunding %dp.", product_id, price)
+            self._machine.refund_purchase(product_id, price, unit)
+
+    async def _payout(self, change: ChangeVector) -> ChangeVector:
+        """
+        Pay out change, crediting it back to the balance if the hopper fails.
+
+        Args:
+            change (ChangeVector): The change, as returned by `VendingMachine.dispense_change`.
+
+        Returns:
+            ChangeVector: The change paid out.
+        """
+        try:
+            await self._hopper.payout(change)
+        except Exception:
+            self._machine.restore_change(change)
+            self._update_display(f"Unable to pay out change. Balance: {self._machine.balance}p")
+            raise
+        return change
+
+    def _update_display(self, message: str) -> None:
+        """
+        Start a display update in the background.
+
+        Args:
+            message (str): The message to show.
+        """
+        task = asyncio.create_task(self._display.show(message))
+        self._background.add(task)  # Keep a reference so the task is not garbage collected
+        task.add_done_callback(self._display_done)
+
+    def _display_done(self, task: asyncio.Task) -> None:
+        """
+        Forget a finished display update, logging its error if it failed.
+
+        Args:
+            task (asyncio.Task): The display update task.
+        """
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Display update failed.", exc_info=task.exception())
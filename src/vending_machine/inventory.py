@@ -1,4 +1,22 @@
+import heapq
+from datetime import date
+from typing import NamedTuple
+
+from .lots import ExpiryIndex, Lot
+from .planogram import Planogram
 from .product import Product
+from .search import ProductSearchIndex
+from .slots import Slot, SlotBank
+from .snapshot import VersionCounter
+
+
+class SoldUnit(NamedTuple):
+    """Where a sold unit was taken from, so it can be returned there if it is not vended."""
+    slot: int  # The index of the slot vended from, or None if the product has no slots
+    expiry: date  # The expiry of the lot it was taken from, or None if it was undated stock
+
+
+_UNTRACKED = SoldUnit(None, None)  # A unit taken from neither slots nor lots
 
 
 class Inventory:
@@ -8,6 +26,41 @@ class Inventory:
     def __init__(self):
         """Initialize the inventory with an empty product collection."""
         self._products = {}
+        self._version = VersionCounter()  # Incremented whenever a product is added or changes
+        self._listing = []  # Cached product listing
+        self._listing_version = None
+        self._json = None  # Cached JSON listing
+        self._json_version = None
+        self._snapshot = ()  # Cached product snapshots
+        self._snapshot_version = None
+        self._lots = {}  # Product ID -> heap of (expiry, sequence, lot) for stock reloaded with an expiry date
+        self._expiry_index = None
+        self._machine_id = None
+        self._slots = {}  # Product ID -> SlotBank for products spread over several spirals
+        self._search = ProductSearchIndex()
+
+    @property
+    def products(self) -> list:
+        return list(self._products.values())
+
+    @property
+    def version(self) -> int:
+        return self._version.value
+
+    def attach_expiry_index(self, expiry_index: ExpiryIndex, machine_id) -> None:
+        """
+        Register the lots of this inventory in a fleet-wide expiry index.
+
+        Args:
+            expiry_index (ExpiryIndex): The index to register lots in.
+            machine_id: The identifier reported for lots of this inventory.
+        """
+        self._expiry_index = expiry_index
+        self._machine_id = machine_id
+        for lots in self._lots.values():
+            for _, _, lot in lots:
+                lot.machine_id = machine_id
+                expiry_index.add(lot)
 
     def add_product(self, product: Product) -> None:
         """
@@ -25,7 +78,71 @@ class Inventory:
             raise ValueError(f"Product with ID {product.id} already exists.")
         elif len(self._products) >= Inventory.MAX_PRODUCTS:
             raise ValueError(f"Cannot add more than {Inventory.MAX_PRODUCTS} products.")
-        self._products[product.id] = product
+        self._insert(product)
+        product.track(self._version)
+        self._version.value += 1
+
+    def with_planogram(self, planogram: Planogram) -> "Inventory":
+        """
+        Build a new inventory for a planogram, carrying over the stock, lots and slots of this one.
+
+        Building it does not modify this inventory: products whose name, price and slots are unchanged are shared
+        with the new inventory, changed products are replaced by revised copies, and new products start without
+        stock. The shared products, slot banks and lots are not copied, though, so changes made through either
+        inventory afterwards show in both; once the new inventory is swapped in, this one must no longer be used.
+        Until `track_products` is called on the new inventory, changes to shared products only move the version of
+        this one, so building an inventory that is never swapped in has no effect.
+
+        Args:
+            planogram (Planogram): The validated planogram.
+
+        Returns:
+            Inventory: The new inventory.
+
+        Raises:
+            ValueError: If the planogram lists too many products, or a product's new slots or capacity cannot
+                        hold its current stock.
+        """
+        inventory = Inventory()
+        for planned in planogram.products:
+            product = self._products.get(planned.id)
+            slots = self._slots.get(planned.id)
+            current_slots = tuple(slot.capacity for slot in slots.slots) if slots is not None else ()
+            if product is None:
+                product = Product(id_=planned.id, name=planned.name, price=planned.price)
+            elif (product.name, product.price, current_slots) != (planned.name, planned.price, planned.slots):
+                product = product.revise(planned.name, planned.price)
+                if planned.slots != current_slots:
+                    product.set_capacity(sum(planned.slots) if planned.slots else Product.MAX_QUANTITY)
+            inventory._insert(product)
+            if planned.slots == current_slots and slots is not None:
+                inventory._slots[planned.id] = slots  # Keeps the slot quantities and jam reports
+            elif planned.slots:
+                inventory.assign_slots(planned.id, list(planned.slots))
+            if planned.id in self._lots:
+                inventory._lots[planned.id] = self._lots[planned.id]
+        inventory._expiry_index = self._expiry_index
+        inventory._machine_id = self._machine_id
+        inventory._version.value = self.version + 1  # Versions keep increasing, even when products are removed
+        return inventory
+
+    def track_products(self) -> None:
+        """Make the version of this inventory follow changes to its products, e.g. once it is swapped in."""
+        for product in self._products.values():
+            product.track(self._version)
+
+    def release_lots(self, product_ids) -> None:
+        """
+        Remove the lots of products from the expiry index, e.g. once they are no longer stocked.
+
+        Args:
+            product_ids: The IDs of the products.
+        """
+        if self._expiry_index is not None:
+            for product_id in product_ids:
+                for _, _, lot in self._lots.get(product_id, ()):
+                    lot.quantity = 0  # Gone from the machine, like a sold-out lot
+                    self._expiry_index.discard(lot)
 
     def get_product(self, product_id: int) -> Product:
         """
@@ -54,7 +171,23 @@ class Inventory:
             bool: True if the product is available, False otherwise.
         """
         product = self.get_product(product_id)
-        return product.quantity > 0
+        slots = self._slots.get(product_id)
+        return (slots.available if slots is not None else product.quantity) > 0
+
+    def search_products(self, query: str, limit: int = 10, in_stock_only: bool = False) -> list[Product]:
+        """
+        Search products by name, case-insensitively, by prefix or approximately.
+
+        Args:
+            query (str): The text to search for.
+            limit (int): The maximum number of products returned.
+            in_stock_only (bool): Whether to only return products that are available.
+
+        Returns:
+            list: The matching products, best match first.
+        """
+        where = (lambda product: self.is_product_available(product.id)) if in_stock_only else None
+        return self._search.search(query, limit, where)
 
     def ensure_product_available(self, product_id: int) -> None:
         """
@@ -69,39 +202,240 @@ class Inventory:
         if not self.is_product_available(product_id):
             raise ValueError(f"Product with ID {product_id} is out of stock.")
 
-    def reduce_stock(self, product_id: int) -> None:
+    def reduce_stock(self, product_id: int) -> SoldUnit:
         """
         Reduce the stock of a specified product by 1 when a purchase is made.
 
+        The item is taken from the lot expiring first; stock reloaded without an expiry date is sold last. For
+        products with slots, it is vended from the least used slot that is not jammed.
+
         Args:
             product_id (int): ID of the product to purchase.
 
+        Returns:
+            SoldUnit: The slot and the lot the unit was taken from.
+
         Raises:
             ValueError: If the product is out of stock.
         """
         product = self.get_product(product_id)
         self.ensure_product_available(product_id)
         product.reduce_quantity()
+        slots = self._slots.get(product_id)
+        slot = slots.take().index if slots is not None else None
+
+        lots = self._lots.get(product_id)
+        if not lots:
+            return _UNTRACKED if slot is None else SoldUnit(slot, None)
+        lot = lots[0][2]
+        lot.quantity -= 1
+        if lot.quantity == 0:
+            heapq.heappop(lots)
+            if self._expiry_index is not None:
+                self._expiry_index.discard(lot)
+        return SoldUnit(slot, lot.expiry)
 
-    def reload_product(self, product_id: int, quantity: int) -> None:
+    def return_unit(self, product_id: int, slot: int = None, expiry: date = None) -> None:
         """
-        Reload a specified product with more stock.
+        Put a sold unit that could not be vended back into the slot and the lot it was taken from.
+
+        If the slot has been refilled meanwhile, the unit goes to the emptiest slot instead; if its lot has been
+        sold out meanwhile, a new lot with the same expiry is started.
+
+        Args:
+            product_id (int): The ID of the product.
+            slot (int): The index of the slot the unit was vended from, as returned by `reduce_stock`.
+            expiry (date): The expiry of the lot the unit was taken from, or None if it was undated stock.
+
+        Raises:
+            ValueError: If the product is out of space.
+        """
+        product = self.get_product(product_id)
+        product.increase_quantity(1)
+        if product_id in self._slots:
+            self._slots[product_id].put_back(slot)
+        if expiry is None:
+            return
+        for *_, lot in self._lots.get(product_id, ()):
+            if lot.expiry == expiry:
+                lot.quantity += 1
+                return
+        self.add_lot(product_id, expiry, 1)
+
+    def reload_product(self, product_id: int, quantity: int, expiry: date = None) -> None:
+        """
+        Reload a specified product with more stock, filling the emptiest slots first.
 
         Args:
             product_id (int): The ID of the product to reload.
             quantity (int): The amount of stock to add.
+            expiry (date): The sell-by date of the reloaded stock, if it has one.
+
+        Raises:
+            TypeError: If the expiry is not a date.
         """
+        if expiry is not None and not isinstance(expiry, date):
+            raise TypeError("Expiry must be a date.")
         product = self.get_product(product_id)
         product.increase_quantity(quantity)
+        if product_id in self._slots:
+            self._slots[product_id].fill(quantity)
+        if expiry is not None and quantity > 0:
+            self.add_lot(product_id, expiry, quantity)
+
+    def add_lot(self, product_id: int, expiry: date, quantity: int) -> None:
+        """
+        Date stock that is already counted in a product's quantity, e.g. when mirroring another machine's lots.
+
+        Args:
+            product_id (int): The ID of the product.
+            expiry (date): The sell-by date of the stock.
+            quantity (int): The quantity in the lot.
+
+        Raises:
+            ValueError: If the product does not exist in the inventory.
+        """
+        self._ensure_product_exists(product_id)
+        lot = Lot(self._machine_id, product_id, expiry, quantity)
+        heapq.heappush(self._lots.setdefault(product_id, []), (*lot.key(), lot))
+        if self._expiry_index is not None:
+            self._expiry_index.add(lot)
+
+    def assign_slots(self, product_id: int, capacities: list[int]) -> None:
+        """
+        Spread a product over several slots, distributing its current stock to the emptiest slots.
+
+        Args:
+            product_id (int): The ID of the product.
+            capacities (list): The capacity of every slot; the product's capacity becomes their total.
+
+        Raises:
+            ValueError: If the slots are invalid or cannot hold the current stock.
+        """
+        product = self.get_product(product_id)
+        slots = SlotBank(capacities)
+        slots.fill(product.quantity)
+        product.set_capacity(slots.capacity)
+        self._slots[product_id] = slots
+
+    def load_slots(self, product_id: int, slots: list[tuple]) -> None:
+        """
+        Replace the slots of a product with an exact copy of another machine's, or remove them.
+
+        Args:
+            product_id (int): The ID of the product.
+            slots (list): A (capacity, quantity, vends, jammed) tuple per slot; empty to remove the slots.
+
+        Raises:
+            ValueError: If the slots are invalid or do not hold the product's stock.
+        """
+        product = self.get_product(product_id)
+        if not slots:
+            product.set_capacity(Product.MAX_QUANTITY)
+            self._slots.pop(product_id, None)
+            return
+        bank = SlotBank([capacity for capacity, _, _, _ in slots])
+        bank.load([state[1:] for state in slots])
+        if bank.quantity != product.quantity:
+            raise ValueError(f"Slots hold {bank.quantity} units, but the product has {product.quantity}.")
+        product.set_capacity(bank.capacity)
+        self._slots[product_id] = bank
+
+    def get_slots(self, product_id: int) -> list[Slot]:
+        """
+        Return the slots of a product.
+
+        Args:
+            product_id (int): The ID of the product.
+
+        Returns:
+            list: The slots, in position order; empty if the product has no slots assigned.
+        """
+        self._ensure_product_exists(product_id)
+        slots = self._slots.get(product_id)
+        return slots.slots if slots is not None else []
+
+    def set_slot_jammed(self, product_id: int, index: int, jammed: bool = True) -> None:
+        """
+        Mark a slot of a product as jammed, so it is skipped when vending, or as cleared.
+
+        Args:
+            product_id (int): The ID of the product.
+            index (int): The index of the slot.
+            jammed (bool): True if the slot is jammed, False once it has been cleared.
+
+        Raises:
+            ValueError: If the product has no such slot.
+        """
+        self._ensure_product_exists(product_id)
+        if product_id not in self._slots:
+            raise ValueError(f"Product with ID {product_id} has no slots assigned.")
+        self._slots[product_id].set_jammed(index, jammed)
+
+    def get_lots(self, product_id: int) -> list[Lot]:
+        """
+        Return the dated lots of a product in stock.
+
+        Args:
+            product_id (int): The ID of the product.
+
+        Returns:
+            list: The lots, earliest expiry first.
+        """
+        self._ensure_product_exists(product_id)
+        return [lot for _, _, lot in sorted(self._lots.get(product_id, ()))]
 
     def list_products(self) -> list:
         """
         List all products with their current stock and price.
 
+        The listing is cached and only rebuilt when a product has changed, in which case only the changed
+        products are rendered again.
+
         Returns:
             list: A list of string representations of all products.
         """
-        return [str(product) for product in self._products.values()]
+        version = self.version
+        if version != self._listing_version:
+            self._listing = [str(product) for product in self._products.values()]
+            self._listing_version = version
+        return self._listing.copy()  # Return a copy to prevent direct modification
+
+    def list_products_json(self) -> str:
+        """
+        List all products as a JSON array, e.g. for kiosk user interfaces.
+
+        Returns:
+            str: A JSON array of product objects with their ID, name, price and quantity.
+        """
+        version = self.version
+        if version != self._json_version:
+            self._json = f"[{','.join(product.to_json() for product in self._products.values())}]"
+            self._json_version = version
+        return self._json
+
+    def snapshot(self) -> tuple:
+        """
+        Return immutable views of all products, reusing the views of unchanged products.
+
+        Returns:
+            tuple: A tuple of `ProductSnapshot` objects, the same object while nothing has changed.
+        """
+        version = self.version
+        if version != self._snapshot_version:
+            self._snapshot = tuple(product.snapshot() for product in self._products.values())
+            self._snapshot_version = version
+        return self._snapshot
+
+    def _insert(self, product: Product) -> None:
+        """
+        Store a product and index its name, without tracking its changes.
+
+        Args:
+            product (Product): The product to store.
+        """
+        self._products[product.id] = product
+        self._search.add(product)
 
     def _product_exists(self, product_id: int) -> bool:
         """
@@ -0,0 +1,85 @@
+import itertools
+from bisect import bisect_right, insort
+from datetime import date
+
+_sequence = itertools.count()  # Tie-breaker so lots with the same expiry keep their reload order
+
+
+class Lot:
+    """A quantity of a product reloaded together, sharing one expiry date."""
+    __slots__ = ("machine_id", "product_id", "expiry", "quantity", "sequence")
+
+    def __init__(self, machine_id, product_id: int, expiry: date, quantity: int):
+        """
+        Initialize a lot.
+
+        Args:
+            machine_id: The identifier of the machine holding the lot, if any.
+            product_id (int): The ID of the product.
+            expiry (date): The sell-by date of the lot.
+            quantity (int): The quantity in the lot.
+        """
+        self.machine_id = machine_id
+        self.product_id = product_id
+        self.expiry = expiry
+        self.quantity = quantity
+        self.sequence = next(_sequence)
+
+    def key(self) -> tuple:
+        return self.expiry, self.sequence
+
+    def __repr__(self):
+        return (f"Lot(machine_id={self.machine_id!r}, product_id={self.product_id}, expiry={self.expiry}, "
+                f"quantity={self.quantity})")
+
+
+class ExpiryIndex:
+    """
+    Fleet-wide index of product lots ordered by expiry date.
+
+    Lots are kept in a list sorted by expiry, so finding the lots expiring before a date is a binary search
+    followed by a scan of the matching lots only. Sold-out lots are removed lazily and compacted once they make
+    up half of the index.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._entries = []  # Sorted (expiry, sequence, lot) tuples
+        self._sold_out = 0
+
+    def __len__(self) -> int:
+        return len(self._entries) - self._sold_out
+
+    def add(self, lot: Lot) -> None:
+        """
+        Add a lot to the index.
+
+        Args:
+            lot (Lot): The lot to add.
+        """
+        insort(self._entries, (*lot.key(), lot))
+
+    def discard(self, lot: Lot) -> None:
+        """
+        Record that a lot has sold out.
+
+        Args:
+            lot (Lot): The sold-out lot.
+        """
+        self._sold_out += 1
+        if self._sold_out * 2 > len(self._entries):
+            self._entries = [entry for entry in self._entries if entry[2].quantity > 0]
+            self._sold_out = 0
+
+    def expiring(self, until: date) -> list[Lot]:
+        """
+        Find the lots in stock that expire on or before a date.
+
+        Args:
+            until (date): The last expiry date to include.
+
+        Returns:
+            list: The matching lots, earliest expiry first.
+        """
+        end = bisect_right(self._entries, until, key=lambda entry: entry[0])
+        return [lot for _, _, lot in self._entries[:end] if lot.quantity > 0]
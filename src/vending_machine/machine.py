@@ -1,22 +1,140 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from types import MappingProxyType
+from typing import TYPE_CHECKING
+
+from .change import ChangeVector
 from .currency import Currency
-from .inventory import Inventory
+from .events import (CASHLESS, ChangeDispensed, ChangeRestored, CoinInserted, CurrencyReloaded, EventBus,
+                     PlanogramLoaded, ProductAdded, ProductPurchased, ProductReloaded, PurchaseRefunded,
+                     publishes_failures)
+from .inventory import Inventory, SoldUnit
+from .lots import ExpiryIndex, Lot
+from .planogram import Planogram, PreparedPlanogram, validate_planogram
 from .product import Product
+from .slots import Slot
+from .snapshot import MachineSnapshot, VersionConflict
+from .timeseries import LevelRecorder
 from .utils import validate_quantity
 
+if TYPE_CHECKING:  # sqlite3 and http.client are only imported when storage or payments are actually used
+    from .payments import PaymentProvider
+    from .storage import SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
 
 class VendingMachine:
     """Represents the vending machine."""
 
-    def __init__(self):
-        """Initialize the vending machine with inventory and currency."""
+    def __init__(self, storage: "SQLiteStorage" = None, events: EventBus = None):
+        """
+        Initialize the vending machine with inventory and currency.
+
+        Args:
+            storage (SQLiteStorage): Optional storage backend to restore the state from and persist it to.
+            events (EventBus): The bus to publish state change events on. A new one is created if omitted.
+        """
         self._balance = 0  # Stores the current balance inserted by the user
+        # Held by every mutation, so conditional operations are atomic. The hot paths acquire it explicitly, as a
+        # `with` statement allocates a bound `__exit__` method on every call
+        self._lock = threading.RLock()
         self._currency = Currency()
         self._inventory = Inventory()
+        self._accepted_denominations = Currency.DENOMINATIONS  # Coins taken for the balance, set by the planogram
+        self._storage = storage
+        self._events = events if events is not None else EventBus()
+        # Events are collected under the lock and published once it is released, so a subscriber applying
+        # back-pressure never holds up other callers of the machine
+        self._pending_events = []
+        self._publishing = threading.Lock()  # Held by the thread publishing the collected events
+        self._levels = LevelRecorder()
+        self._rendered = None  # Cached string representation
+        self._rendered_key = None
+        self._snapshot = None  # Cached state snapshot
+        self._snapshot_key = None
+        if storage is not None:
+            self._balance = storage.load(self._inventory, self._currency)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the lock for a mutation, then publish the events it collected."""
+        self._lock.acquire()
+        try:
+            yield
+        finally:
+            self._lock.release()
+            self._publish_pending()
+
+    def _publish_pending(self) -> None:
+        """
+        Publish the events collected under the lock, in the order they were collected.
+
+        Nothing is published while the calling thread still holds the lock, e.g. when a subclass wraps the
+        operation; the subclass publishes once it releases it. Only one thread publishes at a time, and a thread
+        finding another one publishing leaves its events to it rather than waiting, so a subscriber calling the
+        machine from its handler cannot deadlock a blocked publisher.
+        """
+        while self._pending_events and not self._lock._is_owned() and self._publishing.acquire(blocking=False):
+            try:
+                with self._lock:
+                    events, self._pending_events = self._pending_events, []
+                for event in events:
+                    self._events.publish(event)
+            finally:
+                self._publishing.release()
 
     @property
     def balance(self) -> int:
         return self._balance
 
+    @property
+    def events(self) -> EventBus:
+        return self._events
+
+    @property
+    def levels(self) -> LevelRecorder:
+        return self._levels
+
+    @classmethod
+    def from_snapshot(cls, snapshot: MachineSnapshot, lots: list[tuple] = (), slots: dict = None,
+                      accepted_denominations: tuple = Currency.DENOMINATIONS) -> "VendingMachine":
+        """
+        Create a vending machine holding the state of a snapshot, with the product and tube versions.
+
+        Args:
+            snapshot (MachineSnapshot): The state to restore.
+            lots (list): The dated stock included in the product quantities, as (product ID, expiry, quantity)
+                         tuples, earliest expiry first.
+            slots (dict): The slots of the products that have them, as a list of (capacity, quantity, vends,
+                          jammed) tuples per product ID.
+            accepted_denominations (tuple): The denominations taken for the balance.
+
+        Returns:
+            VendingMachine: The restored vending machine.
+
+        Raises:
+            ValueError: If the slots do not hold the product quantities or the denominations are invalid.
+        """
+        accepted = set(accepted_denominations)
+        if not accepted or not accepted <= set(Currency.DENOMINATIONS):
+            raise ValueError(f"Accepted denominations must be a non-empty subset of {Currency.DENOMINATIONS}.")
+        vending_machine = cls()
+        vending_machine.add_products([Product.from_snapshot(product) for product in snapshot.products])
+        for product_id, states in (slots or {}).items():
+            vending_machine._inventory.load_slots(product_id, states)
+        for product_id, expiry, quantity in lots:
+            vending_machine._inventory.add_lot(product_id, expiry, quantity)
+        vending_machine._accepted_denominations = tuple(denom for denom in Currency.DENOMINATIONS if denom in accepted)
+        vending_machine._currency.load_counts(snapshot.denomination_counts, snapshot.inserted_money,
+                                              snapshot.tube_versions)
+        vending_machine._balance = snapshot.balance
+        return vending_machine
+
+    @publishes_failures
     def add_product(self, product: Product) -> None:
         """
         Load a single product into the vending machine inventory.
@@ -24,7 +142,14 @@ class VendingMachine:
         Args:
             product (Product): The Product object to load into the inventory.
         """
-        self._inventory.add_product(product)
+        with self._locked():
+            self._inventory.add_product(product)
+            if self._storage is not None:
+                self._storage.stage_product(product.id)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(ProductAdded(product.id, product.name, product.price,
+                                                         product.quantity, time.time()))
 
     def add_products(self, product_list: list[Product]) -> None:
         """
@@ -36,6 +161,7 @@ class VendingMachine:
         for product in product_list:
             self.add_product(product)
 
+    @publishes_failures
     def insert_money(self, denom: int) -> None:
         """
         Accept money from the user and add to balance.
@@ -43,9 +169,22 @@ class VendingMachine:
         Args:
             denom (int): The denomination inserted by the user, in pence.
         """
-        self._currency.ensure_valid_denomination(denom)
-        self._balance += denom
-        self._currency.insert_to_storage(denom)
+        self._lock.acquire()
+        try:
+            if denom not in self._accepted_denominations:
+                self._currency.ensure_valid_denomination(denom)
+                raise ValueError(f"{denom}p coins are not accepted.")
+            self._balance += denom
+            self._currency.insert_to_storage(denom)
+            if self._storage is not None:
+                self._storage.stage_denomination(denom)
+                self._storage.stage_balance(self._balance)
+            if self._events.active:
+                self._pending_events.append(CoinInserted(denom, self._balance, time.time()))
+        finally:
+            self._lock.release()
+            if self._pending_events:
+                self._publish_pending()
 
     def select_product(self, product_id: int) -> Product:
         """
@@ -63,87 +202,432 @@ class VendingMachine:
         self._inventory.ensure_product_available(product_id)
         return self._inventory.get_product(product_id)
 
-    def purchase_product(self, product_id: int) -> None:
+    @publishes_failures
+    def purchase_product(self, product_id: int, expected_version: int = None) -> SoldUnit:
         """
         Purchase a product if the balance is sufficient, or prompt for more money.
 
         Args:
             product_id (int): The ID of the product to purchase.
+            expected_version (int): If given, only purchase if the product is still at this version, e.g. the
+                                    version a remote client displayed.
+
+        Returns:
+            SoldUnit: The slot and lot the unit was taken from, to return it there with `refund_purchase` if it
+                      cannot be vended.
 
         Raises:
             ValueError: If the balance is insufficient for the product.
+            VersionConflict: If the product has changed since the expected version.
         """
-        product = self.select_product(product_id)
-        if self._balance < product.price:
-            raise ValueError(f"Insufficient balance. Please insert {product.price - self._balance}p more.")
+        self._lock.acquire()
+        try:
+            product = self.select_product(product_id)
+            if expected_version is not None:
+                product.ensure_version(expected_version)
+            if self._balance < product.price:
+                raise ValueError(f"Insufficient balance. Please insert {product.price - self._balance}p more.")
+
+            # Deduct product price from balance and update inventory
+            self._balance -= product.price
+            unit = self._inventory.reduce_stock(product_id)
+            if self._storage is not None:
+                self._storage.stage_product(product_id)
+                self._storage.stage_balance(self._balance)
+            if self._events.active:
+                self._pending_events.append(ProductPurchased(product_id, product.price, self._balance, time.time()))
+            return unit
+        finally:
+            self._lock.release()
+            if self._pending_events:
+                self._publish_pending()
+
+    @publishes_failures
+    def purchase_cashless(self, product_id: int, provider: "PaymentProvider") -> None:
+        """
+        Purchase a product with a card or mobile payment instead of the inserted balance.
 
-        # Deduct product price from balance and update inventory
-        self._balance -= product.price
-        self._inventory.reduce_stock(product_id)
+        The price is authorized before vending, captured once the product has been vended and voided if it could
+        not be. The capture is settled by the provider in the background. The machine's lock is only held to take
+        the product, not during the gateway round trip.
 
-    def dispense_change(self) -> dict:
+        Args:
+            product_id (int): The ID of the product to purchase.
+            provider (PaymentProvider): The payment provider to charge.
+
+        Raises:
+            ValueError: If the product is unavailable.
+            PaymentDeclined: If the payment is declined.
+        """
+        product = self.select_product(product_id)
+        authorization = provider.authorize(product.price)
+        try:
+            self._sell_cashless(product_id, product.price)
+        except Exception:
+            try:
+                provider.void(authorization)
+            except Exception:  # The hold expires at the gateway; report why the vend failed
+                logger.exception("Voiding authorization %s failed.", authorization.id)
+            raise
+        provider.capture(authorization)
+
+    def _sell_cashless(self, product_id: int, price: int) -> None:
+        """
+        Take an authorized cashless sale out of stock and record it.
+
+        Args:
+            product_id (int): The ID of the product.
+            price (int): The authorized price, in pence.
+        """
+        with self._locked():
+            self._inventory.reduce_stock(product_id)
+            if self._storage is not None:
+                self._storage.stage_product(product_id)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(ProductPurchased(product_id, price, self._balance, time.time(),
+                                                             CASHLESS))
+
+    @publishes_failures
+    def dispense_change(self) -> ChangeVector:
         """
         Dispense change based on the remaining balance and update currency stock.
 
         Returns:
-            dict: A dictionary of denominations as keys and quantities as values for the change given.
+            ChangeVector: The number of coins of each denomination given.
 
         Raises:
             ValueError: If exact change cannot be provided.
         """
-        change = self._currency.calculate_change(self._balance)
-        self._currency.update_denomination_counts(change)
-        self._balance = 0  # Reset balance after dispensing change
-        return change
+        self._lock.acquire()
+        try:
+            amount = self._balance
+            change = self._currency.calculate_change(amount)
+            self._currency.dispense(change)
+            self._balance = 0  # Reset balance after dispensing change
+            if self._storage is not None:  # End of the customer session
+                for denom, _ in change.items():
+                    self._storage.stage_denomination(denom)
+                self._storage.stage_balance(self._balance)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(ChangeDispensed(change, amount, time.time()))
+            return change
+        finally:
+            self._lock.release()
+            if self._pending_events:
+                self._publish_pending()
+
+    @publishes_failures
+    def refund_purchase(self, product_id: int, price: int, unit: SoldUnit = None) -> None:
+        """
+        Undo a cash purchase whose product could not be vended, returning it to stock and crediting its price.
+
+        Args:
+            product_id (int): The ID of the product that was purchased.
+            price (int): The price paid, in pence.
+            unit (SoldUnit): Where the unit was taken from, as returned by `purchase_product`. Without it, the unit
+                             is returned to the emptiest slot as undated stock.
+        """
+        with self._locked():
+            slot, expiry = unit if unit is not None else (None, None)
+            self._inventory.return_unit(product_id, slot, expiry)
+            self._balance += price
+            if self._storage is not None:
+                self._storage.stage_product(product_id)
+                self._storage.stage_balance(self._balance)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(PurchaseRefunded(product_id, price, self._balance, time.time()))
+
+    @publishes_failures
+    def restore_change(self, change: ChangeVector) -> None:
+        """
+        Return change that could not be paid out to the tubes and credit it to the balance again.
 
-    def reload_product(self, product_id: int, quantity: int) -> None:
+        Args:
+            change (ChangeVector): The change, as returned by `dispense_change`.
+        """
+        with self._locked():
+            self._currency.restore(change)
+            self._balance += change.total
+            if self._storage is not None:
+                for denom, _ in change.items():
+                    self._storage.stage_denomination(denom)
+                self._storage.stage_balance(self._balance)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(ChangeRestored(change, change.total, time.time()))
+
+    @publishes_failures
+    def reload_product(self, product_id: int, quantity: int, expiry: date = None,
+                       expected_version: int = None) -> None:
         """
         Reload a specified product in the inventory.
 
         Args:
             product_id (int): The ID of the product to reload.
             quantity (int): The quantity to add.
+            expiry (date): The sell-by date of the reloaded stock, if it has one.
+            expected_version (int): If given, only reload if the product is still at this version.
+
+        Raises:
+            VersionConflict: If the product has changed since the expected version.
+        """
+        with self._locked():
+            if expected_version is not None:
+                self._inventory.get_product(product_id).ensure_version(expected_version)
+            self._inventory.reload_product(product_id, quantity, expiry)
+            if self._storage is not None:
+                self._storage.stage_product(product_id)
+                self._storage.commit()
+            if self._events.active:
+                stock = self._inventory.get_product(product_id).quantity
+                self._pending_events.append(ProductReloaded(product_id, quantity, stock, time.time()))
+
+    def assign_slots(self, product_id: int, capacities: list[int]) -> None:
+        """
+        Spread a product over several slots (spirals) with the given capacities.
+
+        Args:
+            product_id (int): The ID of the product.
+            capacities (list): The capacity of every slot.
+        """
+        with self._lock:
+            self._inventory.assign_slots(product_id, capacities)
+            if self._storage is not None:
+                self._storage.stage_product(product_id)
+                self._storage.commit()
+
+    def get_slots(self, product_id: int) -> list[Slot]:
+        """
+        Get the slots of a product.
+
+        Args:
+            product_id (int): The ID of the product.
+
+        Returns:
+            list: The slots, in position order; empty if the product has no slots assigned.
+        """
+        return self._inventory.get_slots(product_id)
+
+    def report_jam(self, product_id: int, index: int, jammed: bool = True) -> None:
+        """
+        Report a jammed slot, so the product is vended from its other slots, or clear the report.
+
+        Args:
+            product_id (int): The ID of the product.
+            index (int): The index of the slot.
+            jammed (bool): True if the slot is jammed, False once it has been cleared.
+        """
+        with self._lock:
+            self._inventory.set_slot_jammed(product_id, index, jammed)
+            if self._storage is not None:
+                self._storage.stage_product(product_id)
+                self._storage.commit()
+
+    def get_capacities(self) -> dict[int, int]:
+        """
+        Get the maximum stock of every product, e.g. the total capacity of its slots.
+
+        Returns:
+            dict: A dictionary with product IDs as keys and capacities as values.
         """
-        self._inventory.reload_product(product_id, quantity)
+        return {product.id: product.capacity for product in self._inventory.products}
 
-    def reload_currency(self, denom: int, count: int) -> None:
+    def get_lots(self, product_id: int) -> list[Lot]:
+        """
+        Get the dated lots of a product in stock.
+
+        Args:
+            product_id (int): The ID of the product.
+
+        Returns:
+            list: The lots, earliest expiry first.
+        """
+        return self._inventory.get_lots(product_id)
+
+    def attach_expiry_index(self, expiry_index: ExpiryIndex, machine_id) -> None:
+        """
+        Register the product lots of this machine in a fleet-wide expiry index.
+
+        Args:
+            expiry_index (ExpiryIndex): The index to register lots in.
+            machine_id: The identifier reported for lots of this machine.
+        """
+        self._inventory.attach_expiry_index(expiry_index, machine_id)
+
+    @publishes_failures
+    def reload_currency(self, denom: int, count: int, expected_version: int = None) -> None:
         """
         Reload specific currency denominations.
 
         Args:
             denom (int): The denomination to reload.
             count (int): The quantity to add.
+            expected_version (int): If given, only reload if the tube is still at this version.
+
+        Raises:
+            VersionConflict: If the tube count has changed since the expected version.
+        """
+        with self._locked():
+            count = validate_quantity(count)
+            if expected_version is not None:
+                self._currency.ensure_tube_version(denom, expected_version)
+            self._currency.update_denomination_count(denom, count)
+            if self._storage is not None:
+                self._storage.stage_denomination(denom)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(CurrencyReloaded({denom: count}, time.time()))
+
+    @publishes_failures
+    def reload_currencies(self, counts: dict[int, int], expected_versions: dict[int, int] = None) -> None:
         """
-        count = validate_quantity(count)
-        self._currency.update_denomination_count(denom, count)
+        Reload several currency denominations at once, e.g. from a float plan.
 
-    def get_denomination_counts(self) -> dict:
+        Either all denominations are reloaded or, if any update is invalid, none are.
+
+        Args:
+            counts (dict): Denominations as keys and the quantities to add as values.
+            expected_versions (dict): If given, denominations as keys and the tube versions they must still be at.
+
+        Raises:
+            VersionConflict: If a tube count has changed since its expected version.
+        """
+        with self._locked():
+            counts = {denom: validate_quantity(count) for denom, count in counts.items()}
+            for denom, expected_version in (expected_versions or {}).items():
+                self._currency.ensure_tube_version(denom, expected_version)
+            self._currency.update_denomination_counts(counts)
+            if self._storage is not None:
+                for denom in counts:
+                    self._storage.stage_denomination(denom)
+                self._storage.commit()
+            if self._events.active:
+                self._pending_events.append(CurrencyReloaded(counts, time.time()))
+
+    def prepare_planogram(self, planogram: Planogram) -> PreparedPlanogram:
+        """
+        Validate a planogram and build the inventory for it, without changing the machine.
+
+        This is the expensive part of a planogram reload and can run off the customer path, e.g. on a maintenance
+        thread. Stock, lots and slots are carried over from the live inventory.
+
+        Args:
+            planogram (Planogram): The new products, prices, slot capacities and accepted denominations.
+
+        Returns:
+            PreparedPlanogram: The planogram ready for `apply_planogram`.
+
+        Raises:
+            TypeError: If a product field has the wrong type.
+            ValueError: If the planogram is invalid or cannot hold the current stock.
+        """
+        planogram = validate_planogram(planogram)
+        inventory = self._inventory
+        base_version = inventory.version  # Read before building, so any change during the build is detected
+        planned_ids = {product.id for product in planogram.products}
+        removed = tuple(product.id for product in inventory.products if product.id not in planned_ids)
+        return PreparedPlanogram(planogram, inventory.with_planogram(planogram), base_version, removed)
+
+    @publishes_failures
+    def apply_planogram(self, prepared: PreparedPlanogram) -> None:
+        """
+        Swap a prepared planogram in, in a single step.
+
+        The version check and the swap hold the machine's lock, so no sale can slip in between them. The balance
+        and the currency are untouched, so a customer session in progress carries on with the new prices.
+
+        Args:
+            prepared (PreparedPlanogram): The planogram returned by `prepare_planogram`.
+
+        Raises:
+            VersionConflict: If the inventory has changed since the planogram was prepared, e.g. by a sale, in
+                             which case it must be prepared again.
+        """
+        with self._locked():
+            if self._inventory.version != prepared.base_version:
+                raise VersionConflict("inventory", prepared.base_version, self._inventory.version)
+            previous = self._inventory
+            self._inventory = prepared.inventory
+            self._inventory.track_products()
+            self._accepted_denominations = prepared.planogram.accepted_denominations
+            previous.release_lots(prepared.removed)
+            if self._storage is not None:
+                self._storage.replace_inventory(self._inventory, prepared.removed)
+                self._storage.commit()
+            if self._events.active:
+                planned = tuple(product.id for product in prepared.planogram.products)
+                self._pending_events.append(PlanogramLoaded(planned, self._accepted_denominations, time.time()))
+
+    def reload_planogram(self, planogram: Planogram) -> None:
+        """
+        Load a new planogram without restarting the machine, carrying over the stock and the balance.
+
+        Args:
+            planogram (Planogram): The new products, prices, slot capacities and accepted denominations.
+
+        Raises:
+            TypeError: If a product field has the wrong type.
+            ValueError: If the planogram is invalid or cannot hold the current stock.
+        """
+        self.apply_planogram(self.prepare_planogram(planogram))
+
+    def get_denomination_counts(self) -> MappingProxyType:
         """
         Get the current counts of all denominations in the currency storage.
 
         Returns:
-            dict: A dictionary with denominations as keys and counts as values.
+            MappingProxyType: A read-only mapping with denominations as keys and counts as values.
         """
         return self._currency.denomination_counts
 
-    def get_stored_money(self) -> dict:
+    def get_stored_money(self) -> MappingProxyType:
         """
         Get the current counts of all denominations in the currency storage.
 
         Returns:
-            dict: A dictionary with denominations as keys and counts as values.
+            MappingProxyType: A read-only mapping with denominations as keys and counts as values.
         """
         return self._currency.inserted_money
 
-    @staticmethod
-    def get_valid_denominations() -> list:
+    def snapshot(self) -> MachineSnapshot:
+        """
+        Get an immutable, consistent view of the balance, currency and inventory.
+
+        While nothing has changed the same snapshot object is returned, and a new snapshot shares every
+        unchanged part with the previous one, so polling readers cause no copies.
+
+        Returns:
+            MachineSnapshot: The current state, stamped with a version that increases with every change.
+        """
+        key = (self._balance, self._currency.version, self._inventory.version)
+        if key != self._snapshot_key:
+            version = self._snapshot.version + 1 if self._snapshot is not None else 0
+            self._snapshot = MachineSnapshot(version, self._balance, self._currency.denomination_counts,
+                                             self._currency.inserted_money, self._inventory.snapshot(),
+                                             self._currency.tube_versions)
+            self._snapshot_key = key
+        return self._snapshot
+
+    def sample_levels(self, timestamp: float = None) -> None:
+        """
+        Record the current coin tube and product stock levels, e.g. from a periodic timer.
+
+        Args:
+            timestamp (float): The sample time in seconds. Defaults to now.
+        """
+        self._levels.sample(self._currency.denomination_counts, self._inventory.snapshot(), timestamp)
+
+    def get_valid_denominations(self) -> tuple:
         """
-        Get the list of valid denominations.
+        Get the denominations accepted by the machine.
 
         Returns:
-            list: A list of valid denominations.
+            tuple: The accepted denominations, largest first.
         """
-        return Currency.DENOMINATIONS
+        return self._accepted_denominations
 
     def list_products(self) -> list:
         """
@@ -154,9 +638,36 @@ class VendingMachine:
         """
         return self._inventory.list_products()
 
+    def search_products(self, query: str, limit: int = 10, in_stock_only: bool = False) -> list[Product]:
+        """
+        Search products by name, e.g. for search-as-you-type on a touchscreen.
+
+        Args:
+            query (str): The text to search for, matched case-insensitively by prefix or approximately.
+            limit (int): The maximum number of products returned.
+            in_stock_only (bool): Whether to only return products that are available.
+
+        Returns:
+            list: The matching products, best match first.
+        """
+        return self._inventory.search_products(query, limit, in_stock_only)
+
+    def list_products_json(self) -> str:
+        """
+        List all products in the inventory as a JSON array.
+
+        Returns:
+            str: A JSON array of product objects with their ID, name, price and quantity.
+        """
+        return self._inventory.list_products_json()
+
     def __str__(self) -> str:
-        return ("\nVending Machine state:"
-                f"\n\tAccepted denominations={Currency.DENOMINATIONS}"
-                f"\n\tBalance={self.balance}"
-                f"\n\tCurrency=({self._currency})"
-                f"\n\tInventory=({self._inventory})")
+        key = (self._balance, self._currency.version, self._inventory.version)
+        if key != self._rendered_key:
+            self._rendered = ("\nVending Machine state:"
+                              f"\n\tAccepted denominations={self._accepted_denominations}"
+                              f"\n\tBalance={self.balance}"
+                              f"\n\tCurrency=({self._currency})"
+                              f"\n\tInventory=({self._inventory})")
+            self._rendered_key = key
+        return self._rendered
@@ -0,0 +1,376 @@
+import http.client
+import itertools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Authorization(NamedTuple):
+    """An approved hold of an amount on a customer's card or mobile wallet."""
+    id: str
+    amount: int
+
+
+class PaymentDeclined(ValueError):
+    """The payment gateway declined an authorization."""
+
+
+class PaymentProvider(ABC):
+    """Interface for cashless (card or mobile) payment providers."""
+
+    @abstractmethod
+    def authorize(self, amount: int) -> Authorization:
+        """
+        Place a hold of an amount on the customer's payment method.
+
+        Args:
+            amount (int): The amount in pence.
+
+        Returns:
+            Authorization: The approved authorization.
+
+        Raises:
+            PaymentDeclined: If the payment is declined.
+        """
+
+    @abstractmethod
+    def capture(self, authorization: Authorization) -> None:
+        """
+        Settle an authorization once the product has been vended.
+
+        Args:
+            authorization (Authorization): The authorization to capture.
+        """
+
+    @abstractmethod
+    def void(self, authorization: Authorization) -> None:
+        """
+        Release an authorization when the product could not be vended.
+
+        Args:
+            authorization (Authorization): The authorization to void.
+        """
+
+
+class _GatewayError(http.client.HTTPException):
+    """The gateway answered a request with an error status."""
+
+
+class _ConnectionPool:
+    """A fixed number of keep-alive HTTP connections to one host, each used by one request at a time."""
+
+    def __init__(self, host: str, port: int, size: int, timeout: float):
+        self._connections = queue.LifoQueue()  # Most recently used first, so idle connections stay warm
+        for _ in range(size):
+            self._connections.put(http.client.HTTPConnection(host, port, timeout=timeout))
+
+    def request(self, path: str, body: dict) -> dict:
+        """
+        Post a JSON body and return the decoded JSON response, reconnecting once if the connection was dropped.
+
+        As a dropped connection may have lost the response rather than the request, the request is sent again and
+        must be idempotent: authorizations carry an idempotency key, captures and voids name their authorizations.
+
+        Args:
+            path (str): The request path.
+            body (dict): The request body.
+
+        Returns:
+            dict: The response body.
+
+        Raises:
+            OSError: If the gateway is unreachable.
+            http.client.HTTPException: If the gateway answers with an error status.
+        """
+        connection = self._connections.get()
+        try:
+            for attempt in range(2):
+                try:
+                    connection.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+                    response = connection.getresponse()
+                    content = response.read()  # Drained even on errors, so the connection can be reused
+                    if not 200 <= response.status < 300:
+                        raise _GatewayError(f"HTTP {response.status} {response.reason}")
+                    return json.loads(content)
+                except _GatewayError:
+                    raise
+                except (ConnectionError, http.client.HTTPException):
+                    connection.close()  # Reconnects on the next request
+                    if attempt:
+                        raise
+        finally:
+            self._connections.put(connection)
+
+    def close(self) -> None:
+        while not self._connections.empty():
+            self._connections.get().close()
+
+
+class GatewayPaymentProvider(PaymentProvider):
+    """
+    Payment provider talking JSON over HTTP/1.1 to a payment gateway.
+
+    Requests reuse a small pool of keep-alive connections, so an authorization costs one round trip without a new
+    TCP handshake. Captures are queued and settled in batches by a background thread, so a successful vend never
+    waits for settlement. A batch the gateway does not accept stays queued and is retried with exponential backoff;
+    captures still failing when the provider is closed are logged and kept in `unsettled`.
+    """
+
+    def __init__(self, host: str, port: int, pool_size: int = 2, batch_size: int = 32, batch_delay: float = 0.05,
+                 timeout: float = 5.0, backoff: float = 0.5, max_backoff: float = 60.0):
+        """
+        Initialize the provider and start its settlement thread.
+
+        Args:
+            host (str): The gateway host.
+            port (int): The gateway port.
+            pool_size (int): The number of pooled connections.
+            batch_size (int): The maximum number of captures settled per request.
+            batch_delay (float): How long to wait for more captures before settling a partial batch, in seconds.
+            timeout (float): The connection timeout in seconds.
+            backoff (float): The delay before retrying a failed capture batch in seconds, doubled on every
+                             consecutive failure.
+            max_backoff (float): The maximum delay between retries in seconds.
+        """
+        self.failures = 0  # Failed capture requests
+        self.unsettled = []  # Authorizations that could not be captured before closing
+        self._pool = _ConnectionPool(host, port, pool_size, timeout)
+        self._batch_size = batch_size
+        self._batch_delay = batch_delay
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._stopped = threading.Event()
+        self._captures = queue.Queue()
+        self._settler = threading.Thread(target=self._settle_loop, daemon=True)
+        self._settler.start()
+
+    def authorize(self, amount: int) -> Authorization:
+        # The key lets the gateway recognise a retried request, so the customer is never authorized twice
+        response = self._pool.request("/authorizations", {"amount": amount, "idempotency_key": uuid.uuid4().hex})
+        if not response.get("approved"):
+            raise PaymentDeclined(f"Payment of {amount}p declined: {response.get('reason', 'unknown reason')}.")
+        return Authorization(response["id"], amount)
+
+    def capture(self, authorization: Authorization) -> None:
+        self._captures.put(authorization)
+
+    def void(self, authorization: Authorization) -> None:
+        self._pool.request("/voids", {"id": authorization.id})
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until all queued captures have been settled.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the queue was drained, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._captures.all_tasks_done:
+            while self._captures.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._captures.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        """Try once more to settle the queued captures, without backing off, and close the connections."""
+        self._captures.put(None)
+        self._stopped.set()
+        self._settler.join()
+        self._pool.close()
+
+    def _settle_loop(self) -> None:
+        """Settle queued captures in batches until closed."""
+        closed = False
+        while not closed:
+            batch = [self._captures.get()]
+            deadline = time.monotonic() + self._batch_delay
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._captures.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            closed = None in batch
+            authorizations = [authorization for authorization in batch if authorization is not None]
+            try:
+                if authorizations:
+                    self._settle(authorizations)
+            finally:
+                for _ in batch:
+                    self._captures.task_done()
+
+    def _settle(self, authorizations: list[Authorization]) -> None:
+        """
+        Capture a batch of authorizations, retrying with backoff until the gateway accepts it or the provider is
+        closed.
+
+        Args:
+            authorizations (list): The authorizations to capture.
+        """
+        failures = 0
+        while True:
+            try:
+                self._pool.request("/captures", {"ids": [authorization.id for authorization in authorizations]})
+                return
+            except (OSError, http.client.HTTPException) as e:
+                failures += 1
+                self.failures += 1
+                if self._stopped.is_set():
+                    self.unsettled.extend(authorizations)
+                    logger.error("Settling %d captures failed (%s); left unsettled: %s", len(authorizations), e,
+                                 [authorization.id for authorization in authorizations])
+                    return
+                delay = self._retry_delay(failures)
+                logger.warning("Settling %d captures failed (%s); retrying in %.1f s.", len(authorizations), e, delay)
+                self._stopped.wait(delay)
+
+    def _retry_delay(self, failures: int) -> float:
+        """
+        Return the jittered delay before retrying a capture batch.
+
+        Args:
+            failures (int): The number of consecutive failures.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self._backoff * 2 ** min(failures - 1, 32), self._max_backoff)
+        return random.uniform(delay / 2, delay)
+
+
+class MockPaymentGateway:
+    """
+    A local stand-in for the payment gateway, for tests and benchmarks.
+
+    Authorizations are approved unless the amount is in `declined_amounts`; every request takes `latency` seconds.
+    While `online` is False, requests are answered with 503, and the next `dropped_responses` requests are handled
+    but their connection is closed before answering. Authorizations are deduplicated by idempotency key. The gateway
+    records the captured and voided authorizations and the number of TCP connections accepted.
+    """
+
+    def __init__(self, latency: float = 0.0, declined_amounts: frozenset = frozenset()):
+        """
+        Initialize the gateway.
+
+        Args:
+            latency (float): The time each request takes in seconds.
+            declined_amounts (frozenset): The amounts to decline, in pence.
+        """
+        self.latency = latency
+        self.declined_amounts = declined_amounts
+        self.online = True
+        self.dropped_responses = 0
+        self.authorized = {}  # Authorization ID -> amount
+        self._responses = {}  # Idempotency key -> authorization response
+        self.captured = []
+        self.voided = []
+        self.capture_requests = 0
+        self.connections = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self, address: tuple = ("127.0.0.1", 0)) -> tuple:
+        """
+        Start serving on a background thread.
+
+        Args:
+            address (tuple): The (host, port) address to listen on.
+
+        Returns:
+            tuple: The address actually bound, useful when port 0 is requested.
+        """
+        self._server = ThreadingHTTPServer(address, self._handler_class())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self._server.server_address
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, path: str, body: dict) -> dict:
+        """
+        Handle a gateway request.
+
+        Args:
+            path (str): The request path.
+            body (dict): The request body.
+
+        Returns:
+            dict: The response body.
+        """
+        time.sleep(self.latency)
+        with self._lock:
+            if path == "/authorizations":
+                key = body.get("idempotency_key")
+                if key in self._responses:
+                    return self._responses[key]
+                if body["amount"] in self.declined_amounts:
+                    response = {"approved": False, "reason": "insufficient funds"}
+                else:
+                    authorization_id = f"auth-{next(self._ids)}"
+                    self.authorized[authorization_id] = body["amount"]
+                    response = {"approved": True, "id": authorization_id}
+                if key is not None:
+                    self._responses[key] = response
+                return response
+            elif path == "/captures":
+                self.captured.extend(body["ids"])
+                self.capture_requests += 1
+                return {"captured": len(body["ids"])}
+            elif path == "/voids":
+                self.voided.append(body["id"])
+                return {"voided": True}
+            return {"error": f"unknown path {path}"}
+
+    def _handler_class(self) -> type:
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive
+            disable_nagle_algorithm = True  # Headers and body are written separately
+
+            def setup(self):
+                super().setup()
+                with gateway._lock:
+                    gateway.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if not gateway.online:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                response = json.dumps(gateway._handle(self.path, body)).encode()
+                with gateway._lock:
+                    dropped = gateway.dropped_responses > 0
+                    gateway.dropped_responses -= dropped
+                if dropped:
+                    self.close_connection = True  # As if the connection failed before the response was sent
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass  # Keep test output quiet
+
+        return Handler
@@ -0,0 +1,293 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .currency import Currency
+from .product import Product
+
+if TYPE_CHECKING:
+    from .machine import VendingMachine
+
+_DENOMINATIONS = np.array(Currency.DENOMINATIONS)
+
+
+def _poisson_survival(means: np.ndarray, max_count: int) -> np.ndarray:
+    """
+    Compute P(X > k) for k = 0..max_count for Poisson variables.
+
+    Args:
+        means (np.ndarray): The Poisson means, of any shape.
+        max_count (int): The largest count to compute.
+
+    Returns:
+        np.ndarray: The survival probabilities, with shape `means.shape + (max_count + 1,)`.
+    """
+    factors = np.empty(means.shape + (max_count + 1,))
+    factors[..., 0] = np.exp(-means)
+    factors[..., 1:] = means[..., None] / np.arange(1, max_count + 1)
+    pmf = np.cumprod(factors, axis=-1)
+    return np.clip(1.0 - np.cumsum(pmf, axis=-1), 0.0, 1.0)
+
+
+class FloatPlan:
+    """The planned float of every change tube across a fleet of machines."""
+
+    def __init__(self, current: np.ndarray, targets: np.ndarray, failure_probability: np.ndarray):
+        """
+        Initialize the plan.
+
+        Args:
+            current (np.ndarray): The current counts, shape (machines, denominations).
+            targets (np.ndarray): The planned counts, shape (machines, denominations).
+            failure_probability (np.ndarray): The predicted probability, per machine, that a tube runs out
+                                              before the next visit.
+        """
+        self.current = current
+        self.targets = targets
+        self.failure_probability = failure_probability
+
+    @property
+    def reloads(self) -> np.ndarray:
+        return self.targets - self.current
+
+    def for_machine(self, index: int) -> dict[int, int]:
+        """
+        Return the reload plan of a single machine.
+
+        Args:
+            index (int): The index of the machine in the fleet arrays.
+
+        Returns:
+            dict: Denominations as keys and the counts to reload as values, ready for
+                  `VendingMachine.reload_currencies`.
+        """
+        return {int(denom): int(count) for denom, count in zip(_DENOMINATIONS, self.reloads[index]) if count}
+
+
+class FloatPlanner:
+    """
+    Plans the change float of every tube for a fleet of machines at once.
+
+    Coin demand per tube until the next visit is modelled as Poisson, with the mean taken from historical change
+    per sale. The planner minimises the sum over tubes of the probability that the tube runs out (an upper bound on
+    the probability of a `calculate_change` failure) within a float budget, using a per-machine Lagrange multiplier
+    found by vectorised bisection. Tubes are never planned below their current count, since coins cannot be
+    removed by a reload, nor above `Currency.MAX_DENOMINATION_COUNT`.
+    """
+
+    def __init__(self, max_count: int = Currency.MAX_DENOMINATION_COUNT, iterations: int = 40):
+        """
+        Initialize the planner.
+
+        Args:
+            max_count (int): The capacity of every tube.
+            iterations (int): The number of bisection steps used to meet the budget.
+        """
+        self.max_count = max_count
+        self.iterations = iterations
+
+    def plan(self,
+             change_vectors: np.ndarray,
+             sales: np.ndarray,
+             current_counts: np.ndarray,
+             expected_sales: np.ndarray,
+             budget=Currency.INITIAL_DENOMINATION_COUNT * sum(Currency.DENOMINATIONS)) -> FloatPlan:
+        """
+        Plan the float of every tube.
+
+        Args:
+            change_vectors (np.ndarray): Historical change per session, shape (machines, sessions, denominations),
+                                         in `Currency.DENOMINATIONS` order, e.g. the `counts` of the change
+                                         vectors returned by `calculate_change`; zero rows can be used as padding.
+            sales (np.ndarray): The number of sales in the history of each machine, shape (machines,).
+            current_counts (np.ndarray): The current tube counts, shape (machines, denominations).
+            expected_sales (np.ndarray): The expected number of sales until the next visit, shape (machines,).
+            budget: The maximum total float value in pence, per machine or as a scalar.
+
+        Returns:
+            FloatPlan: The planned tube counts.
+        """
+        change_vectors = np.abs(np.asarray(change_vectors, dtype=float))
+        sales = np.asarray(sales, dtype=float)
+        current = np.asarray(current_counts, dtype=np.int64)
+        budget = np.broadcast_to(np.asarray(budget, dtype=float), sales.shape)
+
+        usage_per_sale = change_vectors.sum(axis=1) / np.maximum(sales, 1.0)[:, None]
+        demand = usage_per_sale * np.asarray(expected_sales, dtype=float)[:, None]
+        survival = _poisson_survival(demand, self.max_count)  # (machines, denominations, counts)
+
+        counts = np.arange(self.max_count + 1)
+        coin_cost = _DENOMINATIONS[:, None] * counts  # Value of k coins of each denomination
+        below_current = counts < current[..., None]
+
+        # A coin never reduces the objective by more than 1 while costing at least 1p, so the optimal
+        # multiplier lies in [0, 1]. Each bisection step is evaluated for the whole fleet at once.
+        low = np.zeros(sales.shape)
+        high = np.ones(sales.shape)
+        for _ in range(self.iterations):
+            middle = (low + high) / 2
+            over_budget = self._choose(survival, coin_cost, below_current, middle) @ _DENOMINATIONS > budget
+            low = np.where(over_budget, middle, low)
+            high = np.where(over_budget, high, middle)
+        targets = self._choose(survival, coin_cost, below_current, high)
+
+        tube_survival = np.take_along_axis(survival, targets[..., None], axis=-1)[..., 0]
+        failure_probability = 1.0 - np.prod(1.0 - tube_survival, axis=-1)
+        return FloatPlan(current, targets, failure_probability)
+
+    @staticmethod
+    def _choose(survival: np.ndarray, coin_cost: np.ndarray, below_current: np.ndarray,
+                multiplier: np.ndarray) -> np.ndarray:
+        """
+        Choose the count of every tube minimising run-out probability plus the multiplier times its value.
+
+        Args:
+            survival (np.ndarray): Run-out probabilities, shape (machines, denominations, counts).
+            coin_cost (np.ndarray): The value of each count, shape (denominations, counts).
+            below_current (np.ndarray): Mask of the counts below the current ones.
+            multiplier (np.ndarray): The Lagrange multiplier of each machine, shape (machines,).
+
+        Returns:
+            np.ndarray: The chosen counts, shape (machines, denominations).
+        """
+        objective = survival + multiplier[:, None, None] * coin_cost
+        objective[below_current] = np.inf
+        return objective.argmin(axis=-1)
+
+
+def stock_levels(machines: list["VendingMachine"], product_ids: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Collect the current stock and capacity of every product across machines, for `RestockPlanner.plan`.
+
+    Products a machine does not carry have neither stock nor capacity, so they are never restocked.
+
+    Args:
+        machines (list): The vending machines, in the order of the machine axis.
+        product_ids (list): The product IDs, in the order of the product axis.
+
+    Returns:
+        tuple: The current stock and the capacities, both of shape (machines, products).
+    """
+    stock = np.zeros((len(machines), len(product_ids)), dtype=np.int16)
+    capacities = np.zeros_like(stock)
+    columns = {product_id: column for column, product_id in enumerate(product_ids)}
+    for row, vending_machine in enumerate(machines):
+        for product in vending_machine.snapshot().products:
+            if product.id in columns:
+                stock[row, columns[product.id]] = product.quantity
+        for product_id, capacity in vending_machine.get_capacities().items():
+            if product_id in columns:
+                capacities[row, columns[product_id]] = capacity
+    return stock, capacities
+
+
+class RestockPlan:
+    """The planned restock quantity of every product across a fleet of machines."""
+
+    def __init__(self, product_ids: list[int], forecast: np.ndarray, quantities: np.ndarray):
+        """
+        Initialize the plan.
+
+        Args:
+            product_ids (list): The product IDs, in the order of the product axis.
+            forecast (np.ndarray): The forecast demand until the next visit, shape (machines, products).
+            quantities (np.ndarray): The quantities to restock, shape (machines, products).
+        """
+        self.product_ids = list(product_ids)
+        self.forecast = forecast
+        self.quantities = quantities
+
+    @property
+    def needs_restock(self) -> np.ndarray:
+        return self.quantities > 0
+
+    def for_machine(self, index: int) -> dict[int, int]:
+        """
+        Return the restock plan of a single machine.
+
+        Args:
+            index (int): The index of the machine in the fleet arrays.
+
+        Returns:
+            dict: Product IDs as keys and the quantities to pass to `VendingMachine.reload_product` as values.
+        """
+        return {product_id: int(quantity)
+                for product_id, quantity in zip(self.product_ids, self.quantities[index]) if quantity}
+
+
+class RestockPlanner:
+    """
+    Plans product restocks for a fleet of machines from their sales history.
+
+    Daily demand of every product in every machine is forecast with an exponentially weighted mean and variance,
+    computed for the whole fleet as a single weighted reduction over the history axis. A product is restocked up
+    to its forecast demand until the next visit plus a safety stock, never above its capacity in that machine, e.g.
+    the total capacity of its slots (`Product.MAX_QUANTITY` unless given). The fleet is processed in chunks of
+    machines so memory stays bounded for large fleets.
+    """
+
+    def __init__(self, smoothing: float = 0.2, safety_factor: float = 1.65, chunk_size: int = 4096):
+        """
+        Initialize the planner.
+
+        Args:
+            smoothing (float): The exponential smoothing factor; higher values favour recent days.
+            safety_factor (float): The number of standard deviations of demand kept as safety stock.
+            chunk_size (int): The number of machines processed at once.
+        """
+        if not 0 < smoothing <= 1:
+            raise ValueError("Smoothing must be in (0, 1].")
+        self.smoothing = smoothing
+        self.safety_factor = safety_factor
+        self.chunk_size = chunk_size
+
+    def plan(self,
+             product_ids: list[int],
+             sales_history: np.ndarray,
+             current_stock: np.ndarray,
+             days_until_visit,
+             capacities: np.ndarray = None) -> RestockPlan:
+        """
+        Plan the restock of every product.
+
+        Args:
+            product_ids (list): The product IDs, in the order of the product axis.
+            sales_history (np.ndarray): Daily sales, oldest first, shape (machines, products, days).
+            current_stock (np.ndarray): The current stock, shape (machines, products).
+            days_until_visit: The number of days until the next visit, per machine or as a scalar.
+            capacities (np.ndarray): The maximum stock of every product, shape (machines, products) or (products,),
+                                     e.g. from `stock_levels`. Defaults to `Product.MAX_QUANTITY`.
+
+        Returns:
+            RestockPlan: The planned restock quantities.
+        """
+        sales_history = np.asarray(sales_history)
+        current_stock = np.asarray(current_stock)
+        if capacities is None:
+            capacities = Product.MAX_QUANTITY
+        capacities = np.broadcast_to(np.asarray(capacities, dtype=np.float32), current_stock.shape)
+        machine_count = sales_history.shape[0]
+        days = np.broadcast_to(np.asarray(days_until_visit, dtype=np.float32), (machine_count,))
+
+        history_length = sales_history.shape[-1]
+        weights = self.smoothing * (1 - self.smoothing) ** np.arange(history_length - 1, -1, -1)
+        if history_length:  # Without history the empty weights forecast no demand
+            weights /= weights.sum()
+        weights = weights.astype(np.float32)
+
+        forecast = np.empty(current_stock.shape, dtype=np.float32)
+        quantities = np.empty(current_stock.shape, dtype=np.int16)
+        for start in range(0, machine_count, self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            history = sales_history[chunk].astype(np.float32)
+            mean = history @ weights
+            variance = np.maximum((history * history) @ weights - mean * mean, 0.0)
+
+            chunk_days = days[chunk, None]
+            demand = mean * chunk_days
+            required = np.ceil(demand + self.safety_factor * np.sqrt(variance * chunk_days))
+            target = np.minimum(required, capacities[chunk])
+            forecast[chunk] = demand
+            quantities[chunk] = np.maximum(target - current_stock[chunk], 0)
+
+        return RestockPlan(product_ids, forecast, quantities)
@@ -0,0 +1,109 @@
+import json
+from typing import TYPE_CHECKING, NamedTuple
+
+from .currency import Currency
+from .utils import validate_id, validate_name, validate_price
+
+if TYPE_CHECKING:
+    from .inventory import Inventory
+
+
+class PlannedProduct(NamedTuple):
+    """A product in a planogram; its stock is carried over from the machine, not planned."""
+    id: int
+    name: str
+    price: int
+    slots: tuple = ()  # Capacities of the slots (spirals) holding the product; empty for a single spiral
+
+
+class Planogram(NamedTuple):
+    """The lineup and pricing of a vending machine, and the coins it accepts."""
+    products: tuple[PlannedProduct, ...]
+    accepted_denominations: tuple = Currency.DENOMINATIONS
+
+
+class PreparedPlanogram(NamedTuple):
+    """A validated planogram with the inventory built for it, ready to be swapped in."""
+    planogram: Planogram
+    inventory: "Inventory"
+    base_version: int  # The version of the live inventory the new one was built from
+    removed: tuple  # The IDs of the products no longer stocked
+
+
+def validate_planogram(planogram: Planogram) -> Planogram:
+    """
+    Validate a planogram.
+
+    Args:
+        planogram (Planogram): The planogram to validate.
+
+    Returns:
+        Planogram: The planogram, with the accepted denominations in `Currency.DENOMINATIONS` order.
+
+    Raises:
+        TypeError: If a product field has the wrong type.
+        ValueError: If a product is invalid or listed twice, a slot capacity is not positive, or no valid
+                    denominations are accepted.
+    """
+    product_ids = set()
+    for product in planogram.products:
+        validate_id(product.id)
+        validate_name(product.name)
+        validate_price(product.price)
+        if product.id in product_ids:
+            raise ValueError(f"Product with ID {product.id} is listed twice.")
+        product_ids.add(product.id)
+        if any(not isinstance(capacity, int) or capacity <= 0 for capacity in product.slots):
+            raise ValueError(f"Slot capacities of product {product.id} must be positive integers.")
+    accepted = set(planogram.accepted_denominations)
+    if not accepted or not accepted <= set(Currency.DENOMINATIONS):
+        raise ValueError(f"Accepted denominations must be a non-empty subset of {Currency.DENOMINATIONS}.")
+    return planogram._replace(accepted_denominations=tuple(denom for denom in Currency.DENOMINATIONS
+                                                           if denom in accepted))
+
+
+def parse_planogram(data: dict) -> Planogram:
+    """
+    Create a validated planogram from its JSON representation.
+
+    Args:
+        data (dict): The planogram, e.g. `{"products": [{"id": 1, "name": "Soda", "price": 120, "slots": [10, 10]}],
+                     "accepted_denominations": [200, 100, 50, 20, 10]}`. Slots and accepted denominations are
+                     optional.
+
+    Returns:
+        Planogram: The planogram.
+
+    Raises:
+        ValueError: If the planogram is invalid.
+    """
+    try:
+        products = tuple(PlannedProduct(product["id"], product["name"], product["price"],
+                                        tuple(product.get("slots", ())))
+                         for product in data["products"])
+        planogram = Planogram(products, tuple(data.get("accepted_denominations", Currency.DENOMINATIONS)))
+        return validate_planogram(planogram)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid planogram: {e!r}") from e
+
+
+def load_planogram(path: str) -> Planogram:
+    """
+    Load a planogram from a JSON file.
+
+    Args:
+        path (str): The path of the planogram file.
+
+    Returns:
+        Planogram: The validated planogram.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        ValueError: If the file is not valid JSON or the planogram is invalid.
+    """
+    with open(path, encoding="utf-8") as planogram_file:
+        try:
+            data = json.load(planogram_file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid planogram file {path}: {e}") from e
+    return parse_planogram(data)
@@ -1,3 +1,6 @@
+import json
+
+from .snapshot import ProductSnapshot, VersionConflict, VersionCounter
 from .utils import validate_id, validate_name, validate_price, validate_quantity
 
 
@@ -19,6 +22,12 @@ class Product:
         self._name = validate_name(name)
         self._price = validate_price(price)
         self._quantity = validate_quantity(quantity)
+        self._capacity = Product.MAX_QUANTITY
+        self._version = 0  # Incremented whenever the product changes
+        self._counter = None  # The version of the live inventory, incremented along with the product's
+        self._rendered = None  # Cached string representation
+        self._rendered_json = None  # Cached JSON representation
+        self._snapshot = None  # Cached immutable view
 
     @property
     def id(self) -> int:
@@ -36,6 +45,91 @@ class Product:
     def quantity(self) -> int:
         return self._quantity
 
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def set_capacity(self, capacity: int):
+        """
+        Set the maximum stock of the product, e.g. the total capacity of its slots.
+
+        Args:
+            capacity (int): The new maximum stock quantity.
+
+        Raises:
+            ValueError: If the product currently holds more stock than the new capacity.
+        """
+        validate_quantity(capacity)
+        if capacity < self._quantity:
+            raise ValueError(f"Capacity ({capacity}) is below the current stock ({self._quantity}).")
+        self._capacity = capacity
+
+    @classmethod
+    def from_snapshot(cls, snapshot: ProductSnapshot) -> "Product":
+        """
+        Create a product holding the state of a snapshot, at the snapshot's version.
+
+        Args:
+            snapshot (ProductSnapshot): The state to restore.
+
+        Returns:
+            Product: The restored product.
+        """
+        product = cls(snapshot.id, snapshot.name, snapshot.price, snapshot.quantity)
+        product._version = snapshot.version
+        return product
+
+    def track(self, counter: VersionCounter) -> None:
+        """
+        Increment a counter, e.g. the version of the live inventory, whenever the product changes.
+
+        A product follows a single counter: tracking another one, e.g. when a planogram's inventory is swapped in,
+        stops incrementing the previous one.
+
+        Args:
+            counter (VersionCounter): The counter to increment.
+        """
+        self._counter = counter
+
+    def ensure_version(self, expected: int) -> None:
+        """
+        Ensure the product has not changed since the caller read its version.
+
+        The check is only meaningful if nothing can change the product before the caller's mutation, so
+        `VendingMachine` makes both while holding its lock.
+
+        Args:
+            expected (int): The version the caller read.
+
+        Raises:
+            VersionConflict: If the product is at a different version.
+        """
+        if expected != self._version:
+            raise VersionConflict(f"product {self._id}", expected, self._version)
+
+    def revise(self, name: str, price: int) -> "Product":
+        """
+        Return a copy of the product with a new name and price, leaving this product unchanged.
+
+        The copy keeps the stock and capacity and is one version ahead, so conditional operations against the old
+        version are rejected.
+
+        Args:
+            name (str): The new name.
+            price (int): The new price in pence.
+
+        Returns:
+            Product: The revised copy.
+        """
+        product = Product(self._id, name, price, self._quantity)
+        product._capacity = self._capacity
+        product._version = self._version + 1
+        return product
+
     def increase_quantity(self, amount: int):
         """
         Increase the stock of the product by a specified amount.
@@ -48,9 +142,10 @@ class Product:
         """
         validate_quantity(amount)
         new_quantity = self._quantity + amount
-        if new_quantity > Product.MAX_QUANTITY:
+        if new_quantity > self._capacity:
             raise ValueError("Cannot exceed maximum stock quantity.")
         self._quantity = new_quantity
+        self._touch()
 
     def reduce_quantity(self, amount: int = 1):
         """
@@ -66,6 +161,42 @@ class Product:
         if amount > self._quantity:
             raise ValueError(f"Not enough stock ({self._quantity}) to reduce by that amount ({amount}).")
         self._quantity -= amount
+        self._touch()
+
+    def to_json(self) -> str:
+        """
+        Return the JSON representation of the product, rendered only when the product has changed.
+
+        Returns:
+            str: A JSON object with the product's ID, name, price, quantity and version.
+        """
+        if self._rendered_json is None:
+            self._rendered_json = json.dumps(
+                {"id": self._id, "name": self._name, "price": self._price, "quantity": self._quantity,
+                 "version": self._version})
+        return self._rendered_json
+
+    def snapshot(self) -> ProductSnapshot:
+        """
+        Return an immutable view of the product, created only when the product has changed.
+
+        Returns:
+            ProductSnapshot: The product at its current version.
+        """
+        if self._snapshot is None:
+            self._snapshot = ProductSnapshot(self._id, self._name, self._price, self._quantity, self._version)
+        return self._snapshot
+
+    def _touch(self) -> None:
+        """Record a change to the product and drop its cached representations."""
+        self._version += 1
+        if self._counter is not None:
+            self._counter.value += 1
+        self._rendered = None
+        self._rendered_json = None
+        self._snapshot = None
 
     def __str__(self):
-        return f"{self._name} (ID: {self._id}) - Price: {self._price}p, Stock: {self._quantity}"
+        if self._rendered is None:
+            self._rendered = f"{self._name} (ID: {self._id}) - Price: {self._price}p, Stock: {self._quantity}"
+        return self._rendered
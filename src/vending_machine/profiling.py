@@ -0,0 +1,270 @@
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "VENDING_MACHINE_PROFILE"  # Profiling mode, e.g. VENDING_MACHINE_PROFILE=sampling
+PROFILE_OUTPUT_ENV = "VENDING_MACHINE_PROFILE_OUTPUT"
+DEFAULT_PROFILE_OUTPUT = "vending_machine_profile.folded"
+
+# Profiling modes
+DETERMINISTIC = "cprofile"  # Every call is recorded by cProfile
+SAMPLING = "sampling"  # The stack is sampled periodically by a background thread
+MODES = (DETERMINISTIC, SAMPLING)
+
+
+def split_profile_options(argv: list[str], environ=os.environ) -> tuple:
+    """
+    Take the profiling options out of the command line, falling back to the environment.
+
+    Args:
+        argv (list): The command line arguments, possibly including `--profile MODE` and `--profile-output PATH`.
+        environ: The environment variables.
+
+    Returns:
+        tuple: The profiling mode (None if profiling is off), the output path, and the remaining arguments.
+
+    Raises:
+        ValueError: If an option has no value or the mode is unknown.
+    """
+    mode = environ.get(PROFILE_ENV) or None
+    output = environ.get(PROFILE_OUTPUT_ENV) or DEFAULT_PROFILE_OUTPUT
+    remaining = []
+    arguments = iter(argv)
+    for argument in arguments:
+        option, separator, value = argument.partition("=")
+        if option in ("--profile", "--profile-output"):
+            value = value if separator else next(arguments, None)
+            if not value:
+                raise ValueError(f"Option {option} requires a value.")
+            if option == "--profile":
+                mode = value
+            else:
+                output = value
+        else:
+            remaining.append(argument)
+    if mode is not None and mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {mode!r}. Expected one of {MODES}.")
+    return mode, output, remaining
+
+
+class OperationTimings:
+    """Low-overhead wall-clock timing of named operations: a counter and two additions per call."""
+
+    def __init__(self):
+        """Initialize empty timings."""
+        self._timings = {}  # Operation name -> [calls, total ns, max ns]
+
+    def wrap(self, name: str, function):
+        """
+        Wrap a function so every call is timed under a name.
+
+        Args:
+            name (str): The operation name.
+            function: The function to time.
+
+        Returns:
+            The timed function.
+        """
+        timing = self._timings.setdefault(name, [0, 0, 0])
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                timing[0] += 1
+                timing[1] += elapsed
+                if elapsed > timing[2]:
+                    timing[2] = elapsed
+        return timed
+
+    def instrument(self, target, prefix: str = None) -> None:
+        """
+        Time every public method of an object, e.g. a `VendingMachine`, by wrapping it on the instance.
+
+        Args:
+            target: The object to instrument.
+            prefix (str): The prefix of the operation names. Defaults to the class name.
+        """
+        prefix = prefix or type(target).__name__
+        for name in dir(type(target)):
+            if name.startswith("_") or isinstance(getattr(type(target), name), property):
+                continue
+            method = getattr(target, name)
+            if callable(method):
+                setattr(target, name, self.wrap(f"{prefix}.{name}", method))
+
+    def summary(self) -> list[tuple]:
+        """
+        Summarise the timings of the operations called at least once.
+
+        Returns:
+            list: (name, calls, total seconds, mean seconds, max seconds) tuples, slowest total first.
+        """
+        rows = [(name, calls, total / 1e9, total / calls / 1e9, longest / 1e9)
+                for name, (calls, total, longest) in self._timings.items() if calls]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+class Profiler:
+    """
+    Profiles a session and writes its stacks in collapsed format ("frame;frame;frame count" lines), ready for
+    flamegraph tools.
+
+    In `DETERMINISTIC` mode cProfile records every call; the stacks are rebuilt from its caller/callee times and the
+    raw statistics are also written next to the output with a `.pstats` suffix. In `SAMPLING` mode a background
+    thread samples the profiled thread's stack at a fixed interval, which keeps the overhead low enough for field
+    units. In both modes `timings` collects per-operation wall-clock times.
+    """
+
+    def __init__(self, mode: str, output: str = DEFAULT_PROFILE_OUTPUT, interval: float = 0.005):
+        """
+        Initialize the profiler.
+
+        Args:
+            mode (str): `DETERMINISTIC` or `SAMPLING`.
+            output (str): The path of the collapsed stacks file.
+            interval (float): The sampling interval in seconds.
+
+        Raises:
+            ValueError: If the mode is unknown.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}. Expected one of {MODES}.")
+        self.mode = mode
+        self.output = output
+        self.interval = interval
+        self.timings = OperationTimings()
+        self._profile = None
+        self._samples = Counter()  # Collapsed stack -> sample count
+        self._sampler = None
+        self._stopped = threading.Event()
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start profiling the calling thread."""
+        if self.mode == DETERMINISTIC:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = threading.Thread(target=self._sample_loop, args=(threading.get_ident(),), daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        """Stop profiling, write the collapsed stacks and log the operation timings."""
+        if self.mode == DETERMINISTIC:
+            self._profile.disable()
+            stats = pstats.Stats(self._profile)
+            stats.dump_stats(f"{self.output}.pstats")
+            stacks = _collapse_cprofile(stats.stats)
+        else:
+            self._stopped.set()
+            self._sampler.join()
+            stacks = self._samples
+        with open(self.output, "w", encoding="utf-8") as output:
+            for stack, weight in sorted(stacks.items()):
+                output.write(f"{stack} {weight}\n")
+        for name, calls, total, mean, longest in self.timings.summary():
+            logger.info(f"{name}: {calls} calls, total {total * 1e3:.3f} ms, mean {mean * 1e6:.1f} us, "
+                        f"max {longest * 1e6:.1f} us")
+        logger.info(f"Profile written to {self.output}.")
+
+    def _sample_loop(self, thread_id: int) -> None:
+        """
+        Sample the stack of a thread until stopped.
+
+        Args:
+            thread_id (int): The identifier of the thread to sample.
+        """
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self._samples[";".join(reversed(stack))] += 1
+
+
+def _label(filename: str, line: int, name: str) -> str:
+    """
+    Format a stack frame for a collapsed stack.
+
+    Args:
+        filename (str): The file of the function.
+        line (int): The first line of the function.
+        name (str): The function name.
+
+    Returns:
+        str: The frame label, without the frame separator of the collapsed format.
+    """
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ":")
+
+
+def _collapse_cprofile(stats: dict, max_depth: int = 64) -> Counter:
+    """
+    Rebuild collapsed stacks from cProfile statistics.
+
+    cProfile only records caller/callee pairs, so the time of a function is split between the paths reaching it:
+    each caller gets the share of the function's cumulative time spent in calls from it, and a path the share of
+    its caller's paths scaled by that. The own time of every function is therefore counted once in total, in
+    microseconds. Recursive calls are folded into the outermost call, and paths worth less than a microsecond are
+    not expanded, so the number of stacks stays bounded.
+
+    Args:
+        stats (dict): The `pstats.Stats.stats` mapping.
+        max_depth (int): The maximum stack depth.
+
+    Returns:
+        Counter: Collapsed stack -> microseconds of own time.
+    """
+    callees = {}  # Caller -> [(callee, share of the callee's time spent in calls from that caller)]
+    roots = []
+    for function, (_, _, _, _, callers) in stats.items():
+        callers = {caller: edge for caller, edge in callers.items() if caller != function}
+        if not callers:
+            roots.append(function)
+            continue
+        cumulative = sum(edge[3] for edge in callers.values())
+        calls = sum(edge[1] for edge in callers.values())
+        for caller, (_, call_count, _, caller_cumulative) in callers.items():
+            if cumulative:
+                share = caller_cumulative / cumulative
+            else:
+                share = call_count / calls if calls else 1 / len(callers)
+            callees.setdefault(caller, []).append((function, share))
+    stacks = Counter()
+
+    def descend(function, path: list, labels: list, fraction: float) -> None:
+        _, _, own_time, cumulative, _ = stats[function]
+        labels.append(_label(*function))
+        weight = round(own_time * fraction * 1e6)
+        if weight:
+            stacks[";".join(labels)] += weight
+        if len(labels) < max_depth and cumulative * fraction >= 1e-6:
+            for callee, share in callees.get(function, ()):
+                if callee not in path:
+                    path.append(callee)
+                    descend(callee, path, labels, fraction * share)
+                    path.pop()
+        labels.pop()
+
+    for function in roots:
+        descend(function, [function], [], 1.0)
+    return stacks
@@ -0,0 +1,211 @@
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+from .currency import Currency
+from .events import (CASH, ChangeDispensed, ChangeRestored, CoinInserted, CurrencyReloaded, ProductPurchased,
+                     PurchaseRefunded)
+
+_DENOMINATIONS = np.array(Currency.DENOMINATIONS)
+# Maps every possible journal denomination to its column; unknown denominations go to an extra, ignored column
+_DENOMINATION_INDEX = np.full(np.iinfo(np.uint16).max + 1, len(Currency.DENOMINATIONS))
+_DENOMINATION_INDEX[_DENOMINATIONS] = np.arange(len(Currency.DENOMINATIONS))
+
+# Journal record kinds
+INSERTED = 1  # `count` coins of `denom` added to the stored money
+PURCHASED = 2  # A product sold for `amount` pence in cash, or refunded for a negative amount
+CHANGE = 3  # `count` coins of `denom` taken from the tubes as a negative count, or put back as a positive one
+RELOADED = 4  # `count` coins of `denom` added to the tubes by an operator
+
+JOURNAL_DTYPE = np.dtype([("machine", "<u4"), ("kind", "u1"), ("denom", "<u2"), ("count", "<i4"), ("amount", "<i4")])
+
+
+def journal_records(machine: int, events: Iterable) -> np.ndarray:
+    """
+    Convert the events published by a vending machine to journal records.
+
+    Args:
+        machine (int): The index of the machine in the fleet arrays.
+        events (Iterable): The events, e.g. a batch received from an `EventBus` subscription.
+
+    Returns:
+        np.ndarray: The records, with dtype `JOURNAL_DTYPE`. Events not affecting cash, including cashless
+                    sales, are skipped.
+    """
+    rows = []
+    for event in events:
+        if isinstance(event, CoinInserted):
+            rows.append((machine, INSERTED, event.denom, 1, 0))
+        elif isinstance(event, ProductPurchased) and event.payment == CASH:
+            rows.append((machine, PURCHASED, 0, 0, event.price))
+        elif isinstance(event, PurchaseRefunded):
+            rows.append((machine, PURCHASED, 0, 0, -event.price))
+        elif isinstance(event, ChangeDispensed):
+            rows.extend((machine, CHANGE, denom, -count, 0) for denom, count in event.change.items())
+        elif isinstance(event, ChangeRestored):
+            rows.extend((machine, CHANGE, denom, count, 0) for denom, count in event.change.items())
+        elif isinstance(event, CurrencyReloaded):
+            rows.extend((machine, RELOADED, denom, count, 0) for denom, count in event.counts.items())
+    return np.array(rows, dtype=JOURNAL_DTYPE)
+
+
+def read_journal(path: str, chunk_records: int = 1 << 20) -> Iterator[np.ndarray]:
+    """
+    Read a binary journal file (records written with `ndarray.tofile`) in fixed-size chunks.
+
+    Args:
+        path (str): The path of the journal file.
+        chunk_records (int): The number of records per chunk.
+
+    Yields:
+        np.ndarray: The next chunk of records, with dtype `JOURNAL_DTYPE`.
+    """
+    with open(path, "rb") as journal:
+        while True:
+            chunk = np.fromfile(journal, dtype=JOURNAL_DTYPE, count=chunk_records)
+            if not len(chunk):
+                return
+            yield chunk
+
+
+class Reconciliation:
+    """The end-of-day cash discrepancies of every machine in a fleet; positive values are surpluses."""
+
+    def __init__(self, tube_discrepancies: np.ndarray, inserted_discrepancies: np.ndarray,
+                 cash_discrepancies: np.ndarray):
+        """
+        Initialize the result.
+
+        Args:
+            tube_discrepancies (np.ndarray): Observed minus expected tube counts, shape (machines, denominations).
+            inserted_discrepancies (np.ndarray): Observed minus expected stored money counts,
+                                                 shape (machines, denominations).
+            cash_discrepancies (np.ndarray): Observed minus expected cash taken in pence, shape (machines,).
+        """
+        self.tube_discrepancies = tube_discrepancies
+        self.inserted_discrepancies = inserted_discrepancies
+        self.cash_discrepancies = cash_discrepancies
+
+    @property
+    def flagged(self) -> np.ndarray:
+        return np.flatnonzero(self.tube_discrepancies.any(axis=1) | self.inserted_discrepancies.any(axis=1)
+                              | (self.cash_discrepancies != 0))
+
+    def for_machine(self, index: int) -> dict[str, dict[int, int]]:
+        """
+        Return the discrepancies of a single machine.
+
+        Args:
+            index (int): The index of the machine in the fleet arrays.
+
+        Returns:
+            dict: The non-zero tube and stored money discrepancies, by denomination.
+        """
+        return {
+            "denomination_counts": {int(denom): int(count) for denom, count
+                                    in zip(_DENOMINATIONS, self.tube_discrepancies[index]) if count},
+            "inserted_money": {int(denom): int(count) for denom, count
+                               in zip(_DENOMINATIONS, self.inserted_discrepancies[index]) if count},
+        }
+
+
+class CashReconciler:
+    """
+    Reconciles the cash of a fleet of machines against their journals.
+
+    Journal chunks are folded into per-machine, per-denomination totals as they are fed, so memory depends on the
+    fleet size only, never on the journal length, and every chunk is processed with a few vectorised reductions.
+    The expected state (opening counts plus journalled changes) is then compared with the observed closing
+    `denomination_counts` and `inserted_money` of every machine, and the cash taken with the sales revenue.
+    """
+
+    def __init__(self, machine_count: int):
+        """
+        Initialize empty totals.
+
+        Args:
+            machine_count (int): The number of machines in the fleet.
+        """
+        self.machine_count = machine_count
+        cells = machine_count * (len(Currency.DENOMINATIONS) + 1)
+        self._inserted = np.zeros(cells, dtype=np.int64)
+        self._tubes = np.zeros(cells, dtype=np.int64)
+        self._reloaded = np.zeros(cells, dtype=np.int64)
+        self._revenue = np.zeros(machine_count, dtype=np.int64)
+
+    def feed(self, records: np.ndarray) -> None:
+        """
+        Add a chunk of journal records to the totals.
+
+        Args:
+            records (np.ndarray): The records, with dtype `JOURNAL_DTYPE`, in any machine order.
+        """
+        machines = records["machine"].astype(np.int64)
+        kinds = records["kind"]
+        cells = machines * (len(Currency.DENOMINATIONS) + 1) + _DENOMINATION_INDEX[records["denom"]]
+        counts = records["count"].astype(np.int64)
+        size = self._inserted.size
+        self._inserted += self._total(cells, counts, kinds == INSERTED, size)
+        self._tubes += self._total(cells, counts, (kinds == CHANGE) | (kinds == RELOADED), size)
+        self._reloaded += self._total(cells, counts, kinds == RELOADED, size)
+        self._revenue += self._total(machines, records["amount"].astype(np.int64), kinds == PURCHASED,
+                                     self.machine_count)
+
+    def feed_all(self, chunks: Iterable[np.ndarray]) -> None:
+        """
+        Add a stream of journal chunks to the totals, e.g. from `read_journal`.
+
+        Args:
+            chunks (Iterable): The chunks of records.
+        """
+        for chunk in chunks:
+            self.feed(chunk)
+
+    def reconcile(self, opening_counts: np.ndarray, opening_inserted: np.ndarray, closing_counts: np.ndarray,
+                  closing_inserted: np.ndarray, balance_change=0) -> Reconciliation:
+        """
+        Compare the journalled totals with the observed change in every machine's currency.
+
+        Args:
+            opening_counts (np.ndarray): Tube counts at the start of the day, shape (machines, denominations), in
+                                         `Currency.DENOMINATIONS` order.
+            opening_inserted (np.ndarray): Stored money counts at the start of the day, same shape.
+            closing_counts (np.ndarray): Tube counts at the end of the day, same shape.
+            closing_inserted (np.ndarray): Stored money counts at the end of the day, same shape.
+            balance_change: The change in customer balance over the day, per machine or as a scalar, for sessions
+                            still open at either end.
+
+        Returns:
+            Reconciliation: The discrepancies of every machine.
+        """
+        shape = (self.machine_count, len(Currency.DENOMINATIONS) + 1)
+        inserted = self._inserted.reshape(shape)
+        tubes = self._tubes.reshape(shape)
+        reloaded = self._reloaded.reshape(shape)
+        opening_counts = np.asarray(opening_counts, dtype=np.int64)
+        closing_counts = np.asarray(closing_counts, dtype=np.int64)
+        opening_inserted = np.asarray(opening_inserted, dtype=np.int64)
+        closing_inserted = np.asarray(closing_inserted, dtype=np.int64)
+
+        tube_discrepancies = closing_counts - opening_counts - tubes[:, :-1]
+        inserted_discrepancies = closing_inserted - opening_inserted - inserted[:, :-1]
+        observed_cash = ((closing_inserted - opening_inserted + closing_counts - opening_counts - reloaded[:, :-1])
+                         @ _DENOMINATIONS)
+        expected_cash = self._revenue + np.asarray(balance_change, dtype=np.int64)
+        return Reconciliation(tube_discrepancies, inserted_discrepancies, observed_cash - expected_cash)
+
+    @staticmethod
+    def _total(cells: np.ndarray, values: np.ndarray, mask: np.ndarray, size: int) -> np.ndarray:
+        """
+        Sum the masked values per cell.
+
+        Args:
+            cells (np.ndarray): The cell of every record.
+            values (np.ndarray): The value of every record.
+            mask (np.ndarray): Which records to include.
+            size (int): The number of cells.
+
+        Returns:
+            np.ndarray: The total per cell.
+        """
+        return np.bincount(cells[mask], weights=values[mask], minlength=size).astype(np.int64)
@@ -0,0 +1,644 @@
+import logging
+import socket
+import struct
+import threading
+from datetime import date
+
+from .change import ChangeVector
+from .currency import Currency
+from .machine import VendingMachine
+from .planogram import Planogram, PlannedProduct, PreparedPlanogram
+from .events import EventBus
+from .inventory import SoldUnit
+from .product import Product
+from .snapshot import ProductSnapshot
+from .storage import SQLiteStorage
+
+logger = logging.getLogger(__name__)
+
+# Record opcodes of the replication log
+OP_BALANCE = 1  # Balance delta
+OP_COINS = 2  # Denomination count delta
+OP_INSERTED = 3  # One coin added to the stored money
+OP_STOCK = 4  # Product quantity delta, sold from or reloaded to the slots and lots like on the primary
+OP_PRODUCT = 5  # Product added, with its capacity and version
+OP_COUNTS = 6  # Absolute denomination counts, stored money and tube versions (snapshots only)
+OP_PLANOGRAM = 7  # Planogram swapped in (product records of the new lineup follow)
+OP_LOT = 8  # Dated stock, either reloaded or (on snapshots) already counted in the product quantity
+OP_SLOTS = 9  # Full state of a product's slots, e.g. after an assignment or a jam report (slot records follow)
+OP_RETURN = 10  # Refunded unit returned to the slot and lot it was sold from
+
+_FRAME = struct.Struct("<II")  # Sequence number, payload length
+_BALANCE = struct.Struct("<Bi")
+_COIN = struct.Struct("<BHh")
+_STOCK = struct.Struct("<BIh")
+_PRODUCT = struct.Struct("<BIIHHIH")  # ID, price, quantity, capacity, version, name length (name bytes follow)
+_PLANOGRAM = struct.Struct("<BBB")  # Product count, accepted denominations bitmask
+_LOT = struct.Struct("<BIIH?")  # Product ID, expiry (proleptic Gregorian ordinal), quantity, stock added
+_SLOTS = struct.Struct("<BIB")  # Product ID, slot count
+_SLOT = struct.Struct("<HHI?")  # Capacity, quantity, vends, jammed
+_RETURN = struct.Struct("<BIHI")  # Product ID, slot index + 1 (0 without slots), expiry ordinal (0 if undated)
+# Counts, stored money (never reset, so wider) and tube versions per denomination
+_COUNTS = struct.Struct(f"<B{len(Currency.DENOMINATIONS)}H{len(Currency.DENOMINATIONS)}Q{len(Currency.DENOMINATIONS)}I")
+
+
+class PrimaryVendingMachine(VendingMachine):
+    """
+    A vending machine that streams its state changes to replica processes.
+
+    Every mutation appends compact binary delta records to an in-memory log while holding the state lock;
+    a background sender thread ships the log to all connected replicas in sequence-numbered frames. A replica
+    that connects receives a snapshot of the full state first, followed by the deltas made after it. Slot states and
+    dated lots are replicated too, and snapshots carry the product and tube versions, so a promoted replica sells
+    from the same slots and lots and accepts the same conditional operations. While no replica is connected, nothing
+    is logged.
+    """
+
+    def __init__(self, storage: SQLiteStorage = None, events: EventBus = None):
+        """
+        Initialize the primary vending machine.
+
+        Args:
+            storage (SQLiteStorage): Optional storage backend to restore the state from and persist it to.
+            events (EventBus): The bus to publish state change events on. A new one is created if omitted.
+        """
+        super().__init__(storage, events)
+        self._changed = threading.Condition(self._lock)
+        self._log = bytearray()
+        self._sequence = 0
+        self._streaming = False  # True once a replica has connected
+        self._joining = []  # Sockets waiting for their snapshot
+        self._replicas = []  # Sockets receiving deltas (used by the sender thread only)
+        self._sending = False
+        self._server = None
+        self._closed = False
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def serve(self, address: tuple = ("127.0.0.1", 0)) -> tuple:
+        """
+        Start accepting replica connections.
+
+        Args:
+            address (tuple): The (host, port) address to listen on.
+
+        Returns:
+            tuple: The address actually bound, useful when port 0 is requested.
+        """
+        self._server = socket.create_server(address)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._send_loop, daemon=True).start()
+        return self._server.getsockname()
+
+    def flush(self, timeout: float = None) -> int:
+        """
+        Wait until all logged changes have been sent to the replicas.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            int: The sequence number of the last frame sent.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: not (self._log or self._joining or self._sending), timeout)
+            return self._sequence
+
+    def close(self) -> None:
+        """Stop serving and disconnect all replicas."""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        if self._server is not None:
+            self._server.close()
+
+    def add_product(self, product: Product) -> None:
+        with self._locked():
+            super().add_product(product)
+            if self._streaming:
+                self._append(_encode_product(product))
+
+    def insert_money(self, denom: int) -> None:
+        with self._locked():
+            super().insert_money(denom)
+            if self._streaming:
+                self._append(_BALANCE.pack(OP_BALANCE, denom) + _COIN.pack(OP_INSERTED, denom, 1))
+
+    def purchase_product(self, product_id: int, expected_version: int = None) -> SoldUnit:
+        with self._locked():
+            balance = self._balance
+            unit = super().purchase_product(product_id, expected_version)
+            if self._streaming:
+                self._append(_BALANCE.pack(OP_BALANCE, self._balance - balance)
+                             + _STOCK.pack(OP_STOCK, product_id, -1))
+            return unit
+
+    def _sell_cashless(self, product_id: int, price: int) -> None:
+        with self._locked():  # Only held to commit the sale, not during the authorization
+            super()._sell_cashless(product_id, price)
+            if self._streaming:
+                self._append(_STOCK.pack(OP_STOCK, product_id, -1))
+
+    def dispense_change(self) -> ChangeVector:
+        with self._locked():
+            balance = self._balance
+            change = super().dispense_change()
+            if self._streaming:
+                self._append(_BALANCE.pack(OP_BALANCE, -balance)
+                             + b"".join(_COIN.pack(OP_COINS, denom, -count) for denom, count in change.items()))
+            return change
+
+    def refund_purchase(self, product_id: int, price: int, unit: SoldUnit = None) -> None:
+        with self._locked():
+            super().refund_purchase(product_id, price, unit)
+            if self._streaming:
+                slot, expiry = unit if unit is not None else (None, None)
+                self._append(_BALANCE.pack(OP_BALANCE, price)
+                             + _RETURN.pack(OP_RETURN, product_id, slot + 1 if slot is not None else 0,
+                                            expiry.toordinal() if expiry is not None else 0))
+
+    def restore_change(self, change: ChangeVector) -> None:
+        with self._locked():
+            super().restore_change(change)
+            if self._streaming:
+                self._append(_BALANCE.pack(OP_BALANCE, change.total)
+                             + b"".join(_COIN.pack(OP_COINS, denom, count) for denom, count in change.items()))
+
+    def reload_product(self, product_id: int, quantity: int, expiry: date = None,
+                       expected_version: int = None) -> None:
+        with self._locked():
+            super().reload_product(product_id, quantity, expiry, expected_version)
+            if self._streaming:
+                if expiry is not None:
+                    self._append(_LOT.pack(OP_LOT, product_id, expiry.toordinal(), quantity, True))
+                else:
+                    self._append(_STOCK.pack(OP_STOCK, product_id, quantity))
+
+    def assign_slots(self, product_id: int, capacities: list[int]) -> None:
+        with self._locked():
+            super().assign_slots(product_id, capacities)
+            if self._streaming:
+                self._append(_encode_slots(product_id, self.get_slots(product_id)))
+
+    def report_jam(self, product_id: int, index: int, jammed: bool = True) -> None:
+        with self._locked():
+            super().report_jam(product_id, index, jammed)
+            if self._streaming:
+                self._append(_encode_slots(product_id, self.get_slots(product_id)))
+
+    def reload_currency(self, denom: int, count: int, expected_version: int = None) -> None:
+        with self._locked():
+            super().reload_currency(denom, count, expected_version)
+            if self._streaming:
+                self._append(_COIN.pack(OP_COINS, denom, count))
+
+    def reload_currencies(self, counts: dict[int, int], expected_versions: dict[int, int] = None) -> None:
+        with self._locked():
+            super().reload_currencies(counts, expected_versions)
+            if self._streaming:
+                self._append(b"".join(_COIN.pack(OP_COINS, denom, count) for denom, count in counts.items()))
+
+    def apply_planogram(self, prepared: PreparedPlanogram) -> None:
+        with self._locked():
+            super().apply_planogram(prepared)
+            if self._streaming:
+                self._append(_encode_planogram(self._accepted_denominations, self._inventory.products)
+                             + b"".join(_encode_slots(product.id, self.get_slots(product.id))
+                                        for product in self._inventory.products))
+
+    def _append(self, records: bytes) -> None:
+        """
+        Append records to the log and wake up the sender. Must be called with the lock held.
+
+        Args:
+            records (bytes): The encoded records.
+        """
+        self._log += records
+        self._changed.notify_all()
+
+    def _encode_snapshot(self) -> bytes:
+        """
+        Encode the full state as records. Must be called with the lock held.
+
+        Returns:
+            bytes: The encoded records.
+        """
+        counts = self._currency.denomination_counts
+        inserted = self._currency.inserted_money
+        versions = self._currency.tube_versions
+        records = [_COUNTS.pack(OP_COUNTS,
+                                *(counts[denom] for denom in Currency.DENOMINATIONS),
+                                *(inserted.get(denom, 0) for denom in Currency.DENOMINATIONS),
+                                *(versions[denom] for denom in Currency.DENOMINATIONS)),
+                   _BALANCE.pack(OP_BALANCE, self._balance)]
+        records.extend(_encode_product(product) for product in self._inventory.products)
+        if self._accepted_denominations != Currency.DENOMINATIONS:  # Restricted by a planogram
+            records.append(_encode_planogram(self._accepted_denominations, self._inventory.products))
+        for product in self._inventory.products:
+            slots = self.get_slots(product.id)
+            if slots:
+                records.append(_encode_slots(product.id, slots))
+            records.extend(_LOT.pack(OP_LOT, product.id, lot.expiry.toordinal(), lot.quantity, False)
+                           for lot in self.get_lots(product.id))
+        return b"".join(records)
+
+    def _apply(self, payload: bytes) -> None:
+        """
+        Apply encoded records to this machine in order. Must be called with the lock held.
+
+        Args:
+            payload (bytes): The encoded records.
+        """
+        offset = 0
+        while offset < len(payload):
+            opcode = payload[offset]
+            if opcode == OP_BALANCE:
+                _, delta = _BALANCE.unpack_from(payload, offset)
+                self._balance += delta
+                offset += _BALANCE.size
+            elif opcode == OP_COINS:
+                _, denom, delta = _COIN.unpack_from(payload, offset)
+                self._currency.update_denomination_count(denom, delta)
+                offset += _COIN.size
+            elif opcode == OP_INSERTED:
+                _, denom, _ = _COIN.unpack_from(payload, offset)
+                self._currency.insert_to_storage(denom)
+                offset += _COIN.size
+            elif opcode == OP_STOCK:
+                _, product_id, delta = _STOCK.unpack_from(payload, offset)
+                for _ in range(-delta):
+                    self._inventory.reduce_stock(product_id)
+                if delta > 0:
+                    self._inventory.reload_product(product_id, delta)
+                offset += _STOCK.size
+            elif opcode == OP_LOT:
+                _, product_id, expiry, quantity, added = _LOT.unpack_from(payload, offset)
+                if added:
+                    self._inventory.reload_product(product_id, quantity, date.fromordinal(expiry))
+                else:
+                    self._inventory.add_lot(product_id, date.fromordinal(expiry), quantity)
+                offset += _LOT.size
+            elif opcode == OP_SLOTS:
+                _, product_id, count = _SLOTS.unpack_from(payload, offset)
+                offset += _SLOTS.size
+                slots = [_SLOT.unpack_from(payload, offset + i * _SLOT.size) for i in range(count)]
+                offset += count * _SLOT.size
+                self._inventory.load_slots(product_id, slots)
+            elif opcode == OP_RETURN:
+                _, product_id, slot, expiry = _RETURN.unpack_from(payload, offset)
+                self._inventory.return_unit(product_id, slot - 1 if slot else None,
+                                            date.fromordinal(expiry) if expiry else None)
+                offset += _RETURN.size
+            elif opcode == OP_PRODUCT:
+                (id_, name, price, quantity, capacity, version), offset = _decode_product(payload, offset)
+                product = Product.from_snapshot(ProductSnapshot(id_, name, price, quantity, version))
+                product.set_capacity(capacity)
+                self._inventory.add_product(product)
+            elif opcode == OP_PLANOGRAM:
+                _, count, mask = _PLANOGRAM.unpack_from(payload, offset)
+                offset += _PLANOGRAM.size
+                products = []
+                stocked = {product.id for product in self._inventory.products}
+                for _ in range(count):
+                    (id_, name, price, *_), offset = _decode_product(payload, offset)
+                    # Keep the current slots; the primary's follow as slot records
+                    slots = tuple(slot.capacity for slot in self.get_slots(id_)) if id_ in stocked else ()
+                    products.append(PlannedProduct(id_, name, price, slots))
+                accepted = tuple(denom for bit, denom in enumerate(Currency.DENOMINATIONS) if mask >> bit & 1)
+                prepared = self.prepare_planogram(Planogram(tuple(products), accepted))
+                VendingMachine.apply_planogram(self, prepared)  # The lock is already held
+            elif opcode == OP_COUNTS:
+                values = _COUNTS.unpack_from(payload, offset)[1:]
+                denom_count = len(Currency.DENOMINATIONS)
+                self._currency.load_counts(dict(zip(Currency.DENOMINATIONS, values[:denom_count])),
+                                           {denom: count for denom, count in
+                                            zip(Currency.DENOMINATIONS, values[denom_count:2 * denom_count])
+                                            if count},
+                                           dict(zip(Currency.DENOMINATIONS, values[2 * denom_count:])))
+                offset += _COUNTS.size
+            else:
+                raise ValueError(f"Unknown replication opcode {opcode}.")
+
+    def _accept_loop(self) -> None:
+        """Accept replica connections until the server is closed."""
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._changed:
+                self._streaming = True
+                self._joining.append(connection)
+                self._changed.notify_all()
+
+    def _send_loop(self) -> None:
+        """Ship logged deltas to the replicas and snapshots to newly connected ones."""
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._log or self._joining or self._closed)
+                if self._closed:
+                    break
+                frames = []
+                if self._log:
+                    self._sequence += 1
+                    frames.append(_FRAME.pack(self._sequence, len(self._log)) + self._log)
+                    self._log = bytearray()
+                joining, self._joining = self._joining, []
+                snapshot = b""
+                if joining:
+                    try:
+                        snapshot = self._encode_snapshot()
+                    except (struct.error, ValueError):  # A value out of range must not kill the sender
+                        logger.exception("Encoding the replication snapshot failed; disconnecting %d replicas.",
+                                         len(joining))
+                        for replica in joining:
+                            replica.close()
+                        joining = []
+                self._sending = True
+
+            try:
+                for frame in frames:
+                    self._replicas = [replica for replica in self._replicas if _send(replica, frame)]
+                for replica in joining:
+                    if _send(replica, _FRAME.pack(self._sequence, len(snapshot)) + snapshot):
+                        self._replicas.append(replica)
+            finally:
+                with self._changed:
+                    self._sending = False
+                    self._changed.notify_all()
+
+        for replica in self._replicas:
+            replica.close()
+
+
+class Replica:
+    """
+    A read-only copy of a primary vending machine, kept up to date over a socket.
+
+    The first frame received is a snapshot of the primary's state; later frames are applied in sequence order.
+    A frame out of order, or one that cannot be applied, is logged and the replica reconnects to start over from a
+    new snapshot. When the primary dies, the replica can be promoted to a primary of its own.
+    """
+
+    def __init__(self, address: tuple):
+        """
+        Connect to a primary and start applying its changes.
+
+        Args:
+            address (tuple): The (host, port) address of the primary.
+        """
+        self._address = address
+        self._machine = PrimaryVendingMachine()
+        self._applied = threading.Condition()
+        self._sequence = None
+        self._primary_alive = True
+        self._promoted = False
+        self._socket = socket.create_connection(address)
+        self._thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    @property
+    def primary_alive(self) -> bool:
+        return self._primary_alive
+
+    @property
+    def balance(self) -> int:
+        with self._applied:
+            return self._machine.balance
+
+    def list_products(self) -> list:
+        """
+        List all products in the replicated inventory.
+
+        Returns:
+            list: A list of string representations of all products.
+        """
+        with self._applied:
+            return self._machine.list_products()
+
+    def get_denomination_counts(self) -> dict:
+        """
+        Get the replicated counts of all denominations in the currency storage.
+
+        Returns:
+            dict: A dictionary with denominations as keys and counts as values.
+        """
+        with self._applied:
+            return self._machine.get_denomination_counts()
+
+    def get_stored_money(self) -> dict:
+        """
+        Get the replicated counts of the money inserted by users.
+
+        Returns:
+            dict: A dictionary with denominations as keys and counts as values.
+        """
+        with self._applied:
+            return self._machine.get_stored_money()
+
+    def get_valid_denominations(self) -> tuple:
+        """
+        Get the replicated denominations accepted by the machine.
+
+        Returns:
+            tuple: The accepted denominations, largest first.
+        """
+        with self._applied:
+            return self._machine.get_valid_denominations()
+
+    def wait_for(self, sequence: int, timeout: float = None) -> bool:
+        """
+        Wait until the frame with the given sequence number has been applied.
+
+        Args:
+            sequence (int): The sequence number to wait for.
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the frame was applied, False on timeout or if the primary died first.
+        """
+        with self._applied:
+            self._applied.wait_for(
+                lambda: (self._sequence is not None and self._sequence >= sequence) or not self._primary_alive,
+                timeout)
+            return self._sequence is not None and self._sequence >= sequence
+
+    def promote(self) -> PrimaryVendingMachine:
+        """
+        Stop replicating and return the replicated machine so it can serve as the new primary.
+
+        Returns:
+            PrimaryVendingMachine: The machine holding the replicated state.
+        """
+        with self._applied:  # Not while resynchronizing, which replaces the socket
+            self._promoted = True
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # The primary already closed the connection
+            self._socket.close()
+        self._thread.join()
+        return self._machine
+
+    def _receive_loop(self) -> None:
+        """Receive frames and apply them until the connection is closed."""
+        try:
+            while True:
+                header = _receive_exactly(self._socket, _FRAME.size)
+                sequence, length = _FRAME.unpack(header)
+                payload = _receive_exactly(self._socket, length)
+                with self._applied:
+                    try:
+                        if self._sequence is not None and sequence != self._sequence + 1:
+                            raise ValueError(f"Replication frame {sequence} out of order after {self._sequence}.")
+                        with self._machine._locked():
+                            self._machine._apply(payload)
+                        failed = False
+                    except (ValueError, TypeError, struct.error):
+                        logger.exception("Replication frame %d could not be applied; resynchronizing.", sequence)
+                        failed = True
+                    else:
+                        self._sequence = sequence
+                        self._applied.notify_all()
+                if failed:
+                    self._resync()
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            with self._applied:
+                self._primary_alive = False
+                self._applied.notify_all()
+
+    def _resync(self) -> None:
+        """
+        Drop the replicated state and reconnect to the primary, which sends a new snapshot. The connection is made
+        without holding the condition, so readers and `promote` are not blocked while the primary is slow to answer.
+
+        Raises:
+            ConnectionError: If the replica has been promoted meanwhile.
+            OSError: If the primary cannot be reached.
+        """
+        with self._applied:
+            self._socket.close()
+            if self._promoted:
+                raise ConnectionError("Replica promoted.")
+            self._machine = PrimaryVendingMachine()
+            self._sequence = None
+        connection = socket.create_connection(self._address)
+        with self._applied:
+            if self._promoted:
+                connection.close()
+                raise ConnectionError("Replica promoted.")
+            self._socket = connection
+
+
+def _encode_product(product: Product) -> bytes:
+    """
+    Encode a product addition record.
+
+    Args:
+        product (Product): The product to encode.
+
+    Returns:
+        bytes: The encoded record.
+    """
+    name = product.name.encode()
+    return _PRODUCT.pack(OP_PRODUCT, product.id, product.price, product.quantity, product.capacity, product.version,
+                         len(name)) + name
+
+
+def _decode_product(payload: bytes, offset: int) -> tuple:
+    """
+    Decode a product addition record.
+
+    Args:
+        payload (bytes): The encoded records.
+        offset (int): The offset of the record.
+
+    Returns:
+        tuple: The product's (ID, name, price, quantity, capacity, version), and the offset of the next record.
+    """
+    _, id_, price, quantity, capacity, version, name_length = _PRODUCT.unpack_from(payload, offset)
+    offset += _PRODUCT.size
+    name = payload[offset:offset + name_length].decode()
+    return (id_, name, price, quantity, capacity, version), offset + name_length
+
+
+def _encode_slots(product_id: int, slots: list) -> bytes:
+    """
+    Encode a slots record.
+
+    Args:
+        product_id (int): The ID of the product.
+        slots (list): The slots of the product; empty if it has none.
+
+    Returns:
+        bytes: The encoded record, followed by a slot record per slot.
+    """
+    return _SLOTS.pack(OP_SLOTS, product_id, len(slots)) + b"".join(
+        _SLOT.pack(slot.capacity, slot.quantity, slot.vends, slot.jammed) for slot in slots)
+
+
+def _encode_planogram(accepted_denominations: tuple, products: list[Product]) -> bytes:
+    """
+    Encode a planogram record. Slot capacities are sent as separate slots records.
+
+    Args:
+        accepted_denominations (tuple): The denominations accepted under the planogram.
+        products (list): The products of the new inventory.
+
+    Returns:
+        bytes: The encoded record, followed by a product record per product.
+    """
+    mask = sum(1 << bit for bit, denom in enumerate(Currency.DENOMINATIONS)
+               if denom in accepted_denominations)
+    return _PLANOGRAM.pack(OP_PLANOGRAM, len(products), mask) + b"".join(map(_encode_product, products))
+
+
+def _send(connection: socket.socket, frame: bytes) -> bool:
+    """
+    Send a frame to a replica, closing the connection if it fails.
+
+    Args:
+        connection (socket.socket): The replica connection.
+        frame (bytes): The frame to send.
+
+    Returns:
+        bool: True if the frame was sent, False if the replica is gone.
+    """
+    try:
+        connection.sendall(frame)
+        return True
+    except OSError:
+        connection.close()
+        return False
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    """
+    Receive exactly `size` bytes from a connection.
+
+    Args:
+        connection (socket.socket): The connection to read from.
+        size (int): The number of bytes to read.
+
+    Returns:
+        bytes: The bytes read.
+
+    Raises:
+        ConnectionError: If the connection is closed first.
+    """
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = connection.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Connection closed by the primary.")
+        buffer += chunk
+    return bytes(buffer)
@@ -0,0 +1,329 @@
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future
+from datetime import date
+from typing import NamedTuple
+
+from .machine import VendingMachine
+from .planogram import Planogram
+from .product import Product
+from .snapshot import VersionConflict
+
+# Priority classes, highest priority first
+CUSTOMER = "customer"  # Operations of a customer session
+MAINTENANCE = "maintenance"  # Restocking and configuration
+PRIORITIES = (CUSTOMER, MAINTENANCE)
+
+
+class LatencyMetrics(NamedTuple):
+    """Latency of the recent operations of one priority class, from submission to completion, in seconds."""
+    count: int
+    p50: float
+    p99: float
+    slo: float
+    slo_violations: int
+
+
+class LatencyTracker:
+    """Keeps the latencies of the most recent operations of one priority class against a latency SLO."""
+
+    def __init__(self, slo: float, window: int):
+        """
+        Initialize the tracker.
+
+        Args:
+            slo (float): The latency objective in seconds.
+            window (int): The number of recent latencies the percentiles are computed over.
+        """
+        self._slo = slo
+        self._latencies = deque(maxlen=window)
+        self._count = 0
+        self._violations = 0
+
+    def record(self, latency: float) -> None:
+        """
+        Record the latency of a completed operation.
+
+        Args:
+            latency (float): The latency in seconds.
+        """
+        self._latencies.append(latency)
+        self._count += 1
+        if latency > self._slo:
+            self._violations += 1
+
+    def metrics(self) -> LatencyMetrics:
+        """
+        Summarise the recorded latencies.
+
+        Returns:
+            LatencyMetrics: The operation and SLO violation counts since creation, and the percentiles of the
+                            recent latencies (0.0 while nothing has been recorded).
+        """
+        latencies = sorted(self._latencies)
+        return LatencyMetrics(self._count, _percentile(latencies, 0.5), _percentile(latencies, 0.99), self._slo,
+                              self._violations)
+
+
+class _Job:
+    """An operation waiting to run, as a sequence of small steps."""
+    __slots__ = ("priority", "steps", "future", "submitted", "result", "started")
+
+    def __init__(self, priority: str, steps: Iterable[Callable], future: Future):
+        self.priority = priority
+        self.steps = iter(steps)
+        self.future = future
+        self.submitted = time.perf_counter()
+        self.result = None
+        self.started = False
+
+
+class OperationScheduler:
+    """
+    Runs vending machine operations on a single worker thread, customer operations before maintenance.
+
+    Maintenance operations are split into small steps (one product or one denomination each). Between steps the
+    worker always runs queued customer operations first, so a bulk restock delays a customer by at most one step.
+    Operations are submitted from any thread and return a `Future`; the latency of every priority class is
+    tracked against its SLO.
+    """
+
+    def __init__(self, machine: VendingMachine, customer_slo: float = 0.05, maintenance_slo: float = 5.0,
+                 window: int = 1024):
+        """
+        Initialize the scheduler and start its worker.
+
+        Args:
+            machine (VendingMachine): The vending machine to run operations on.
+            customer_slo (float): The latency objective of customer operations in seconds.
+            maintenance_slo (float): The latency objective of maintenance operations in seconds.
+            window (int): The number of recent latencies per class the percentiles are computed over.
+        """
+        self._machine = machine
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._trackers = {CUSTOMER: LatencyTracker(customer_slo, window),
+                          MAINTENANCE: LatencyTracker(maintenance_slo, window)}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, priority: str, steps: Iterable[Callable]) -> Future:
+        """
+        Queue an operation made of steps, each a callable taking no arguments.
+
+        Args:
+            priority (str): The priority class, `CUSTOMER` or `MAINTENANCE`.
+            steps (Iterable): The steps, run in order; higher priority operations may run between them.
+
+        Returns:
+            Future: Resolves to the result of the last step, or to the first exception raised by a step, in which
+                    case the remaining steps are skipped.
+
+        Raises:
+            ValueError: If the priority is unknown or the scheduler is closed.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}. Expected one of {PRIORITIES}.")
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise ValueError("The scheduler is closed.")
+            self._queues[priority].append(_Job(priority, steps, future))
+            self._condition.notify()
+        return future
+
+    def insert_money(self, denom: int) -> Future:
+        """
+        Queue inserting money as a customer operation.
+
+        Args:
+            denom (int): The denomination inserted by the user, in pence.
+
+        Returns:
+            Future: Resolves once the money has been inserted.
+        """
+        return self.submit(CUSTOMER, [lambda: self._machine.insert_money(denom)])
+
+    def purchase_product(self, product_id: int) -> Future:
+        """
+        Queue a purchase as a customer operation.
+
+        Args:
+            product_id (int): The ID of the product to purchase.
+
+        Returns:
+            Future: Resolves once the product has been purchased.
+        """
+        return self.submit(CUSTOMER, [lambda: self._machine.purchase_product(product_id)])
+
+    def dispense_change(self) -> Future:
+        """
+        Queue dispensing change as a customer operation.
+
+        Returns:
+            Future: Resolves to the change dispensed.
+        """
+        return self.submit(CUSTOMER, [self._machine.dispense_change])
+
+    def add_products(self, product_list: list[Product]) -> Future:
+        """
+        Queue adding products, one product per step.
+
+        Args:
+            product_list (list): The products to add.
+
+        Returns:
+            Future: Resolves once all products have been added.
+        """
+        return self.submit(MAINTENANCE, [lambda product=product: self._machine.add_product(product)
+                                         for product in product_list])
+
+    def reload_products(self, quantities: dict[int, int], expiry: date = None) -> Future:
+        """
+        Queue reloading products, one product per step.
+
+        Args:
+            quantities (dict): Product IDs as keys and the quantities to add as values.
+            expiry (date): The sell-by date of the reloaded stock, if it has one.
+
+        Returns:
+            Future: Resolves once all products have been reloaded.
+        """
+        return self.submit(MAINTENANCE, [
+            lambda product_id=product_id, quantity=quantity: self._machine.reload_product(product_id, quantity, expiry)
+            for product_id, quantity in quantities.items()])
+
+    def reload_currencies(self, counts: dict[int, int]) -> Future:
+        """
+        Queue reloading denominations, one denomination per step.
+
+        Unlike `VendingMachine.reload_currencies`, denominations reloaded before an invalid one stay reloaded.
+
+        Args:
+            counts (dict): Denominations as keys and the quantities to add as values.
+
+        Returns:
+            Future: Resolves once all denominations have been reloaded.
+        """
+        return self.submit(MAINTENANCE, [lambda denom=denom, count=count: self._machine.reload_currency(denom, count)
+                                         for denom, count in counts.items()])
+
+    def reload_planogram(self, planogram: Planogram) -> Future:
+        """
+        Queue a planogram reload: one step validates and builds the new inventory, the next swaps it in.
+
+        If a customer operation changes the inventory between the two steps, the swap step prepares the
+        planogram again before swapping it in.
+
+        Args:
+            planogram (Planogram): The new products, prices, slot capacities and accepted denominations.
+
+        Returns:
+            Future: Resolves once the planogram has been swapped in.
+        """
+        prepared = []
+
+        def apply():
+            try:
+                self._machine.apply_planogram(prepared[0])
+            except VersionConflict:
+                self._machine.reload_planogram(planogram)
+
+        return self.submit(MAINTENANCE, [lambda: prepared.append(self._machine.prepare_planogram(planogram)), apply])
+
+    def metrics(self, priority: str) -> LatencyMetrics:
+        """
+        Return the latency metrics of a priority class.
+
+        Args:
+            priority (str): The priority class, `CUSTOMER` or `MAINTENANCE`.
+
+        Returns:
+            LatencyMetrics: The latency metrics.
+        """
+        with self._condition:
+            return self._trackers[priority].metrics()
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Stop accepting operations and wait for the queued ones to complete.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join(timeout)
+
+    def _next_job(self) -> _Job:
+        """
+        Wait for the highest priority queued job. Must be called with the condition held.
+
+        Returns:
+            _Job: The job, or None once closed and drained.
+        """
+        self._condition.wait_for(lambda: self._closed or any(self._queues.values()))
+        for priority in PRIORITIES:
+            if self._queues[priority]:
+                return self._queues[priority][0]
+        return None
+
+    def _run(self) -> None:
+        """Run one step at a time, always from the highest priority queue."""
+        while True:
+            with self._condition:
+                job = self._next_job()
+            if job is None:
+                return
+            if not job.started:
+                job.started = True
+                if not job.future.set_running_or_notify_cancel():  # Cancelled while queued
+                    with self._condition:
+                        self._queues[job.priority].popleft()
+                    continue
+            try:
+                step = next(job.steps, None)
+                done = step is None
+                if not done:
+                    job.result = step()
+            except Exception as e:
+                self._complete(job, exception=e)
+            else:
+                if done:
+                    self._complete(job)
+
+    def _complete(self, job: _Job, exception: Exception = None) -> None:
+        """
+        Remove a finished job from its queue, record its latency and resolve its future.
+
+        Args:
+            job (_Job): The finished job.
+            exception (Exception): The exception raised by the job, if any.
+        """
+        with self._condition:
+            self._queues[job.priority].popleft()
+            self._trackers[job.priority].record(time.perf_counter() - job.submitted)
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(job.result)
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    """
+    Return a percentile of sorted values using the nearest-rank method.
+
+    Args:
+        ordered (list): The values, sorted in ascending order.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The percentile, or 0.0 if there are no values.
+    """
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
@@ -0,0 +1,139 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from collections.abc import Callable
+
+from .product import Product
+
+# Ranks of the ways a name can match, best first
+EXACT = 0
+NAME_PREFIX = 1
+WORD_PREFIX = 2
+FUZZY = 3
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductSearchIndex:
+    """
+    Case-insensitive name search over products, maintained incrementally as products are added.
+
+    Prefix lookups use a sorted list of (word, product ID) pairs, so each keystroke of a search-as-you-type
+    query costs a binary search plus the matches. Fuzzy lookups (e.g. typos) score products by the trigrams their
+    names share with the query, using an inverted index from trigram to product IDs, and only run when the prefix
+    matches do not fill the requested number of results.
+    """
+
+    def __init__(self, min_similarity: float = 0.3):
+        """
+        Initialize an empty index.
+
+        Args:
+            min_similarity (float): The minimum trigram similarity (0 to 1) of a fuzzy match.
+        """
+        self.min_similarity = min_similarity
+        self._products = {}  # Product ID -> (product, normalized name)
+        self._words = []  # Sorted (word, product ID) pairs
+        self._trigrams = {}  # Trigram -> set of product IDs
+        self._trigram_counts = {}  # Product ID -> number of distinct trigrams in its name
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def add(self, product: Product) -> None:
+        """
+        Index a product by its name.
+
+        Args:
+            product (Product): The product to index.
+
+        Raises:
+            ValueError: If a product with the same ID is already indexed.
+        """
+        if product.id in self._products:
+            raise ValueError(f"Product with ID {product.id} is already indexed.")
+        name = _normalize(product.name)
+        self._products[product.id] = (product, name)
+        for word in set(name.split()):
+            insort(self._words, (word, product.id))
+        trigrams = _trigrams(name)
+        for trigram in trigrams:
+            self._trigrams.setdefault(trigram, set()).add(product.id)
+        self._trigram_counts[product.id] = len(trigrams)
+
+    def search(self, query: str, limit: int = 10, where: Callable[[Product], bool] = None) -> list[Product]:
+        """
+        Find the products whose names best match a query.
+
+        Products are ranked by how they match (exact name, name prefix, word prefix, then fuzzy by trigram
+        similarity) and then by name.
+
+        Args:
+            query (str): The text typed by the customer.
+            limit (int): The maximum number of products returned.
+            where (Callable): Optional filter, e.g. to return only products in stock.
+
+        Returns:
+            list: The matching products, best match first.
+        """
+        query = _normalize(query)
+        if not query or limit <= 0:
+            return []
+        ranked = {}  # Product ID -> (rank, tie-breaker, name)
+        for product_id in self._prefix_matches(query.split()[-1]):
+            product, name = self._products[product_id]
+            if all(word in name for word in query.split()[:-1]) and (where is None or where(product)):
+                rank = EXACT if name == query else NAME_PREFIX if name.startswith(query) else WORD_PREFIX
+                ranked[product_id] = (rank, 0.0, name)
+        if len(ranked) < limit:
+            for product_id, similarity in self._fuzzy_matches(query):
+                product, name = self._products[product_id]
+                if product_id not in ranked and (where is None or where(product)):
+                    ranked[product_id] = (FUZZY, -similarity, name)
+        best = sorted(ranked.items(), key=lambda item: item[1])[:limit]
+        return [self._products[product_id][0] for product_id, _ in best]
+
+    def _prefix_matches(self, prefix: str) -> set[int]:
+        """
+        Return the IDs of products with a word starting with a prefix.
+
+        Args:
+            prefix (str): The normalized prefix.
+
+        Returns:
+            set: The product IDs.
+        """
+        matches = set()
+        for index in range(bisect_left(self._words, (prefix,)), len(self._words)):
+            word, product_id = self._words[index]
+            if not word.startswith(prefix):
+                break
+            matches.add(product_id)
+        return matches
+
+    def _fuzzy_matches(self, query: str) -> list[tuple[int, float]]:
+        """
+        Return the products sharing enough trigrams with a query.
+
+        Args:
+            query (str): The normalized query.
+
+        Returns:
+            list: (product ID, similarity) pairs, where similarity is the Jaccard index of the trigram sets.
+        """
+        trigrams = _trigrams(query)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        matches = []
+        for product_id, count in shared.items():
+            similarity = count / (len(trigrams) + self._trigram_counts[product_id] - count)
+            if similarity >= self.min_similarity:
+                matches.append((product_id, similarity))
+        return matches
@@ -0,0 +1,330 @@
+import logging
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from datetime import date
+from typing import NamedTuple
+
+from .change import ChangeVector
+from .inventory import SoldUnit
+from .machine import VendingMachine
+from .payments import Authorization, PaymentProvider
+from .planogram import PreparedPlanogram
+from .product import Product
+from .snapshot import MachineSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Divergence(NamedTuple):
+    """An operation whose outcome on the candidate differed from the primary."""
+    operation: str
+    args: tuple
+    field: str  # "result", "error", "balance", "denomination_counts", "inserted_money" or "products"
+    primary: object
+    candidate: object
+    timestamp: float
+
+
+class ShadowStats(NamedTuple):
+    """Summary of the shadowed operations; latencies are medians over the recent window, in seconds."""
+    operations: int
+    divergences: int
+    desynchronized: bool  # True once operations had to be dropped, after which the candidate is no longer fed
+    primary_p50: float
+    candidate_p50: float
+    relative_latency: float  # Candidate over primary median latency
+
+
+class _SettledPayment(PaymentProvider):
+    """Stands in for the payment provider on the candidate, approving what the primary already charged."""
+
+    def authorize(self, amount: int) -> Authorization:
+        return Authorization("shadow", amount)
+
+    def capture(self, authorization: Authorization) -> None:
+        pass
+
+    def void(self, authorization: Authorization) -> None:
+        pass
+
+
+_SETTLED = _SettledPayment()
+
+
+class _Mirrored(NamedTuple):
+    """An operation run on the primary, waiting to be replayed on the candidate."""
+    operation: str
+    args: tuple
+    result: object
+    error: Exception
+    latency: float
+    snapshot: MachineSnapshot
+
+
+def _outcome(error: Exception) -> tuple:
+    """
+    Reduce an error to what is compared between the primary and the candidate.
+
+    Args:
+        error (Exception): The error raised by an operation, or None.
+
+    Returns:
+        tuple: The error type name and message, or None without an error.
+    """
+    return (type(error).__name__, str(error)) if error is not None else None
+
+
+def _comparable_result(result):
+    """
+    Reduce an operation's result to what is compared between the primary and the candidate.
+
+    Args:
+        result: The result of an operation.
+
+    Returns:
+        The result, or None for the slot and lot a unit was sold from, as a rebuilt candidate has no slots or lots.
+    """
+    return None if isinstance(result, SoldUnit) else result
+
+
+def _comparable(snapshot: MachineSnapshot) -> dict:
+    """
+    Reduce a snapshot to the state compared between the primary and the candidate, without version stamps.
+
+    Args:
+        snapshot (MachineSnapshot): The snapshot.
+
+    Returns:
+        dict: The compared fields.
+    """
+    return {
+        "balance": snapshot.balance,
+        "denomination_counts": dict(snapshot.denomination_counts),
+        "inserted_money": dict(snapshot.inserted_money),
+        "products": [(product.id, product.name, product.price, product.quantity) for product in snapshot.products],
+    }
+
+
+class ShadowedVendingMachine(VendingMachine):
+    """
+    A vending machine that mirrors its operations to a candidate implementation, e.g. new change or inventory
+    logic, to compare them on live traffic before cutting over.
+
+    Every mutating operation runs on this (primary) machine as usual; its result or error, its latency and an
+    immutable snapshot of the state afterwards are queued for a background worker, which replays the operation on
+    the candidate and records any difference in result, error or state along with both latencies. After a
+    divergence the candidate is rebuilt from the primary's snapshot, so each divergence is counted once rather than
+    carried into every later comparison; slot assignments and accepted denominations are not part of a snapshot
+    and start from their defaults on the rebuilt candidate. Each operation, its snapshot and its place in the queue
+    are taken under the primary's lock, so concurrent clients are replayed in the order the primary applied their
+    operations. The primary only pays for the snapshot and a queue append. If the candidate falls more than `capacity` operations behind,
+    shadowing stops rather than slowing down the primary, and the stats report the candidate as desynchronized.
+
+    Cashless purchases are replayed against a stand-in provider approving what the primary charged, so the
+    candidate never contacts the payment gateway. They are mirrored once the payment is authorized, as the primary
+    takes its lock only for the sale itself; declined payments leave the state unchanged and are not replayed.
+    """
+
+    def __init__(self, candidate_factory: Callable[[MachineSnapshot], VendingMachine] = VendingMachine.from_snapshot,
+                 storage=None, events=None, capacity: int = 4096, window: int = 1024, max_divergences: int = 256):
+        """
+        Initialize the machine and a candidate starting from the same state.
+
+        Args:
+            candidate_factory (Callable): Creates the candidate from a snapshot of the primary, e.g. the
+                                          `from_snapshot` class method of a `VendingMachine` subclass.
+            storage (SQLiteStorage): Optional storage backend of the primary.
+            events (EventBus): The bus the primary publishes events on.
+            capacity (int): The maximum number of operations waiting for the candidate.
+            window (int): The number of recent operations the latency medians are computed over.
+            max_divergences (int): The maximum number of divergences kept; the oldest are dropped.
+        """
+        super().__init__(storage, events)
+        self._candidate_factory = candidate_factory
+        self._candidate = candidate_factory(self.snapshot())
+        self._mirrored = queue.Queue(maxsize=capacity)
+        self._desynchronized = False
+        self._operations = 0
+        self._divergence_count = 0
+        self._divergences = deque(maxlen=max_divergences)
+        self._primary_latencies = deque(maxlen=window)
+        self._candidate_latencies = deque(maxlen=window)
+        self._stats_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._replay_loop, daemon=True)
+        self._worker.start()
+
+    @property
+    def divergences(self) -> list[Divergence]:
+        with self._stats_lock:
+            return list(self._divergences)
+
+    def stats(self) -> ShadowStats:
+        """
+        Summarise the shadowed operations replayed so far.
+
+        Returns:
+            ShadowStats: The operation and divergence counts and the relative latency.
+        """
+        with self._stats_lock:
+            primary = statistics.median(self._primary_latencies) if self._primary_latencies else 0.0
+            candidate = statistics.median(self._candidate_latencies) if self._candidate_latencies else 0.0
+            return ShadowStats(self._operations, self._divergence_count, self._desynchronized, primary, candidate,
+                               candidate / primary if primary else 0.0)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until the candidate has replayed every mirrored operation.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the queue was drained, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._mirrored.all_tasks_done:
+            while self._mirrored.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._mirrored.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        """Replay the queued operations and stop the worker."""
+        self._mirrored.put(None)
+        self._worker.join()
+
+    def add_product(self, product: Product) -> None:
+        # The candidate gets its own copy, as products are mutable
+        copy = Product.from_snapshot(product.snapshot()) if isinstance(product, Product) else product
+        self._shadow("add_product", (copy,), super().add_product, product)
+
+    def insert_money(self, denom: int) -> None:
+        self._shadow("insert_money", (denom,), super().insert_money, denom)
+
+    def purchase_product(self, product_id: int, expected_version: int = None) -> SoldUnit:
+        return self._shadow("purchase_product", (product_id, expected_version), super().purchase_product, product_id,
+                            expected_version)
+
+    def _sell_cashless(self, product_id: int, price: int) -> None:
+        self._shadow("purchase_cashless", (product_id, _SETTLED), super()._sell_cashless, product_id, price)
+
+    def dispense_change(self) -> ChangeVector:
+        return self._shadow("dispense_change", (), super().dispense_change)
+
+    def refund_purchase(self, product_id: int, price: int, unit: SoldUnit = None) -> None:
+        self._shadow("refund_purchase", (product_id, price, unit), super().refund_purchase, product_id, price, unit)
+
+    def restore_change(self, change: ChangeVector) -> None:
+        self._shadow("restore_change", (change,), super().restore_change, change)
+
+    def reload_product(self, product_id: int, quantity: int, expiry: date = None,
+                       expected_version: int = None) -> None:
+        self._shadow("reload_product", (product_id, quantity, expiry, expected_version), super().reload_product,
+                     product_id, quantity, expiry, expected_version)
+
+    def reload_currency(self, denom: int, count: int, expected_version: int = None) -> None:
+        self._shadow("reload_currency", (denom, count, expected_version), super().reload_currency, denom, count,
+                     expected_version)
+
+    def reload_currencies(self, counts: dict[int, int], expected_versions: dict[int, int] = None) -> None:
+        versions = dict(expected_versions) if expected_versions is not None else None
+        self._shadow("reload_currencies", (dict(counts), versions), super().reload_currencies, counts,
+                     expected_versions)
+
+    def assign_slots(self, product_id: int, capacities: list[int]) -> None:
+        self._shadow("assign_slots", (product_id, list(capacities)), super().assign_slots, product_id, capacities)
+
+    def report_jam(self, product_id: int, index: int, jammed: bool = True) -> None:
+        self._shadow("report_jam", (product_id, index, jammed), super().report_jam, product_id, index, jammed)
+
+    def apply_planogram(self, prepared: PreparedPlanogram) -> None:
+        # The prepared inventory belongs to the primary, so the candidate prepares its own
+        self._shadow("reload_planogram", (prepared.planogram,), super().apply_planogram, prepared)
+
+    def _shadow(self, operation: str, candidate_args: tuple, method, *args):
+        """
+        Run an operation on the primary and queue it for the candidate, holding the primary's lock throughout.
+
+        Args:
+            operation (str): The name of the operation.
+            candidate_args (tuple): The arguments to replay the operation with on the candidate.
+            method: The primary's implementation of the operation.
+            *args: The arguments of the primary's call.
+
+        Returns:
+            The result of the primary's operation.
+        """
+        with self._locked():
+            start = time.perf_counter()
+            result, error = None, None
+            try:
+                result = method(*args)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                latency = time.perf_counter() - start
+                if not self._desynchronized:
+                    try:
+                        self._mirrored.put_nowait(_Mirrored(operation, candidate_args, result, error, latency,
+                                                            self.snapshot()))
+                    except queue.Full:
+                        self._desynchronized = True
+                        logger.warning("Shadow candidate fell behind; shadowing stopped.")
+
+    def _replay_loop(self) -> None:
+        """Replay mirrored operations on the candidate until closed."""
+        while True:
+            mirrored = self._mirrored.get()
+            try:
+                if mirrored is None:
+                    return
+                self._replay(mirrored)
+            except Exception:
+                logger.exception("Replaying %s on the shadow candidate failed.", mirrored.operation)
+            finally:
+                self._mirrored.task_done()
+
+    def _replay(self, mirrored: _Mirrored) -> None:
+        """
+        Replay an operation on the candidate and record how it compares with the primary.
+
+        Args:
+            mirrored (_Mirrored): The operation and its outcome on the primary.
+        """
+        result, error = None, None
+        start = time.perf_counter()
+        try:
+            result = getattr(self._candidate, mirrored.operation)(*mirrored.args)
+        except Exception as e:
+            error = e
+        latency = time.perf_counter() - start
+
+        differences = []
+        if _outcome(error) != _outcome(mirrored.error):
+            differences.append(("error", _outcome(mirrored.error), _outcome(error)))
+        elif _comparable_result(result) != _comparable_result(mirrored.result):
+            differences.append(("result", mirrored.result, result))
+        primary_state = _comparable(mirrored.snapshot)
+        candidate_state = _comparable(self._candidate.snapshot())
+        differences.extend((field, primary_state[field], candidate_state[field]) for field in primary_state
+                           if primary_state[field] != candidate_state[field])
+        if differences:  # Resync, so later operations are compared from the same state again
+            self._candidate = self._candidate_factory(mirrored.snapshot)
+
+        now = time.time()
+        with self._stats_lock:
+            self._operations += 1
+            self._primary_latencies.append(mirrored.latency)
+            self._candidate_latencies.append(latency)
+            if differences:
+                self._divergence_count += 1
+                self._divergences.extend(Divergence(mirrored.operation, mirrored.args, field, primary, candidate, now)
+                                         for field, primary, candidate in differences)
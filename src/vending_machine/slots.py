@@ -0,0 +1,169 @@
+from .utils import validate_quantity
+
+
+class Slot:
+    """A physical spiral holding units of one product."""
+    __slots__ = ("index", "capacity", "quantity", "vends", "jammed")
+
+    def __init__(self, index: int, capacity: int):
+        """
+        Initialize an empty slot.
+
+        Args:
+            index (int): The position of the slot among the slots of its product.
+            capacity (int): The number of units the spiral holds.
+        """
+        self.index = index
+        self.capacity = capacity
+        self.quantity = 0
+        self.vends = 0  # Motor cycles so far, used to spread wear
+        self.jammed = False
+
+    def __repr__(self):
+        return (f"Slot(index={self.index}, capacity={self.capacity}, quantity={self.quantity}, vends={self.vends}, "
+                f"jammed={self.jammed})")
+
+
+class SlotBank:
+    """
+    The slots holding one product.
+
+    The number of units that can be vended (in slots that are not jammed) is kept as a running total updated by
+    every vend, reload and jam report, so availability checks never look at the individual slots.
+    """
+
+    def __init__(self, capacities: list[int]):
+        """
+        Initialize empty slots.
+
+        Args:
+            capacities (list): The capacity of every slot.
+
+        Raises:
+            ValueError: If no slots are given or a capacity is not positive.
+        """
+        if not capacities:
+            raise ValueError("A product needs at least one slot.")
+        for capacity in capacities:
+            if validate_quantity(capacity) == 0:
+                raise ValueError("Slot capacity must be a positive integer.")
+        self._slots = [Slot(index, capacity) for index, capacity in enumerate(capacities)]
+        self._capacity = sum(capacities)
+        self._quantity = 0
+        self._available = 0  # Units in slots that are not jammed
+
+    @property
+    def slots(self) -> list[Slot]:
+        return list(self._slots)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def quantity(self) -> int:
+        return self._quantity
+
+    @property
+    def available(self) -> int:
+        return self._available
+
+    def take(self) -> Slot:
+        """
+        Vend one unit from the least used slot that is not jammed, preferring the fullest slot on a tie.
+
+        Returns:
+            Slot: The slot vended from.
+
+        Raises:
+            ValueError: If no slot can vend.
+        """
+        if not self._available:
+            raise ValueError("No slot can vend this product.")
+        slot = min((slot for slot in self._slots if slot.quantity and not slot.jammed),
+                   key=lambda slot: (slot.vends, -slot.quantity))
+        slot.quantity -= 1
+        slot.vends += 1
+        self._quantity -= 1
+        self._available -= 1
+        return slot
+
+    def fill(self, quantity: int) -> None:
+        """
+        Add units, always to the emptiest slot with space left.
+
+        Args:
+            quantity (int): The number of units to add.
+
+        Raises:
+            ValueError: If the units do not fit in the slots.
+        """
+        if self._quantity + validate_quantity(quantity) > self._capacity:
+            raise ValueError("Cannot exceed the capacity of the product's slots.")
+        for _ in range(quantity):
+            slot = min((slot for slot in self._slots if slot.quantity < slot.capacity),
+                       key=lambda slot: slot.quantity / slot.capacity)
+            slot.quantity += 1
+            if not slot.jammed:
+                self._available += 1
+        self._quantity += quantity
+
+    def put_back(self, index: int) -> None:
+        """
+        Return a unit that was taken but not vended to its slot, or to the emptiest slot if that one is full.
+
+        The vend is still counted, as the motor turned.
+
+        Args:
+            index (int): The index of the slot the unit was taken from, or None if it is not known.
+
+        Raises:
+            ValueError: If the units do not fit in the slots.
+        """
+        if index is None or not 0 <= index < len(self._slots) or \
+                self._slots[index].quantity >= self._slots[index].capacity:
+            self.fill(1)
+            return
+        slot = self._slots[index]
+        slot.quantity += 1
+        if not slot.jammed:
+            self._available += 1
+        self._quantity += 1
+
+    def load(self, states: list[tuple]) -> None:
+        """
+        Overwrite the quantity, vend count and jam state of every slot, e.g. to mirror another machine's slots.
+
+        Args:
+            states (list): A (quantity, vends, jammed) tuple per slot.
+
+        Raises:
+            ValueError: If the number of states does not match the slots or a quantity exceeds its slot's capacity.
+        """
+        if len(states) != len(self._slots):
+            raise ValueError(f"Expected {len(self._slots)} slot states, got {len(states)}.")
+        for slot, (quantity, _, _) in zip(self._slots, states):
+            if validate_quantity(quantity) > slot.capacity:
+                raise ValueError(f"Slot {slot.index} cannot hold {quantity} units.")
+        for slot, (quantity, vends, jammed) in zip(self._slots, states):
+            slot.quantity, slot.vends, slot.jammed = quantity, vends, jammed
+        self._quantity = sum(slot.quantity for slot in self._slots)
+        self._available = sum(slot.quantity for slot in self._slots if not slot.jammed)
+
+    def set_jammed(self, index: int, jammed: bool) -> None:
+        """
+        Mark a slot as jammed, excluding it from vending, or as cleared.
+
+        Args:
+            index (int): The index of the slot.
+            jammed (bool): True if the slot is jammed, False once it has been cleared.
+
+        Raises:
+            ValueError: If the slot does not exist.
+        """
+        if not 0 <= index < len(self._slots):
+            raise ValueError(f"Slot {index} does not exist.")
+        slot = self._slots[index]
+        if slot.jammed != jammed:
+            slot.jammed = jammed
+            self._available += -slot.quantity if jammed else slot.quantity
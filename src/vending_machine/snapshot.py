@@ -0,0 +1,53 @@
+from types import MappingProxyType
+from typing import NamedTuple
+
+
+class ProductSnapshot(NamedTuple):
+    """An immutable view of a product at one version."""
+    id: int
+    name: str
+    price: int
+    quantity: int
+    version: int
+
+
+class MachineSnapshot(NamedTuple):
+    """
+    An immutable, consistent view of the whole vending machine state.
+
+    Unchanged parts are shared between snapshots: the currency views are reused while the currency version is
+    unchanged, and so are the product snapshots of products that have not changed.
+    """
+    version: int
+    balance: int
+    denomination_counts: MappingProxyType
+    inserted_money: MappingProxyType
+    products: tuple[ProductSnapshot, ...]
+    tube_versions: MappingProxyType = MappingProxyType({})
+
+
+class VersionCounter:
+    """A version number shared by an inventory and its products, bumped in O(1) by any of them."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        """Initialize the counter at version 0."""
+        self.value = 0
+
+
+class VersionConflict(ValueError):
+    """A conditional operation was rejected because the state changed since the caller read its version."""
+
+    def __init__(self, subject: str, expected: int, actual: int):
+        """
+        Initialize the conflict.
+
+        Args:
+            subject (str): What changed, e.g. "product 1" or "denomination 200".
+            expected (int): The version the caller read.
+            actual (int): The current version.
+        """
+        super().__init__(f"Version conflict on {subject}: expected version {expected}, found {actual}.")
+        self.subject = subject
+        self.expected = expected
+        self.actual = actual
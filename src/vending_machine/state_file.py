@@ -0,0 +1,79 @@
+import json
+import os
+from datetime import date
+from types import MappingProxyType
+
+from .currency import Currency
+from .machine import VendingMachine
+from .snapshot import MachineSnapshot, ProductSnapshot
+
+
+def save_state(vending_machine: VendingMachine, path: str) -> None:
+    """
+    Save the vending machine state to a compact JSON state file.
+
+    The file is written next to the target and then renamed over it, so a crash never leaves a partial state.
+    Dated lots are saved with their expiry and remaining quantity, and products and coin tubes with their versions,
+    so conditional operations against versions read before the save still apply afterwards. Slots and the accepted
+    denominations set by a planogram are saved too.
+
+    Args:
+        vending_machine (VendingMachine): The vending machine to save.
+        path (str): The path of the state file.
+    """
+    snapshot = vending_machine.snapshot()
+    state = {
+        "balance": snapshot.balance,
+        "denomination_counts": list(snapshot.denomination_counts.items()),
+        "inserted_money": list(snapshot.inserted_money.items()),
+        "products": [[product.id, product.name, product.price, product.quantity, product.version]
+                     for product in snapshot.products],
+        "tube_versions": list(snapshot.tube_versions.items()),
+        "lots": [[lot.product_id, lot.expiry.isoformat(), lot.quantity] for product in snapshot.products
+                 for lot in vending_machine.get_lots(product.id)],
+        "slots": [[product.id, [[slot.capacity, slot.quantity, slot.vends, slot.jammed]
+                                for slot in vending_machine.get_slots(product.id)]]
+                  for product in snapshot.products if vending_machine.get_slots(product.id)],
+        "accepted_denominations": list(vending_machine.get_valid_denominations()),
+    }
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, separators=(",", ":"))
+    os.replace(temporary_path, path)
+
+
+def load_state(path: str) -> VendingMachine:
+    """
+    Load a vending machine from a state file.
+
+    Args:
+        path (str): The path of the state file.
+
+    Returns:
+        VendingMachine: The restored vending machine.
+
+    Raises:
+        FileNotFoundError: If the state file does not exist.
+        ValueError: If the state file is invalid.
+    """
+    with open(path, encoding="utf-8") as state_file:
+        try:
+            state = json.load(state_file)
+            # Lots, versions, slots and accepted denominations are absent from older state files
+            lots = [(product_id, date.fromisoformat(expiry), quantity)
+                    for product_id, expiry, quantity in state.get("lots", ())]
+            slots = {product_id: [(capacity, quantity, vends, bool(jammed))
+                                  for capacity, quantity, vends, jammed in states]
+                     for product_id, states in state.get("slots", ())}
+            accepted_denominations = tuple(state.get("accepted_denominations", Currency.DENOMINATIONS))
+            snapshot = MachineSnapshot(
+                version=0,
+                balance=state["balance"],
+                denomination_counts=MappingProxyType(dict(state["denomination_counts"])),
+                inserted_money=MappingProxyType(dict(state["inserted_money"])),
+                products=tuple(ProductSnapshot(id_, name, price, quantity, version[0] if version else 0)
+                               for id_, name, price, quantity, *version in state["products"]),
+                tube_versions=MappingProxyType(dict(state.get("tube_versions", ()))))
+            return VendingMachine.from_snapshot(snapshot, lots, slots, accepted_denominations)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid state file {path}: {e!r}") from e
@@ -0,0 +1,226 @@
+import sqlite3
+from datetime import date
+
+from .currency import Currency
+from .inventory import Inventory
+from .product import Product
+from .snapshot import ProductSnapshot
+
+
+class SQLiteStorage:
+    """
+    Persists the vending machine state to a local SQLite database.
+
+    The bound `Inventory` and `Currency` objects act as the read-through cache: reads never touch SQL, and
+    mutations only stage the changed keys. Staged changes are written in a single transaction by `commit`,
+    which the vending machine calls once per customer session and once per maintenance operation. A staged
+    product is written with its version, and only those of its slot and lot rows that changed since the last
+    commit. The database runs in WAL mode so the back office can query it while the machine is writing.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS products ("
+        "id INTEGER PRIMARY KEY, name TEXT NOT NULL, price INTEGER NOT NULL, quantity INTEGER NOT NULL, "
+        "version INTEGER NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS denominations ("
+        "denom INTEGER PRIMARY KEY, count INTEGER NOT NULL, inserted INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS machine_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS slots ("
+        "product_id INTEGER NOT NULL, position INTEGER NOT NULL, capacity INTEGER NOT NULL, "
+        "quantity INTEGER NOT NULL, vends INTEGER NOT NULL, jammed INTEGER NOT NULL, "
+        "PRIMARY KEY (product_id, position))",
+        "CREATE TABLE IF NOT EXISTS lots ("
+        "product_id INTEGER NOT NULL, expiry TEXT NOT NULL, quantity INTEGER NOT NULL, "
+        "PRIMARY KEY (product_id, expiry))",
+    )
+
+    # Statements are kept as constants so sqlite3 reuses its cached prepared statements
+    _UPSERT_PRODUCT = ("INSERT INTO products (id, name, price, quantity, version) VALUES (?, ?, ?, ?, ?) "
+                       "ON CONFLICT(id) DO UPDATE SET name = excluded.name, price = excluded.price, "
+                       "quantity = excluded.quantity, version = excluded.version")
+    _UPSERT_DENOMINATION = ("INSERT INTO denominations (denom, count, inserted) VALUES (?, ?, ?) "
+                            "ON CONFLICT(denom) DO UPDATE SET count = excluded.count, inserted = excluded.inserted")
+    _UPSERT_STATE = ("INSERT INTO machine_state (key, value) VALUES (?, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = excluded.value")
+    _UPSERT_SLOT = ("INSERT INTO slots (product_id, position, capacity, quantity, vends, jammed) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(product_id, position) DO UPDATE SET "
+                    "capacity = excluded.capacity, quantity = excluded.quantity, vends = excluded.vends, "
+                    "jammed = excluded.jammed")
+    _DELETE_SLOTS = "DELETE FROM slots WHERE product_id = ? AND position >= ?"
+    _UPSERT_LOT = ("INSERT INTO lots (product_id, expiry, quantity) VALUES (?, ?, ?) "
+                   "ON CONFLICT(product_id, expiry) DO UPDATE SET quantity = excluded.quantity")
+    _DELETE_LOT = "DELETE FROM lots WHERE product_id = ? AND expiry = ?"
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the database.
+
+        Args:
+            path (str): The path of the SQLite database file.
+        """
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SQLiteStorage._SCHEMA:
+            self._connection.execute(statement)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(products)")}
+        if "version" not in columns:  # Created before versions were persisted
+            self._connection.execute("ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._inventory = None
+        self._currency = None
+        self._staged_products = set()
+        self._removed_products = set()
+        self._staged_denominations = set()
+        self._staged_balance = None
+        self._slot_rows = {}  # Product ID -> (capacity, quantity, vends, jammed) per slot, as last written
+        self._lot_rows = {}  # Product ID -> {expiry: quantity}, as last written
+
+    @property
+    def journal_mode(self) -> str:
+        return self._connection.execute("PRAGMA journal_mode").fetchone()[0]
+
+    def load(self, inventory: Inventory, currency: Currency) -> int:
+        """
+        Restore the persisted state into the given inventory and currency and bind them to this storage.
+
+        If the database holds no state yet, the current currency state is written instead.
+
+        Args:
+            inventory (Inventory): The inventory to restore products into.
+            currency (Currency): The currency to restore denomination counts into.
+
+        Returns:
+            int: The persisted customer balance.
+        """
+        self._inventory = inventory
+        self._currency = currency
+
+        denomination_rows = self._connection.execute("SELECT denom, count, inserted FROM denominations").fetchall()
+        if not denomination_rows:
+            self._staged_denominations.update(Currency.DENOMINATIONS)
+            self.stage_balance(0)
+            self.commit()
+            return 0
+
+        for row in self._connection.execute("SELECT id, name, price, quantity, version FROM products ORDER BY id"):
+            inventory.add_product(Product.from_snapshot(ProductSnapshot(*row)))
+        for product_id, capacity, quantity, vends, jammed in self._connection.execute(
+                "SELECT product_id, capacity, quantity, vends, jammed FROM slots ORDER BY product_id, position"):
+            self._slot_rows.setdefault(product_id, []).append((capacity, quantity, vends, bool(jammed)))
+        for product_id, states in self._slot_rows.items():
+            inventory.load_slots(product_id, states)
+        for product_id, expiry, quantity in self._connection.execute(
+                "SELECT product_id, expiry, quantity FROM lots ORDER BY product_id, expiry"):
+            inventory.add_lot(product_id, date.fromisoformat(expiry), quantity)
+            self._lot_rows.setdefault(product_id, {})[expiry] = quantity
+        currency.load_counts({denom: count for denom, count, _ in denomination_rows},
+                             {denom: inserted for denom, _, inserted in denomination_rows if inserted})
+        row = self._connection.execute("SELECT value FROM machine_state WHERE key = 'balance'").fetchone()
+        return row[0] if row else 0
+
+    def stage_product(self, product_id: int) -> None:
+        """
+        Mark a product as changed so it is written on the next commit.
+
+        Args:
+            product_id (int): The ID of the changed product.
+        """
+        self._staged_products.add(product_id)
+
+    def replace_inventory(self, inventory: Inventory, removed_ids) -> None:
+        """
+        Bind a new inventory, e.g. after a planogram reload, so all its products are written on the next commit.
+
+        Args:
+            inventory (Inventory): The inventory now used by the vending machine.
+            removed_ids: The IDs of the products no longer in the inventory, deleted on the next commit.
+        """
+        self._inventory = inventory
+        self._removed_products.update(removed_ids)
+        self._staged_products = {product.id for product in inventory.products}
+
+    def stage_denomination(self, denom: int) -> None:
+        """
+        Mark a denomination as changed so its counts are written on the next commit.
+
+        Args:
+            denom (int): The changed denomination.
+        """
+        self._staged_denominations.add(denom)
+
+    def stage_balance(self, balance: int) -> None:
+        """
+        Stage the customer balance to be written on the next commit.
+
+        Args:
+            balance (int): The current balance.
+        """
+        self._staged_balance = balance
+
+    def commit(self) -> None:
+        """Write all staged changes in a single transaction."""
+        if not (self._staged_products or self._removed_products or self._staged_denominations
+                or self._staged_balance is not None):
+            return
+        products = [self._inventory.get_product(product_id) for product_id in self._staged_products]
+        slot_rows, lot_rows = {}, {}
+        slot_upserts, slot_deletes, lot_upserts, lot_deletes = [], [], [], []
+        for product in products:
+            removed = product.id in self._removed_products  # Removed and added again, so written from scratch
+            rows = [(slot.capacity, slot.quantity, slot.vends, slot.jammed)
+                    for slot in self._inventory.get_slots(product.id)]
+            written = [] if removed else self._slot_rows.get(product.id, [])
+            slot_upserts.extend((product.id, position, *row) for position, row in enumerate(rows)
+                                if position >= len(written) or written[position] != row)
+            if len(written) > len(rows):
+                slot_deletes.append((product.id, len(rows)))
+            slot_rows[product.id] = rows
+
+            quantities = {}
+            for lot in self._inventory.get_lots(product.id):  # Lots of the same day are sold alike, so merged
+                expiry = lot.expiry.isoformat()
+                quantities[expiry] = quantities.get(expiry, 0) + lot.quantity
+            written = {} if removed else self._lot_rows.get(product.id, {})
+            lot_upserts.extend((product.id, expiry, quantity) for expiry, quantity in quantities.items()
+                               if written.get(expiry) != quantity)
+            lot_deletes.extend((product.id, expiry) for expiry in written if expiry not in quantities)
+            lot_rows[product.id] = quantities
+        slot_deletes.extend((product_id, 0) for product_id in self._removed_products)
+        lot_deletes.extend((product_id, expiry) for product_id in self._removed_products
+                           for expiry in self._lot_rows.get(product_id, ()))
+        denomination_counts = self._currency.denomination_counts
+        inserted_money = self._currency.inserted_money
+
+        with self._connection:  # Commits on success, rolls back on error
+            self._connection.execute("BEGIN")
+            self._connection.executemany("DELETE FROM products WHERE id = ?",
+                                         [(product_id,) for product_id in self._removed_products])
+            self._connection.executemany(
+                SQLiteStorage._UPSERT_PRODUCT,
+                [(product.id, product.name, product.price, product.quantity, product.version)
+                 for product in products])
+            self._connection.executemany(SQLiteStorage._DELETE_SLOTS, slot_deletes)
+            self._connection.executemany(SQLiteStorage._UPSERT_SLOT, slot_upserts)
+            self._connection.executemany(SQLiteStorage._DELETE_LOT, lot_deletes)
+            self._connection.executemany(SQLiteStorage._UPSERT_LOT, lot_upserts)
+            self._connection.executemany(
+                SQLiteStorage._UPSERT_DENOMINATION,
+                [(denom, denomination_counts[denom], inserted_money.get(denom, 0))
+                 for denom in self._staged_denominations])
+            if self._staged_balance is not None:
+                self._connection.execute(SQLiteStorage._UPSERT_STATE, ("balance", self._staged_balance))
+
+        for product_id in self._removed_products:
+            self._slot_rows.pop(product_id, None)
+            self._lot_rows.pop(product_id, None)
+        self._slot_rows.update(slot_rows)
+        self._lot_rows.update(lot_rows)
+        self._staged_products.clear()
+        self._removed_products.clear()
+        self._staged_denominations.clear()
+        self._staged_balance = None
+
+    def close(self) -> None:
+        """Commit any staged changes and close the database."""
+        self.commit()
+        self._connection.close()
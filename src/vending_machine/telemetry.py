@@ -0,0 +1,396 @@
+import gzip
+import http.client
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .change import ChangeVector
+from .events import (ChangeDispensed, ChangeRestored, CurrencyReloaded, EventBus, ProductAdded, ProductPurchased,
+                     ProductReloaded, PurchaseRefunded)
+
+logger = logging.getLogger(__name__)
+
+# Sales, change and stock events; coin insertions and rejected operations stay local
+TELEMETRY_EVENTS = (ProductPurchased, PurchaseRefunded, ChangeDispensed, ChangeRestored, ProductAdded, ProductReloaded,
+                    CurrencyReloaded)
+
+
+def encode_event(event) -> str:
+    """
+    Encode an event as a single line of JSON.
+
+    Args:
+        event: The event, e.g. a `ProductPurchased`.
+
+    Returns:
+        str: The JSON object, with the event class name under "type".
+    """
+    fields = {name: value.to_dict() if isinstance(value, ChangeVector) else value
+              for name, value in event._asdict().items()}
+    return json.dumps({"type": type(event).__name__, **fields}, separators=(",", ":"))
+
+
+class TelemetrySpool:
+    """
+    Disk-backed FIFO queue of encoded events, kept in SQLite so buffered telemetry survives outages and restarts.
+
+    The queue holds at most `max_records` events; when a machine stays offline long enough to fill it, the oldest
+    events are dropped.
+    """
+
+    def __init__(self, path: str, max_records: int = 1_000_000):
+        """
+        Open (or create) the spool.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            max_records (int): The maximum number of buffered events.
+        """
+        self.max_records = max_records
+        self.dropped = 0
+        self._lock = threading.Lock()  # Appended by the subscription worker, drained by the uploader
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                 "line TEXT NOT NULL)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def append(self, lines: list[str]) -> None:
+        """
+        Add encoded events to the end of the queue in a single transaction.
+
+        Args:
+            lines (list): The encoded events.
+        """
+        with self._lock, self._connection:  # Commits on success, rolls back on error
+            self._connection.execute("BEGIN")
+            self._connection.executemany("INSERT INTO events (line) VALUES (?)", ((line,) for line in lines))
+            # Only the head is ever deleted, so the IDs in the queue are contiguous
+            self.dropped += self._connection.execute(
+                "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (self.max_records,)).rowcount
+
+    def peek(self, max_records: int, max_bytes: int) -> tuple[int, list[str]]:
+        """
+        Read the oldest events without removing them.
+
+        Args:
+            max_records (int): The maximum number of events.
+            max_bytes (int): The maximum total size of the events, newline separated. The first event is always
+                             returned, whatever its size.
+
+        Returns:
+            tuple: The ID of the last event returned (0 if none), and the encoded events.
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT id, line FROM events ORDER BY id LIMIT ?",
+                                            (max_records,)).fetchall()
+        last_id, lines, size = 0, [], 0
+        for id_, line in rows:
+            size += len(line) + 1
+            if lines and size > max_bytes:
+                break
+            last_id = id_
+            lines.append(line)
+        return last_id, lines
+
+    def remove(self, up_to_id: int) -> None:
+        """
+        Remove the events up to and including an ID, once they have been uploaded.
+
+        Args:
+            up_to_id (int): The ID returned by `peek`.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM events WHERE id <= ?", (up_to_id,))
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+
+class _BatchRejected(http.client.HTTPException):
+    """The endpoint rejected a batch with a client error, so retrying it would fail again."""
+
+
+class TelemetryUploader:
+    """
+    Ships vending machine events to a telemetry endpoint in gzip-compressed batches.
+
+    A subscription on the machine's `EventBus` spools the events to disk on its own worker thread, and an upload
+    thread posts them over a single keep-alive HTTP/1.1 connection, so the customer path never waits for the disk
+    or the network. Each request carries at most `batch_records` events and `max_payload_bytes` of uncompressed
+    JSON, and successive requests are spaced by `upload_interval`, so draining a backlog of days offline neither
+    saturates the link nor the CPU. Failed uploads are retried with jittered exponential backoff; events are only
+    removed from the spool once the endpoint has accepted them, or once it has rejected them with a client error
+    that retrying cannot fix (any 4xx but 408 and 429), so one malformed batch cannot hold up the rest. Rejected
+    batches and events that overflowed the subscription buffer before reaching the spool are counted in `dropped`.
+    """
+
+    def __init__(self, events: EventBus, spool: TelemetrySpool, host: str, port: int, path: str = "/telemetry",
+                 machine_id: str = "vending-machine", event_types: tuple = TELEMETRY_EVENTS,
+                 batch_records: int = 500, max_payload_bytes: int = 64 * 1024, upload_interval: float = 1.0,
+                 backoff: float = 1.0, max_backoff: float = 300.0, compress_level: int = 6, timeout: float = 10.0,
+                 capacity: int = 65536):
+        """
+        Initialize the uploader, subscribe to the events and start the upload thread.
+
+        Args:
+            events (EventBus): The bus of the vending machine, e.g. `VendingMachine.events`.
+            spool (TelemetrySpool): The disk-backed queue of events waiting for upload.
+            host (str): The telemetry endpoint host.
+            port (int): The telemetry endpoint port.
+            path (str): The request path.
+            machine_id (str): The identifier of the machine, sent with every batch.
+            event_types (tuple): The event classes to upload.
+            batch_records (int): The maximum number of events per request.
+            max_payload_bytes (int): The maximum uncompressed size of a request body.
+            upload_interval (float): The minimum time between requests in seconds.
+            backoff (float): The delay before the first retry in seconds, doubled after every failure.
+            max_backoff (float): The maximum delay between retries in seconds.
+            compress_level (int): The gzip compression level, from 1 (fastest) to 9 (smallest).
+            timeout (float): The connection timeout in seconds.
+            capacity (int): The maximum number of events buffered in memory while the spool is busy, e.g. during a
+                            slow disk write. Beyond it the oldest events are dropped rather than stalling the
+                            customer path.
+
+        Raises:
+            ValueError: If a batch limit is not positive.
+        """
+        if batch_records <= 0 or max_payload_bytes <= 0:
+            raise ValueError("Batch limits must be positive integers.")
+        self.uploaded = 0
+        self.failures = 0
+        self._rejected = 0  # Events in batches the endpoint rejected for good
+        self._spool = spool
+        self._path = path
+        self._machine_id = machine_id
+        self._event_types = event_types
+        self._batch_records = batch_records
+        self._max_payload_bytes = max_payload_bytes
+        self._upload_interval = upload_interval
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._compress_level = compress_level
+        self._connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self._pending = threading.Event()  # Set when events were spooled
+        self._stopped = threading.Event()
+        self._drained = threading.Condition()
+        self._events = events
+        self._subscription = events.subscribe(self._spool_events, capacity=capacity, batch_size=256)
+        self._uploader = threading.Thread(target=self._upload_loop, daemon=True)
+        self._uploader.start()
+
+    @property
+    def dropped(self) -> int:
+        return self._rejected + self._subscription.dropped
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every published event has been uploaded.
+
+        Args:
+            timeout (float): The maximum time to wait for the upload in seconds.
+
+        Returns:
+            bool: True if the spool was drained, False on timeout, e.g. while the endpoint is unreachable.
+        """
+        self._subscription.flush()
+        with self._drained:
+            return self._drained.wait_for(lambda: not len(self._spool), timeout)
+
+    def close(self) -> None:
+        """Unsubscribe, spool the buffered events and stop uploading. Events not yet uploaded stay in the spool."""
+        self._events.unsubscribe(self._subscription)
+        self._subscription.flush()
+        self._stopped.set()
+        self._pending.set()
+        self._uploader.join()
+        self._connection.close()
+
+    def _spool_events(self, events: list) -> None:
+        """
+        Encode and spool a batch of events delivered by the subscription.
+
+        Args:
+            events (list): The events.
+        """
+        lines = [encode_event(event) for event in events if isinstance(event, self._event_types)]
+        if lines:
+            self._spool.append(lines)
+            self._pending.set()
+
+    def _upload_loop(self) -> None:
+        """Upload spooled batches until stopped."""
+        failures = 0
+        while not self._stopped.is_set():
+            self._pending.clear()  # Cleared before peeking, so events spooled meanwhile are not missed
+            last_id, lines = self._spool.peek(self._batch_records, self._max_payload_bytes)
+            if not lines:
+                self._pending.wait()
+                continue
+            try:
+                self._post(lines)
+            except _BatchRejected as e:
+                failures = 0
+                self._spool.remove(last_id)
+                self._rejected += len(lines)
+                logger.error(f"Telemetry endpoint rejected {len(lines)} events ({e}); dropped: {lines}")
+                with self._drained:
+                    self._drained.notify_all()
+                continue
+            except (OSError, http.client.HTTPException) as e:
+                self._connection.close()  # Reconnects on the next request
+                failures += 1
+                self.failures += 1
+                delay = self._retry_delay(failures)
+                logger.warning(f"Uploading {len(lines)} telemetry events failed ({e}); retrying in {delay:.1f} s.")
+                self._stopped.wait(delay)
+                continue
+            failures = 0
+            self._spool.remove(last_id)
+            self.uploaded += len(lines)
+            with self._drained:
+                self._drained.notify_all()
+            self._stopped.wait(self._upload_interval)
+
+    def _post(self, lines: list[str]) -> None:
+        """
+        Post a batch of encoded events as gzip-compressed JSON lines.
+
+        Args:
+            lines (list): The encoded events.
+
+        Raises:
+            OSError: If the endpoint is unreachable.
+            _BatchRejected: If the endpoint rejects the batch with a client error.
+            http.client.HTTPException: If the endpoint does not accept the batch for now.
+        """
+        body = gzip.compress("\n".join(lines).encode(), self._compress_level)
+        self._connection.request("POST", self._path, body, {"Content-Type": "application/x-ndjson",
+                                                            "Content-Encoding": "gzip",
+                                                            "X-Machine-ID": self._machine_id})
+        response = self._connection.getresponse()
+        response.read()  # Drain the response so the connection can be reused
+        if 400 <= response.status < 500 and response.status not in (408, 429):
+            raise _BatchRejected(f"HTTP {response.status} {response.reason}")
+        if not 200 <= response.status < 300:
+            raise http.client.HTTPException(f"HTTP {response.status} {response.reason}")
+
+    def _retry_delay(self, failures: int) -> float:
+        """
+        Return the delay before the next retry, with jitter so a fleet coming back online does not retry in step.
+
+        Args:
+            failures (int): The number of consecutive failures.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self._backoff * 2 ** min(failures - 1, 32), self._max_backoff)
+        return random.uniform(delay / 2, delay)
+
+
+class MockTelemetryServer:
+    """
+    A local stand-in for the telemetry endpoint, for tests.
+
+    The server decodes and records every accepted batch. While `online` is False it answers `offline_status`, 503 by
+    default as a backend that is down or behind a captive portal would, or e.g. 400 for a backend refusing the
+    payload.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Initialize the server.
+
+        Args:
+            latency (float): The time each request takes in seconds.
+        """
+        self.latency = latency
+        self.online = True
+        self.offline_status = 503
+        self.batches = []  # Decoded events per accepted request
+        self.payload_sizes = []  # (compressed, uncompressed) body sizes per accepted request
+        self.machine_ids = set()
+        self.rejected = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def events(self) -> list[dict]:
+        with self._lock:
+            return [event for batch in self.batches for event in batch]
+
+    def start(self, address: tuple = ("127.0.0.1", 0)) -> tuple:
+        """
+        Start serving on a background thread.
+
+        Args:
+            address (tuple): The (host, port) address to listen on.
+
+        Returns:
+            tuple: The address actually bound, useful when port 0 is requested.
+        """
+        self._server = ThreadingHTTPServer(address, self._handler_class())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self._server.server_address
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, headers, body: bytes) -> int:
+        """
+        Handle an upload.
+
+        Args:
+            headers: The request headers.
+            body (bytes): The compressed request body.
+
+        Returns:
+            int: The response status.
+        """
+        time.sleep(self.latency)
+        with self._lock:
+            if not self.online:
+                self.rejected += 1
+                return self.offline_status
+            data = gzip.decompress(body) if headers.get("Content-Encoding") == "gzip" else body
+            self.batches.append([json.loads(line) for line in data.decode().split("\n")])
+            self.payload_sizes.append((len(body), len(data)))
+            self.machine_ids.add(headers.get("X-Machine-ID"))
+            return 204
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive
+            disable_nagle_algorithm = True  # Headers and body are written separately
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                status = server._handle(self.headers, self.rfile.read(int(self.headers["Content-Length"])))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # Keep test output quiet
+
+        return Handler
@@ -0,0 +1,195 @@
+import time
+from array import array
+from collections.abc import Iterable, Mapping
+
+from .snapshot import ProductSnapshot
+
+
+class RingSeries:
+    """
+    A fixed-capacity series of (timestamp, level) samples stored as deltas in `array` ring buffers.
+
+    Every sample takes six bytes: the seconds since the previous sample and the change in level. Only the
+    oldest and newest samples are kept as absolute values; when the buffer is full, the oldest sample is folded
+    into the absolute base as it is overwritten.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize an empty series.
+
+        Args:
+            capacity (int): The maximum number of samples kept.
+
+        Raises:
+            ValueError: If the capacity is not positive.
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+        self._capacity = capacity
+        self._time_deltas = array("I", bytes(array("I").itemsize * capacity))
+        self._level_deltas = array("h", bytes(array("h").itemsize * capacity))
+        self._head = 0  # Slot of the oldest sample
+        self._size = 0
+        self._first_time = self._first_level = 0  # Absolute values of the oldest sample
+        self._last_time = self._last_level = 0  # Absolute values of the newest sample
+
+    @property
+    def memory_bytes(self) -> int:
+        return (self._time_deltas.itemsize + self._level_deltas.itemsize) * self._capacity
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: int, level: int) -> None:
+        """
+        Append a sample, overwriting the oldest one if the series is full.
+
+        Args:
+            timestamp (int): The sample time in whole seconds.
+            level (int): The sampled level.
+        """
+        if self._size == 0:
+            self._first_time = self._last_time = timestamp
+            self._first_level = self._last_level = level
+            self._size = 1
+            return
+        if self._size == self._capacity:
+            self._head = (self._head + 1) % self._capacity
+            self._first_time += self._time_deltas[self._head]
+            self._first_level += self._level_deltas[self._head]
+            self._size -= 1
+
+        slot = (self._head + self._size) % self._capacity
+        self._time_deltas[slot] = max(timestamp - self._last_time, 0)  # Clamp if the clock went backwards
+        self._level_deltas[slot] = level - self._last_level
+        self._last_time += self._time_deltas[slot]
+        self._last_level = level
+        self._size += 1
+
+    def __iter__(self):
+        timestamp, level = self._first_time, self._first_level
+        for offset in range(self._size):
+            if offset:
+                slot = (self._head + offset) % self._capacity
+                timestamp += self._time_deltas[slot]
+                level += self._level_deltas[slot]
+            yield timestamp, level
+
+    def downsample(self, start: int = None, end: int = None, buckets: int = 100) -> list[tuple]:
+        """
+        Aggregate the samples in a time window into equally wide buckets.
+
+        Args:
+            start (int): The window start in seconds. Defaults to the oldest sample.
+            end (int): The window end in seconds (inclusive). Defaults to the newest sample.
+            buckets (int): The number of buckets the window is divided into.
+
+        Returns:
+            list: A (bucket start, mean, minimum, maximum) tuple for every bucket holding samples.
+        """
+        if not self._size:
+            return []
+        start = self._first_time if start is None else start
+        end = self._last_time if end is None else end
+        width = max((end - start + 1) / buckets, 1)
+        aggregates = {}
+        for timestamp, level in self:
+            if timestamp < start:
+                continue
+            if timestamp > end:
+                break
+            bucket = int((timestamp - start) // width)
+            aggregate = aggregates.get(bucket)
+            if aggregate is None:
+                aggregates[bucket] = [level, 1, level, level]
+            else:
+                aggregate[0] += level
+                aggregate[1] += 1
+                aggregate[2] = min(aggregate[2], level)
+                aggregate[3] = max(aggregate[3], level)
+        return [(start + bucket * width, total / count, minimum, maximum)
+                for bucket, (total, count, minimum, maximum) in sorted(aggregates.items())]
+
+
+class LevelRecorder:
+    """Records coin tube and product stock levels of a vending machine in bounded memory."""
+
+    def __init__(self, capacity: int = 2016):
+        """
+        Initialize the recorder.
+
+        Args:
+            capacity (int): The number of samples kept per series, e.g. 2016 for a week at 5-minute intervals.
+        """
+        self._capacity = capacity
+        self._coins = {}  # Denomination -> RingSeries
+        self._stock = {}  # Product ID -> RingSeries
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(series.memory_bytes for series in (*self._coins.values(), *self._stock.values()))
+
+    def sample(self, denomination_counts: Mapping, products: Iterable[ProductSnapshot],
+               timestamp: float = None) -> None:
+        """
+        Record one sample of every coin tube and product.
+
+        Args:
+            denomination_counts (Mapping): Denominations as keys and counts as values.
+            products (Iterable): The product snapshots to record the stock of.
+            timestamp (float): The sample time in seconds. Defaults to now.
+        """
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        for denom, count in denomination_counts.items():
+            self._series(self._coins, denom).append(timestamp, count)
+        for product in products:
+            self._series(self._stock, product.id).append(timestamp, product.quantity)
+
+    def coin_levels(self, denom: int, start: int = None, end: int = None, buckets: int = 100) -> list[tuple]:
+        """
+        Return the downsampled level of a coin tube.
+
+        Args:
+            denom (int): The denomination of the tube.
+            start (int): The window start in seconds. Defaults to the oldest sample.
+            end (int): The window end in seconds (inclusive). Defaults to the newest sample.
+            buckets (int): The number of buckets the window is divided into.
+
+        Returns:
+            list: A (bucket start, mean, minimum, maximum) tuple for every bucket holding samples.
+
+        Raises:
+            ValueError: If the tube has never been sampled.
+        """
+        return self._get(self._coins, denom, "denomination").downsample(start, end, buckets)
+
+    def stock_levels(self, product_id: int, start: int = None, end: int = None, buckets: int = 100) -> list[tuple]:
+        """
+        Return the downsampled stock of a product.
+
+        Args:
+            product_id (int): The ID of the product.
+            start (int): The window start in seconds. Defaults to the oldest sample.
+            end (int): The window end in seconds (inclusive). Defaults to the newest sample.
+            buckets (int): The number of buckets the window is divided into.
+
+        Returns:
+            list: A (bucket start, mean, minimum, maximum) tuple for every bucket holding samples.
+
+        Raises:
+            ValueError: If the product has never been sampled.
+        """
+        return self._get(self._stock, product_id, "product").downsample(start, end, buckets)
+
+    def _series(self, series: dict, key: int) -> RingSeries:
+        ring = series.get(key)
+        if ring is None:
+            ring = series[key] = RingSeries(self._capacity)
+        return ring
+
+    @staticmethod
+    def _get(series: dict, key: int, kind: str) -> RingSeries:
+        if key not in series:
+            raise ValueError(f"No levels recorded for {kind} {key}.")
+        return series[key]
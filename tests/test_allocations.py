@@ -0,0 +1,128 @@
+import gc
+import tracemalloc
+import unittest
+from typing import NamedTuple
+
+from src.vending_machine.currency import Currency
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+
+
+class AllocationProfile(NamedTuple):
+    """Memory allocated by an operation, in bytes per call."""
+    retained: float  # Mean memory still allocated after the call
+    peak: int  # Largest transient memory use during a call
+
+
+def measure_allocations(operation, setup=None, calls: int = 100) -> AllocationProfile:
+    """
+    Measure the memory allocated by an operation with tracemalloc, net of the measurement's own allocations.
+
+    The operation is called once untraced to fill caches; `setup` runs before every call but outside the
+    measurement.
+
+    Args:
+        operation: The callable to measure.
+        setup: Optional callable preparing each call, e.g. inserting money before a purchase.
+        calls (int): The number of measured calls.
+
+    Returns:
+        AllocationProfile: The retained and peak memory per call.
+    """
+    overhead = _trace(lambda: None, None, calls)
+    if setup is not None:
+        setup()
+    operation()
+    profile = _trace(operation, setup, calls)
+    return AllocationProfile(max(profile.retained - overhead.retained, 0), max(profile.peak - overhead.peak, 0))
+
+
+def _trace(operation, setup, calls: int) -> AllocationProfile:
+    """
+    Trace the memory allocated by the calls of an operation.
+
+    Args:
+        operation: The callable to measure.
+        setup: Optional callable preparing each call.
+        calls (int): The number of measured calls.
+
+    Returns:
+        AllocationProfile: The retained and peak memory per call, including the measurement's own allocations.
+    """
+    samples = []  # (start, current, peak) tuples, only evaluated once tracing has stopped
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            if setup is not None:
+                setup()
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            operation()
+            samples.append((start, *tracemalloc.get_traced_memory()))
+    finally:
+        tracemalloc.stop()
+    retained = sum(current - start for start, current, _ in samples)
+    peak = max(call_peak - start for start, _, call_peak in samples)
+    return AllocationProfile(retained / calls, peak)
+
+
+class TestAllocationBudgets(unittest.TestCase):
+    # Budgets in bytes per call: (retained, peak). The change calculations return a new ChangeVector by design.
+    BUDGETS = {
+        "insert_money": (16, 256),
+        "purchase_product": (16, 128),
+        "calculate_change": (16, 448),
+        "dispense_change": (16, 320),
+        "denomination_counts": (0, 0),
+        "inserted_money": (0, 0),
+    }
+
+    def setUp(self):
+        """Set up a vending machine with plenty of stock."""
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=Product.MAX_QUANTITY))
+        self.currency = Currency()
+
+    def assertWithinBudget(self, name: str, profile: AllocationProfile):
+        """Assert an operation's allocations do not exceed its budget."""
+        retained_budget, peak_budget = self.BUDGETS[name]
+        self.assertLessEqual(profile.retained, retained_budget, f"{name} retains {profile.retained} bytes per call")
+        self.assertLessEqual(profile.peak, peak_budget, f"{name} peaks at {profile.peak} bytes per call")
+
+    def test_insert_money(self):
+        """Test inserting money stays within its allocation budget."""
+        self.assertWithinBudget("insert_money", measure_allocations(lambda: self.vending_machine.insert_money(1)))
+
+    def test_purchase_product(self):
+        """Test purchasing a product stays within its allocation budget."""
+        def restock():
+            self.vending_machine.insert_money(200)
+            if not self.vending_machine.select_product(1).quantity > 1:
+                self.vending_machine.reload_product(1, Product.MAX_QUANTITY - 1)
+        self.assertWithinBudget("purchase_product",
+                                measure_allocations(lambda: self.vending_machine.purchase_product(1), restock))
+
+    def test_calculate_change(self):
+        """Test calculating change stays within its allocation budget."""
+        self.assertWithinBudget("calculate_change", measure_allocations(lambda: self.currency.calculate_change(388)))
+
+    def test_dispense_change(self):
+        """Test dispensing change stays within its allocation budget."""
+        def start_session():
+            self.vending_machine.reload_currencies({50: 1, 20: 1, 10: 1})
+            self.vending_machine.insert_money(200)
+            self.vending_machine.purchase_product(1)
+            self.vending_machine.reload_product(1, 1)
+        self.assertWithinBudget("dispense_change",
+                                measure_allocations(self.vending_machine.dispense_change, start_session))
+
+    def test_denomination_count_accessors(self):
+        """Test reading the unchanged currency views allocates nothing."""
+        self.assertWithinBudget("denomination_counts",
+                                measure_allocations(lambda: self.vending_machine.get_denomination_counts()))
+        self.assertWithinBudget("inserted_money", measure_allocations(lambda: self.vending_machine.get_stored_money()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+
+from src.vending_machine.anomaly import (CHANGE_WITHOUT_PURCHASE, COIN_BURST, REFUND_RATE, REJECTED_COINS,
+                                         REPEATED_REFUNDS, AnomalyDetector, CountMinSketch, DecayedRate)
+from src.vending_machine.change import ChangeVector
+from src.vending_machine.events import CASHLESS, ChangeDispensed, CoinInserted, OperationFailed, ProductPurchased
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+
+
+class TestCountMinSketch(unittest.TestCase):
+    def test_estimates(self):
+        """Test estimates never undercount and are exact for a few keys."""
+        sketch = CountMinSketch(width=64, depth=4)
+        for key, count in [(200, 5), (150, 2), (80, 1)]:
+            for _ in range(count):
+                sketch.add(key)
+        self.assertEqual([sketch.estimate(key) for key in (200, 150, 80, 7)], [5, 2, 1, 0])
+        for key in range(1000):
+            sketch.add(key)
+        self.assertGreaterEqual(sketch.estimate(200), 6)
+        self.assertEqual(sketch.memory_bytes, 64 * 4 * sketch._counts.itemsize)
+
+    def test_halve(self):
+        """Test halving fades out old counts."""
+        sketch = CountMinSketch()
+        self.assertEqual(sketch.add(200, 5), 5)
+        sketch.halve()
+        self.assertEqual(sketch.estimate(200), 2)
+
+    def test_invalid_size(self):
+        """Test invalid sketch sizes are rejected."""
+        for width, depth in [(0, 4), (64, 0), (64, 7)]:
+            with self.subTest(width=width, depth=depth):
+                with self.assertRaises(ValueError):
+                    CountMinSketch(width, depth)
+
+
+class TestDecayedRate(unittest.TestCase):
+    def test_decay(self):
+        """Test the rate decays by e every horizon and late events do not move time back."""
+        rate = DecayedRate(horizon=10)
+        self.assertEqual(rate.update(100, 2), 2)
+        self.assertAlmostEqual(rate.update(110, 0), 2 / 2.718281828459045)
+        self.assertAlmostEqual(rate.update(105, 1), 2 / 2.718281828459045 + 1)
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    def setUp(self):
+        """Set up a detector collecting its alerts."""
+        self.raised = []
+        self.detector = AnomalyDetector(on_alert=self.raised.append, cooldown=0)
+
+    def refund(self, machine_id, timestamp: float, coins=(200, 200)):
+        """Insert coins and have them returned as change, without a purchase."""
+        for denom in coins:
+            self.detector.observe(machine_id, CoinInserted(denom, 0, timestamp))
+            timestamp += 3
+        self.detector.observe(machine_id, ChangeDispensed(ChangeVector(), sum(coins), timestamp))
+
+    def kinds(self) -> list[str]:
+        """Return the kinds of the alerts raised so far."""
+        return [alert.kind for alert in self.raised]
+
+    def test_change_without_purchase(self):
+        """Test high-value coins returned as change without a sale raise an alert, but change after a sale does not."""
+        for denom in (200, 200):
+            self.detector.observe("m1", CoinInserted(denom, 0, 0))
+        self.detector.observe("m1", ProductPurchased(1, 120, 280, 1))
+        self.detector.observe("m1", ChangeDispensed(ChangeVector(), 280, 2))
+        self.refund("m1", 10, coins=(200, 50))
+        self.assertEqual(self.raised, [])
+        self.refund("m1", 20)
+        self.assertEqual(self.kinds(), [CHANGE_WITHOUT_PURCHASE])
+        self.assertEqual(self.raised[0].machine_id, "m1")
+
+    def test_cashless_sale_keeps_session(self):
+        """Test a card sale between inserting coins and having them refunded does not hide the refund."""
+        for denom in (200, 200):
+            self.detector.observe("m1", CoinInserted(denom, 0, 0))
+        self.detector.observe("m1", ProductPurchased(1, 120, 400, 1, CASHLESS))
+        self.detector.observe("m1", ChangeDispensed(ChangeVector(), 400, 2))
+        self.assertEqual(self.kinds(), [CHANGE_WITHOUT_PURCHASE])
+
+    def test_repeated_refunds(self):
+        """Test the same amount refunded again and again is detected, per machine."""
+        detector = AnomalyDetector(on_alert=self.raised.append, min_high_value_coins=5, cooldown=0)
+        self.detector = detector
+        for i in range(3):
+            self.refund("m1", i * 100, coins=(100, 50))
+            self.refund("m2", i * 100, coins=(100, 20) if i else (100, 50))
+        self.assertEqual([(alert.machine_id, alert.kind) for alert in self.raised], [("m1", REPEATED_REFUNDS)])
+        self.assertIn("150p", self.raised[0].detail)
+
+    def test_refund_rate(self):
+        """Test refunds of varying amounts at an unusual rate are detected."""
+        self.detector = AnomalyDetector(on_alert=self.raised.append, min_high_value_coins=5, max_refund_rate=3,
+                                        cooldown=0)
+        for i, denom in enumerate((10, 20, 50, 100)):
+            self.refund("m1", i * 10, coins=(denom,))
+        self.assertEqual(self.kinds(), [REFUND_RATE])
+
+    def test_coin_burst(self):
+        """Test more coins than the mechanism can take in the window are detected."""
+        self.detector = AnomalyDetector(on_alert=self.raised.append, burst_coins=4, burst_seconds=1.0, cooldown=0)
+        for timestamp in (0.0, 0.5, 1.0, 1.5, 2.0):  # Never four coins within a second
+            self.detector.observe("m1", CoinInserted(10, 0, timestamp))
+        self.assertEqual(self.raised, [])
+        for timestamp in (2.1, 2.2, 2.3):
+            self.detector.observe("m1", CoinInserted(10, 0, timestamp))
+        self.assertEqual(self.kinds(), [COIN_BURST, COIN_BURST])
+
+    def test_rejected_coins(self):
+        """Test a high rate of rejected coins is detected, while other failures are ignored."""
+        for i in range(6):
+            self.detector.observe("m1", OperationFailed("purchase_product", "Insufficient balance.", i))
+        self.assertEqual(self.raised, [])
+        for i in range(6):
+            self.detector.observe("m1", OperationFailed("insert_money", "Invalid denomination.", i))
+        self.assertEqual(self.kinds(), [REJECTED_COINS])
+
+    def test_cooldown(self):
+        """Test an alert of a kind is raised at most once per cooldown on a machine."""
+        self.detector = AnomalyDetector(on_alert=self.raised.append, cooldown=60)
+        for timestamp in (0, 30, 100):
+            self.refund("m1", timestamp)
+        self.assertEqual([alert.timestamp for alert in self.raised if alert.kind == CHANGE_WITHOUT_PURCHASE],
+                         [6, 106])
+        self.assertEqual(self.detector.alerts, self.raised)
+
+    def test_constant_memory(self):
+        """Test the state of a machine does not grow with the number of events."""
+        self.refund("m1", 0)
+        state = self.detector._states["m1"]
+        sizes = (len(state.insert_times), state.refunds.memory_bytes)
+        for i in range(2000):
+            self.refund("m1", i * 10, coins=(200, i % 100 + 1))
+        self.assertEqual((len(state.insert_times), state.refunds.memory_bytes), sizes)
+        self.assertEqual(len(self.detector._states), 1)
+
+    def test_attached_machine(self):
+        """Test the detector follows a machine's events, flagging 200p coins returned as change."""
+        vending_machine = VendingMachine()
+        vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+        vending_machine.reload_currency(100, 10)
+        subscription = self.detector.attach(vending_machine, "machine-7")
+        try:
+            vending_machine.insert_money(200)
+            vending_machine.purchase_product(1)
+            vending_machine.dispense_change()
+            vending_machine.insert_money(200)
+            vending_machine.insert_money(200)
+            vending_machine.dispense_change()
+            self.assertTrue(subscription.flush(5))
+        finally:
+            vending_machine.events.unsubscribe(subscription)
+        self.assertEqual([(alert.machine_id, alert.kind) for alert in self.raised],
+                         [("machine-7", CHANGE_WITHOUT_PURCHASE)])
+
+    def test_invalid_thresholds(self):
+        """Test invalid thresholds are rejected."""
+        for kwargs in [{"repeat_threshold": 0}, {"burst_coins": 1}, {"burst_seconds": 0}]:
+            with self.subTest(**kwargs):
+                with self.assertRaises(ValueError):
+                    AnomalyDetector(**kwargs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from src.vending_machine.change import NO_CHANGE, ChangeVector
+from src.vending_machine.currency import Currency
+
+
+class TestChangeVector(unittest.TestCase):
+    def setUp(self):
+        """Set up 80p of change."""
+        self.change = ChangeVector.from_mapping({50: 1, 20: 1, 10: 1})
+
+    def test_counts_and_total(self):
+        """Test the counts are aligned with the denominations and the total is precomputed."""
+        self.assertEqual(self.change.counts, (0, 0, 1, 1, 1, 0, 0, 0))
+        self.assertEqual(self.change.total, 80)
+        self.assertEqual(self.change[20], 1)
+        self.assertEqual(self.change[200], 0)
+        self.assertEqual(self.change.to_dict(), {50: 1, 20: 1, 10: 1})
+
+    def test_invalid_counts(self):
+        """Test invalid denominations, negative counts and wrong widths are rejected."""
+        for counts in ({3: 1}, {50: -1}):
+            with self.subTest(counts=counts):
+                with self.assertRaises(ValueError):
+                    ChangeVector.from_mapping(counts)
+        with self.assertRaises(ValueError):
+            ChangeVector((1, 2))
+
+    def test_arithmetic(self):
+        """Test adding and subtracting vectors."""
+        total = self.change + ChangeVector.from_mapping({50: 2, 1: 3})
+        self.assertEqual(total.to_dict(), {50: 3, 20: 1, 10: 1, 1: 3})
+        self.assertEqual(total.total, 183)
+        self.assertEqual(total - self.change, ChangeVector.from_mapping({50: 2, 1: 3}))
+        with self.assertRaises(ValueError):
+            self.change - total
+
+    def test_no_change(self):
+        """Test the empty vector is falsy and equal to any other empty vector."""
+        self.assertFalse(NO_CHANGE)
+        self.assertTrue(self.change)
+        self.assertEqual(NO_CHANGE, ChangeVector.from_mapping({}))
+        self.assertEqual(len({NO_CHANGE, ChangeVector()}), 1)
+
+    def test_currency_dispense(self):
+        """Test dispensing a change vector takes the coins out of the tubes."""
+        currency = Currency()
+        total = currency.calculate_denominations_total()
+        change = currency.calculate_change(80)
+        self.assertEqual(change, self.change)
+        currency.dispense(change)
+        self.assertEqual(currency.denomination_counts[50], Currency.INITIAL_DENOMINATION_COUNT - 1)
+        self.assertEqual(currency.calculate_denominations_total(), total - 80)
+
+    def test_currency_dispense_insufficient(self):
+        """Test dispensing more coins than a tube holds is rejected without changes."""
+        currency = Currency()
+        with self.assertRaises(ValueError):
+            currency.dispense(ChangeVector.from_mapping({20: 1, 50: Currency.INITIAL_DENOMINATION_COUNT + 1}))
+        self.assertEqual(currency.denomination_counts[20], Currency.INITIAL_DENOMINATION_COUNT)
+
+
+if __name__ == "__main__":
+    unittest.main()
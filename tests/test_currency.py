@@ -1,6 +1,7 @@
 import unittest
 
 from src.vending_machine.currency import Currency
+from src.vending_machine.snapshot import VersionConflict
 
 
 class TestCurrency(unittest.TestCase):
@@ -28,13 +29,13 @@ class TestCurrency(unittest.TestCase):
     def test_calculate_change_success(self):
         """Test calculating change for various amounts."""
         test_cases = [
-            (200, {200: -1}),
-            (50, {50: -1}),
-            (70, {50: -1, 20: -1}),  # Example of multiple denominations
+            (200, {200: 1}),
+            (50, {50: 1}),
+            (70, {50: 1, 20: 1}),  # Example of multiple denominations
         ]
         for amount, expected_change in test_cases:
             with self.subTest(amount=amount):
-                self.assertEqual(self.currency.calculate_change(amount), expected_change)
+                self.assertEqual(self.currency.calculate_change(amount).to_dict(), expected_change)
 
     def test_update_denomination_valid(self):
         """Test updating valid denominations with various values."""
@@ -120,6 +121,86 @@ class TestCurrency(unittest.TestCase):
             with self.subTest(updates=updates):
                 self.assertRaises((TypeError, ValueError), self.currency.update_denomination_counts, updates)
 
+    def test_load_counts(self):
+        """Test loading denomination counts and stored money."""
+        self.currency.load_counts({100: 3, 50: 20}, {200: 2})
+        self.assertEqual(self.currency.denomination_counts[100], 3)
+        self.assertEqual(self.currency.denomination_counts[50], 20)
+        self.assertEqual(self.currency.inserted_money, {200: 2})
+
+    def test_load_counts_invalid(self):
+        """Test loading invalid denominations or out-of-range counts raises an error."""
+        invalid_cases = [
+            ({3: 1}, {}),  # Invalid denomination
+            ({10: -1}, {}),  # Negative count
+            ({20: Currency.MAX_DENOMINATION_COUNT + 1}, {}),  # Exceed max count
+            ({}, {3: 1}),  # Invalid stored denomination
+        ]
+        for counts, inserted in invalid_cases:
+            with self.subTest(counts=counts, inserted=inserted):
+                with self.assertRaises(ValueError):
+                    self.currency.load_counts(counts, inserted)
+
+
+    def test_version(self):
+        """Test the version increases with every change to the counts."""
+        self.currency.insert_to_storage(100)
+        self.currency.update_denomination_count(50, 1)
+        self.currency.update_denomination_counts({20: 1, 10: 1})
+        self.assertEqual(self.currency.version, 3)
+
+    def test_str_representation_updates(self):
+        """Test the cached string representation is rendered again after a change."""
+        self.assertIs(str(self.currency), str(self.currency))
+        self.currency.insert_to_storage(100)
+        self.assertIn("Stored money: {100: 1}", str(self.currency))
+
+    def test_denomination_counts_view(self):
+        """Test the counts view is read-only and reused until the counts change."""
+        counts = self.currency.denomination_counts
+        self.assertIs(self.currency.denomination_counts, counts)
+        with self.assertRaises(TypeError):
+            counts[100] = 0
+        self.currency.update_denomination_count(100, 1)
+        self.assertEqual(counts[100], Currency.INITIAL_DENOMINATION_COUNT)  # Old view is unchanged
+        self.assertEqual(self.currency.denomination_counts[100], Currency.INITIAL_DENOMINATION_COUNT + 1)
+
+    def test_tube_versions(self):
+        """Test only the versions of the tubes whose counts changed are incremented."""
+        self.currency.update_denomination_counts({200: 1, 50: -2})
+        self.currency.update_denomination_count(200, 1)
+        self.currency.insert_to_storage(100)
+        self.assertEqual(self.currency.tube_versions[200], 2)
+        self.assertEqual(self.currency.tube_versions[50], 1)
+        self.assertEqual(self.currency.tube_versions[100], 0)
+        self.currency.ensure_tube_version(100, 0)
+        with self.assertRaises(VersionConflict):
+            self.currency.ensure_tube_version(200, 1)
+
+    def test_restore(self):
+        """Test dispensed change is put back into the tubes, bumping only the versions of the tubes it used."""
+        change = self.currency.calculate_change(170)
+        self.currency.dispense(change)
+        versions = dict(self.currency.tube_versions)
+        self.currency.restore(change)
+        self.assertEqual(self.currency.denomination_counts,
+                         {denom: Currency.INITIAL_DENOMINATION_COUNT for denom in Currency.DENOMINATIONS})
+        self.assertEqual(self.currency.calculate_denominations_total(),
+                         sum(denom * Currency.INITIAL_DENOMINATION_COUNT for denom in Currency.DENOMINATIONS))
+        for denom in Currency.DENOMINATIONS:
+            with self.subTest(denom=denom):
+                self.assertEqual(self.currency.tube_versions[denom], versions[denom] + (denom in change.to_dict()))
+
+    def test_restore_exceed_max_count(self):
+        """Test restoring change that does not fit in a tube changes nothing."""
+        change = self.currency.calculate_change(100)
+        self.currency.update_denomination_count(100, Currency.MAX_DENOMINATION_COUNT
+                                                - Currency.INITIAL_DENOMINATION_COUNT)
+        counts = dict(self.currency.denomination_counts)
+        with self.assertRaises(ValueError):
+            self.currency.restore(change)
+        self.assertEqual(self.currency.denomination_counts, counts)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,222 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import unittest
+
+from src.vending_machine.events import (BLOCK, DROP_NEWEST, DROP_OLDEST, ChangeDispensed, CoinInserted,
+                                        CurrencyReloaded, EventBus, OperationFailed, ProductAdded, ProductPurchased,
+                                        ProductReloaded)
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.payments import Authorization, PaymentProvider
+from src.vending_machine.product import Product
+from src.vending_machine.snapshot import VersionConflict
+
+TIMEOUT = 5
+
+
+class UnreachableProvider(PaymentProvider):
+    """A payment provider whose gateway cannot be reached."""
+
+    def authorize(self, amount: int) -> Authorization:
+        raise ConnectionRefusedError("Gateway unreachable.")
+
+    def capture(self, authorization: Authorization) -> None:
+        pass
+
+    def void(self, authorization: Authorization) -> None:
+        pass
+
+
+class TestEventBus(unittest.TestCase):
+    def setUp(self):
+        """Set up an event bus and a list collecting delivered batches."""
+        self.bus = EventBus()
+        self.batches = []
+
+    def tearDown(self):
+        self.bus.close()
+
+    def test_inactive_without_subscribers(self):
+        """Test the bus reports no subscribers until one subscribes."""
+        self.assertFalse(self.bus.active)
+        subscription = self.bus.subscribe(self.batches.append)
+        self.assertTrue(self.bus.active)
+        self.bus.unsubscribe(subscription)
+        self.assertFalse(self.bus.active)
+
+    def test_batched_delivery(self):
+        """Test events are delivered in order, in batches of at most the batch size."""
+        gate = threading.Event()
+        self.bus.subscribe(lambda batch: (gate.wait(TIMEOUT), self.batches.append(batch)), batch_size=3)
+        for event in range(7):
+            self.bus.publish(event)
+            if event == 0:
+                gate.set()
+        self.assertTrue(self.bus.flush(TIMEOUT))
+        self.assertEqual([event for batch in self.batches for event in batch], list(range(7)))
+        self.assertTrue(all(len(batch) <= 3 for batch in self.batches))
+
+    def test_drop_policies(self):
+        """Test full buffers drop the oldest or newest events."""
+        test_cases = [
+            (DROP_OLDEST, [0, 3, 4]),  # 0 is already being delivered when the buffer fills up
+            (DROP_NEWEST, [0, 1, 2]),
+        ]
+        for policy, expected in test_cases:
+            with self.subTest(policy=policy):
+                bus = EventBus()
+                delivered = []
+                started, gate = threading.Event(), threading.Event()
+                subscription = bus.subscribe(
+                    lambda batch: (started.set(), gate.wait(TIMEOUT), delivered.extend(batch)),
+                    capacity=2, policy=policy, batch_size=1)
+                bus.publish(0)
+                started.wait(TIMEOUT)
+                for event in range(1, 5):
+                    bus.publish(event)
+                gate.set()
+                self.assertTrue(bus.flush(TIMEOUT))
+                self.assertEqual(delivered, expected)
+                self.assertEqual(subscription.dropped, 2)
+                bus.close()
+
+    def test_block_policy(self):
+        """Test a full buffer blocks the publisher until the subscriber catches up."""
+        gate = threading.Event()
+        self.bus.subscribe(lambda batch: (gate.wait(TIMEOUT), self.batches.append(batch)),
+                           capacity=1, policy=BLOCK, batch_size=1)
+        publisher = threading.Thread(target=lambda: [self.bus.publish(event) for event in range(4)])
+        publisher.start()
+        publisher.join(0.1)
+        self.assertTrue(publisher.is_alive())  # Blocked on the full buffer
+        gate.set()
+        publisher.join(TIMEOUT)
+        self.assertTrue(self.bus.flush(TIMEOUT))
+        self.assertEqual(self.batches, [[0], [1], [2], [3]])
+
+    def test_offer_after_close(self):
+        """Test events offered to a closed subscription are discarded instead of blocking or being buffered."""
+        subscription = self.bus.subscribe(self.batches.append, capacity=1, policy=BLOCK)
+        self.bus.unsubscribe(subscription)
+        publisher = threading.Thread(target=lambda: [subscription.offer(event) for event in range(3)])
+        publisher.start()
+        publisher.join(TIMEOUT)
+        self.assertFalse(publisher.is_alive())
+        self.assertTrue(subscription.flush(TIMEOUT))
+        self.assertEqual(self.batches, [])
+
+    def test_invalid_subscription(self):
+        """Test invalid subscription settings raise an error."""
+        invalid_cases = [
+            {"capacity": 0},
+            {"batch_size": 0},
+            {"policy": "ignore"},
+        ]
+        for kwargs in invalid_cases:
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaises(ValueError):
+                    self.bus.subscribe(self.batches.append, **kwargs)
+
+    def test_asyncio_imported_lazily(self):
+        """Test importing the vending machine does not import asyncio, which slows down CLI startup."""
+        code = "import sys, src.vending_machine.machine; print('asyncio' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+
+class TestAsyncSubscriber(unittest.IsolatedAsyncioTestCase):
+    async def test_async_delivery(self):
+        """Test a coroutine subscriber receives events published from another thread."""
+        bus = EventBus()
+        delivered = []
+        done = asyncio.Event()
+
+        async def handler(batch):
+            delivered.extend(batch)
+            if len(delivered) == 5:
+                done.set()
+
+        bus.subscribe_async(handler, batch_size=2)
+        await asyncio.to_thread(lambda: [bus.publish(event) for event in range(5)])
+        await asyncio.wait_for(done.wait(), TIMEOUT)
+        self.assertEqual(delivered, list(range(5)))
+        bus.close()
+
+    async def test_block_policy_rejected(self):
+        """Test asynchronous subscribers cannot block the publisher."""
+        with self.assertRaises(ValueError):
+            EventBus().subscribe_async(lambda batch: None, policy=BLOCK)
+
+
+class TestMachineEvents(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine with a subscriber collecting every event."""
+        self.vending_machine = VendingMachine()
+        self.events = []
+        self.vending_machine.events.subscribe(self.events.extend)
+
+    def received(self) -> list:
+        self.assertTrue(self.vending_machine.events.flush(TIMEOUT))
+        return [type(event) for event in self.events]
+
+    def test_state_changes_published(self):
+        """Test every state change publishes its event."""
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(1)
+        self.vending_machine.dispense_change()
+        self.vending_machine.reload_product(1, 2)
+        self.vending_machine.reload_currency(100, 1)
+        self.vending_machine.reload_currencies({50: 1})
+        self.assertEqual(self.received(), [ProductAdded, CoinInserted, ProductPurchased, ChangeDispensed,
+                                           ProductReloaded, CurrencyReloaded, CurrencyReloaded])
+        self.assertEqual(self.events[3].amount, 80)
+        self.assertEqual(self.events[4].stock, 6)
+
+    def test_failures_published(self):
+        """Test rejected operations publish a failure event and still raise."""
+        with self.assertRaises(ValueError):
+            self.vending_machine.insert_money(3)
+        with self.assertRaises(ValueError):
+            self.vending_machine.purchase_product(99)
+        self.assertEqual(self.received(), [OperationFailed, OperationFailed])
+        self.assertEqual([event.operation for event in self.events], ["insert_money", "purchase_product"])
+
+    def test_all_failures_published(self):
+        """Test failures other than invalid arguments, e.g. version conflicts or gateway errors, are published."""
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+        with self.assertRaises(VersionConflict):
+            self.vending_machine.reload_currency(100, 1, expected_version=99)
+        with self.assertRaises(ConnectionRefusedError):
+            self.vending_machine.purchase_cashless(1, UnreachableProvider())
+        self.assertEqual(self.received(), [ProductAdded, OperationFailed, OperationFailed])
+        self.assertEqual([event.operation for event in self.events[1:]], ["reload_currency", "purchase_cashless"])
+
+    def test_blocked_subscriber_does_not_hold_lock(self):
+        """Test a publisher blocked by a full subscriber buffer does not hold up other callers of the machine."""
+        vending_machine = VendingMachine()
+        started, gate = threading.Event(), threading.Event()
+        balances = []
+        vending_machine.events.subscribe(
+            lambda batch: (started.set(), gate.wait(TIMEOUT), balances.extend(event.balance for event in batch)),
+            capacity=1, policy=BLOCK, batch_size=1)
+        vending_machine.insert_money(100)
+        started.wait(TIMEOUT)
+        publisher = threading.Thread(target=lambda: [vending_machine.insert_money(100) for _ in range(2)])
+        publisher.start()
+        publisher.join(0.1)
+        self.assertTrue(publisher.is_alive())  # Blocked on the full buffer
+        customer = threading.Thread(target=vending_machine.insert_money, args=(100,))
+        customer.start()
+        customer.join(TIMEOUT)
+        self.assertFalse(customer.is_alive())
+        gate.set()
+        publisher.join(TIMEOUT)
+        self.assertTrue(vending_machine.events.flush(TIMEOUT))
+        self.assertEqual(balances, [100, 200, 300, 400])
+        vending_machine.events.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
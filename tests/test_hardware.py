@@ -0,0 +1,192 @@
+import unittest
+from datetime import date
+
+from src.vending_machine.hardware import (AsyncVendingMachine, CoinHopper, CoinValidator, Display, PartialPayout,
+                                          SimulatedCoinHopper, SimulatedCoinValidator, SimulatedDisplay,
+                                          SimulatedSpiralMotor, SpiralMotor)
+from src.vending_machine.product import Product
+
+
+class FaultyMotor(SimulatedSpiralMotor):
+    """Spiral motor that fails on every vend."""
+
+    async def vend(self, product_id: int) -> None:
+        await self._operate()
+        raise OSError("Spiral motor stalled.")
+
+
+class FaultyHopper(SimulatedCoinHopper):
+    """Coin hopper that fails on every payout."""
+
+    async def payout(self, change) -> None:
+        await self._operate()
+        raise OSError("Coin hopper jammed.")
+
+
+class JammingHopper(SimulatedCoinHopper):
+    """Coin hopper that pays out once, then fails on every payout."""
+
+    async def payout(self, change) -> None:
+        if self.paid_out:
+            await self._operate()
+            raise OSError("Coin hopper jammed.")
+        await super().payout(change)
+
+
+class FaultyDisplay(SimulatedDisplay):
+    """Display that fails on every update."""
+
+    async def show(self, message: str) -> None:
+        raise OSError("Display disconnected.")
+
+
+class TestAsyncVendingMachine(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """Set up an asynchronous vending machine with fast simulated devices."""
+        self.validator = SimulatedCoinValidator(delay=0.02, rejected=frozenset({5}))
+        self.motor = SimulatedSpiralMotor(delay=0.05)
+        self.hopper = SimulatedCoinHopper(delay=0.03)
+        self.display = SimulatedDisplay(delay=0.03)
+        self.vending_machine = AsyncVendingMachine(validator=self.validator, motor=self.motor,
+                                                   hopper=self.hopper, display=self.display)
+        self.product = Product(id_=1, name="Coke", price=120, quantity=5)
+        self.vending_machine.machine.add_product(self.product)
+
+    async def test_customer_session(self):
+        """Test a full session updates state and drives every device."""
+        await self.vending_machine.insert_money(100)
+        await self.vending_machine.insert_money(100)
+        await self.vending_machine.purchase_product(1)
+        change = await self.vending_machine.dispense_change()
+        await self.vending_machine.drain()
+        self.assertEqual(change.to_dict(), {50: 1, 20: 1, 10: 1})
+        self.assertEqual(self.vending_machine.balance, 0)
+        self.assertEqual(self.product.quantity, 4)
+        self.assertEqual(self.motor.vended, [1])
+        self.assertEqual(self.hopper.paid_out, [change])
+        self.assertIn("Thank you!", self.display.messages)
+
+    async def test_payout_overlaps_vend(self):
+        """Test the change payout starts before the spiral vend has finished."""
+        await self.vending_machine.insert_money(200)
+        await self.vending_machine.purchase_product(1)
+        await self.vending_machine.dispense_change()
+        (vend_start, vend_end), = self.motor.history
+        (payout_start, payout_end), = self.hopper.history
+        self.assertLess(payout_start, vend_end)
+        self.assertLess(vend_start, payout_end)
+
+    async def test_validation_overlaps_display(self):
+        """Test the next coin is validated while the previous display update is still running."""
+        await self.vending_machine.insert_money(100)
+        await self.vending_machine.insert_money(50)
+        await self.vending_machine.drain()
+        first_display_end = self.display.history[0][1]
+        second_validation_start = self.validator.history[1][0]
+        self.assertLess(second_validation_start, first_display_end)
+
+    async def test_rejected_coin(self):
+        """Test a coin rejected by the validator is not credited."""
+        with self.assertRaises(ValueError):
+            await self.vending_machine.insert_money(5)
+        self.assertEqual(self.vending_machine.balance, 0)
+
+    async def test_failed_purchase_does_not_vend(self):
+        """Test the motor is not started when the purchase fails."""
+        await self.vending_machine.insert_money(100)
+        with self.assertRaises(ValueError):
+            await self.vending_machine.purchase_product(1)
+        await self.vending_machine.drain()
+        self.assertEqual(self.motor.vended, [])
+        self.assertEqual(self.product.quantity, 5)
+
+    async def test_failed_vend_refunded(self):
+        """Test a product the motor fails to vend is returned to stock and its price paid out as change."""
+        vending_machine = AsyncVendingMachine(machine=self.vending_machine.machine, validator=self.validator,
+                                              motor=FaultyMotor(delay=0.01), hopper=self.hopper,
+                                              display=self.display)
+        await vending_machine.insert_money(200)
+        await vending_machine.purchase_product(1)
+        with self.assertLogs("src.vending_machine.hardware", "ERROR"):
+            change = await vending_machine.dispense_change()
+        await vending_machine.drain()
+        self.assertEqual(change.total, 200)
+        self.assertEqual(sum(paid.total for paid in self.hopper.paid_out), 200)
+        self.assertEqual(vending_machine.balance, 0)
+        self.assertEqual(self.product.quantity, 5)
+
+    async def test_failed_vend_returned_to_slot_and_lot(self):
+        """Test a product the motor fails to vend goes back to the slot and the dated lot it was sold from."""
+        machine = self.vending_machine.machine
+        machine.add_product(Product(id_=2, name="Sandwich", price=120, quantity=0))
+        machine.assign_slots(2, [3, 3])
+        machine.reload_product(2, 2, date(2030, 1, 31))
+        machine.reload_product(2, 3, date(2030, 6, 30))
+        quantities = [slot.quantity for slot in machine.get_slots(2)]
+        vending_machine = AsyncVendingMachine(machine=machine, validator=self.validator,
+                                              motor=FaultyMotor(delay=0.01), hopper=self.hopper,
+                                              display=self.display)
+        await vending_machine.insert_money(200)
+        await vending_machine.purchase_product(2)
+        with self.assertLogs("src.vending_machine.hardware", "ERROR"):
+            await vending_machine.drain()
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in machine.get_lots(2)],
+                         [(date(2030, 1, 31), 2), (date(2030, 6, 30), 3)])
+        self.assertEqual([slot.quantity for slot in machine.get_slots(2)], quantities)
+        self.assertEqual(sum(slot.vends for slot in machine.get_slots(2)), 1)  # The motor still turned
+        self.assertEqual(vending_machine.balance, 200)
+
+    async def test_partial_payout_reported(self):
+        """Test a hopper failing after the change was paid out reports what was paid and credits the rest back."""
+        vending_machine = AsyncVendingMachine(machine=self.vending_machine.machine, validator=self.validator,
+                                              motor=FaultyMotor(delay=0.01), hopper=JammingHopper(delay=0.01),
+                                              display=self.display)
+        await vending_machine.insert_money(200)
+        await vending_machine.purchase_product(1)
+        with self.assertLogs("src.vending_machine.hardware", "ERROR") as logs:
+            with self.assertRaises(PartialPayout) as raised:
+                await vending_machine.dispense_change()
+        await vending_machine.drain()
+        self.assertEqual(raised.exception.paid.to_dict(), {50: 1, 20: 1, 10: 1})
+        self.assertIsInstance(raised.exception.__cause__, OSError)
+        self.assertIn("80p of change was paid out", logs.output[-1])
+        self.assertEqual(vending_machine.balance, 120)
+        self.assertEqual(self.product.quantity, 5)
+
+    async def test_failed_payout_restored(self):
+        """Test change the hopper fails to pay out is credited back to the balance and the tubes."""
+        vending_machine = AsyncVendingMachine(machine=self.vending_machine.machine, validator=self.validator,
+                                              motor=self.motor, hopper=FaultyHopper(delay=0.01),
+                                              display=self.display)
+        counts = dict(vending_machine.machine.get_denomination_counts())
+        await vending_machine.insert_money(200)
+        await vending_machine.purchase_product(1)
+        with self.assertRaises(OSError):
+            await vending_machine.dispense_change()
+        await vending_machine.drain()
+        self.assertEqual(vending_machine.balance, 80)
+        self.assertEqual(dict(vending_machine.machine.get_denomination_counts()), counts)
+        self.assertEqual(self.motor.vended, [1])
+
+    async def test_display_failure_logged(self):
+        """Test a failed display update is logged instead of being dropped."""
+        vending_machine = AsyncVendingMachine(machine=self.vending_machine.machine, validator=self.validator,
+                                              motor=self.motor, hopper=self.hopper, display=FaultyDisplay())
+        with self.assertLogs("src.vending_machine.hardware", "ERROR") as logs:
+            await vending_machine.insert_money(100)
+            await vending_machine.drain()
+        self.assertIn("Display update failed.", logs.output[0])
+        self.assertEqual(vending_machine.balance, 100)
+
+
+class TestDeviceInterfaces(unittest.TestCase):
+    def test_abstract(self):
+        """Test the device interfaces cannot be instantiated without implementing their operations."""
+        for interface in (CoinValidator, SpiralMotor, CoinHopper, Display):
+            with self.subTest(interface=interface.__name__):
+                with self.assertRaises(TypeError):
+                    interface()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
+import json
 import unittest
+from datetime import date
 
-from src.vending_machine.inventory import Inventory
+from src.vending_machine.inventory import Inventory, SoldUnit
 from src.vending_machine.product import Product
 
 
@@ -92,6 +94,125 @@ class TestInventory(unittest.TestCase):
         product_list = self.inventory.list_products()
         self.assertIn(str(self.product), product_list)
 
+    def test_products(self):
+        """Test the products property returns all products in the inventory."""
+        self.assertEqual(self.inventory.products, [self.product])
+
+    def test_list_products_cached(self):
+        """Test the listing is reused until a product changes, even when changed outside the inventory."""
+        self.inventory.add_product(Product(id_=2, name="Chips", price=150, quantity=20))
+        first = self.inventory.list_products()
+        second = self.inventory.list_products()
+        self.assertEqual(first, second)
+        self.assertIs(first[1], second[1])
+        version = self.inventory.version
+
+        self.product.reduce_quantity()
+        self.assertEqual(self.inventory.version, version + 1)
+        third = self.inventory.list_products()
+        self.assertEqual(third[0], "Soda (ID: 1) - Price: 120p, Stock: 9")
+        self.assertIs(third[1], first[1])  # Unchanged product is not rendered again
+
+    def test_list_products_json(self):
+        """Test the JSON listing reflects the current stock."""
+        self.inventory.reduce_stock(1)
+        self.assertEqual(json.loads(self.inventory.list_products_json()),
+                         [{"id": 1, "name": "Soda", "price": 120, "quantity": 9, "version": 1}])
+
+    def test_snapshot(self):
+        """Test product snapshots are reused for unchanged products."""
+        self.inventory.add_product(Product(id_=2, name="Chips", price=150, quantity=20))
+        first = self.inventory.snapshot()
+        self.assertIs(self.inventory.snapshot(), first)
+        self.inventory.reduce_stock(1)
+        second = self.inventory.snapshot()
+        self.assertEqual(second[0].quantity, 9)
+        self.assertEqual(first[0].quantity, 10)
+        self.assertIs(second[1], first[1])
+
+    def test_reduce_stock_earliest_expiry_first(self):
+        """Test stock is taken from the earliest-expiring lot, and undated stock last."""
+        self.inventory.reload_product(1, 2, date(2024, 5, 9))
+        self.inventory.reload_product(1, 1, date(2024, 5, 1))
+        self.inventory.reduce_stock(1)
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in self.inventory.get_lots(1)], [(date(2024, 5, 9), 2)])
+        for _ in range(3):
+            self.inventory.reduce_stock(1)
+        self.assertEqual(self.inventory.get_lots(1), [])
+        self.assertEqual(self.product.quantity, 9)
+
+    def test_return_unit(self):
+        """Test a sold unit is returned to the lot it was taken from, or to a new lot if that one sold out."""
+        self.inventory.reload_product(1, 2, date(2024, 5, 9))
+        self.inventory.reload_product(1, 1, date(2024, 5, 1))
+        units = [self.inventory.reduce_stock(1) for _ in range(3)]
+        self.assertEqual(units, [SoldUnit(None, date(2024, 5, 1)), SoldUnit(None, date(2024, 5, 9)),
+                                 SoldUnit(None, date(2024, 5, 9))])
+        self.inventory.return_unit(1, *units[1])
+        self.inventory.return_unit(1, *units[0])
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in self.inventory.get_lots(1)],
+                         [(date(2024, 5, 1), 1), (date(2024, 5, 9), 1)])
+        self.inventory.return_unit(1, *units[2])
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in self.inventory.get_lots(1)],
+                         [(date(2024, 5, 1), 1), (date(2024, 5, 9), 2)])
+        self.inventory.return_unit(1)  # Undated stock
+        self.assertEqual(self.product.quantity, 14)
+        self.assertEqual(len(self.inventory.get_lots(1)), 2)
+
+    def test_return_unit_to_slot(self):
+        """Test a sold unit is returned to the slot it was vended from and rejected when the product is full."""
+        self.inventory.assign_slots(1, [5, 6])
+        unit = self.inventory.reduce_stock(1)
+        self.inventory.return_unit(1, *unit)
+        self.assertEqual([slot.quantity for slot in self.inventory.get_slots(1)], [5, 5])
+        self.inventory.reload_product(1, 1)
+        with self.assertRaises(ValueError):
+            self.inventory.return_unit(1, *unit)
+        self.assertEqual(self.product.quantity, 11)
+
+    def test_reload_product_invalid_expiry(self):
+        """Test reloading with an expiry that is not a date raises an error."""
+        with self.assertRaises(TypeError):
+            self.inventory.reload_product(1, 1, "2024-05-01")
+
+    def test_assign_slots(self):
+        """Test assigning slots distributes the current stock and sets the product capacity."""
+        self.inventory.assign_slots(1, [10, 10, 5])
+        self.assertEqual([slot.quantity for slot in self.inventory.get_slots(1)], [4, 4, 2])
+        self.assertEqual(self.product.capacity, 25)
+        self.inventory.reload_product(1, 15)
+        self.assertEqual(self.product.quantity, 25)
+        with self.assertRaises(ValueError):
+            self.inventory.reload_product(1, 1)
+
+    def test_assign_slots_below_stock(self):
+        """Test slots that cannot hold the current stock are rejected."""
+        with self.assertRaises(ValueError):
+            self.inventory.assign_slots(1, [5, 4])
+        self.assertEqual(self.inventory.get_slots(1), [])
+
+    def test_jammed_slots_availability(self):
+        """Test a product is unavailable when all slots holding stock are jammed."""
+        self.inventory.assign_slots(1, [10])
+        self.inventory.set_slot_jammed(1, 0)
+        self.assertFalse(self.inventory.is_product_available(1))
+        with self.assertRaises(ValueError):
+            self.inventory.reduce_stock(1)
+        self.inventory.set_slot_jammed(1, 0, jammed=False)
+        self.assertEqual(self.inventory.reduce_stock(1).slot, 0)
+        self.assertEqual(self.product.quantity, 9)
+
+    def test_set_slot_jammed_without_slots(self):
+        """Test reporting a jam for a product without slots raises an error."""
+        with self.assertRaises(ValueError):
+            self.inventory.set_slot_jammed(1, 0)
+
+    def test_search_products(self):
+        """Test products added to the inventory can be searched, optionally in stock only."""
+        self.inventory.add_product(Product(id_=2, name="Soda Light", price=120))
+        self.assertEqual([product.id for product in self.inventory.search_products("so")], [1, 2])
+        self.assertEqual([product.id for product in self.inventory.search_products("so", in_stock_only=True)], [1])
+
 
 if __name__ == "__main__":
     unittest.main()
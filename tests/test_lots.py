@@ -0,0 +1,50 @@
+import unittest
+from datetime import date
+
+from src.vending_machine.lots import ExpiryIndex
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+
+
+class TestExpiryIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up two machines sharing a fleet-wide expiry index."""
+        self.index = ExpiryIndex()
+        self.machines = {}
+        for machine_id in ("A", "B"):
+            vending_machine = VendingMachine()
+            vending_machine.add_product(Product(id_=1, name="Sandwich", price=300))
+            vending_machine.attach_expiry_index(self.index, machine_id)
+            self.machines[machine_id] = vending_machine
+        self.machines["A"].reload_product(1, 2, date(2024, 5, 3))
+        self.machines["B"].reload_product(1, 3, date(2024, 5, 1))
+        self.machines["B"].reload_product(1, 4, date(2024, 5, 9))
+
+    def expiring(self, until: date) -> list[tuple]:
+        return [(lot.machine_id, lot.expiry, lot.quantity) for lot in self.index.expiring(until)]
+
+    def test_expiring(self):
+        """Test lots expiring on or before a date are found across machines, earliest first."""
+        self.assertEqual(self.expiring(date(2024, 5, 3)), [("B", date(2024, 5, 1), 3), ("A", date(2024, 5, 3), 2)])
+        self.assertEqual(self.expiring(date(2024, 4, 30)), [])
+
+    def test_sold_out_lots_excluded(self):
+        """Test sold-out lots are no longer reported and are eventually compacted."""
+        for _ in range(3):
+            self.machines["B"].insert_money(200)
+            self.machines["B"].insert_money(100)
+            self.machines["B"].purchase_product(1)
+        self.assertEqual(self.expiring(date(2024, 5, 31)), [("A", date(2024, 5, 3), 2), ("B", date(2024, 5, 9), 4)])
+        self.assertEqual(len(self.index), 2)
+
+    def test_lots_reloaded_before_attaching(self):
+        """Test lots reloaded before attaching the index are registered too."""
+        vending_machine = VendingMachine()
+        vending_machine.add_product(Product(id_=1, name="Salad", price=350))
+        vending_machine.reload_product(1, 1, date(2024, 5, 2))
+        vending_machine.attach_expiry_index(self.index, "C")
+        self.assertEqual(self.expiring(date(2024, 5, 2)), [("B", date(2024, 5, 1), 3), ("C", date(2024, 5, 2), 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
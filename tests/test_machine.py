@@ -1,7 +1,9 @@
+import json
 import unittest
 
 from src.vending_machine.machine import VendingMachine
 from src.vending_machine.product import Product
+from src.vending_machine.snapshot import VersionConflict
 
 
 class TestVendingMachine(unittest.TestCase):
@@ -64,7 +66,7 @@ class TestVendingMachine(unittest.TestCase):
         self.vending_machine.purchase_product(1)  # Purchase product ID 1
         self.assertEqual(self.vending_machine.balance, 80)  # 200 - 120 is 80
         change = self.vending_machine.dispense_change()
-        self.assertEqual(change, {50: -1, 20: -1, 10: -1})
+        self.assertEqual(change.to_dict(), {50: 1, 20: 1, 10: 1})
 
     def test_purchase_product_insufficient_balance(self):
         """Test purchasing a product with insufficient balance."""
@@ -84,6 +86,25 @@ class TestVendingMachine(unittest.TestCase):
         self.vending_machine.reload_currency(100, 5)  # Reload 5 of 100 pence
         self.assertEqual(self.vending_machine.get_denomination_counts()[100], 15)
 
+    def test_reload_currencies(self):
+        """Test reloading several denominations at once."""
+        self.vending_machine.reload_currencies({100: 5, 2: 3})
+        counts = self.vending_machine.get_denomination_counts()
+        self.assertEqual((counts[100], counts[2]), (15, 13))
+
+    def test_reload_currencies_invalid(self):
+        """Test an invalid update leaves every denomination unchanged."""
+        invalid_cases = [
+            {100: 5, 3: 1},  # Invalid denomination
+            {100: 5, 50: -1},  # Negative quantity
+            {100: 5, 20: 11},  # Exceed max count
+        ]
+        for counts in invalid_cases:
+            with self.subTest(counts=counts):
+                with self.assertRaises(ValueError):
+                    self.vending_machine.reload_currencies(counts)
+                self.assertEqual(self.vending_machine.get_denomination_counts()[100], 10)
+
     def test_list_products_returns_all_products(self):
         """List all products in the inventory."""
         self.vending_machine.add_products(self.product_list)
@@ -97,6 +118,79 @@ class TestVendingMachine(unittest.TestCase):
         products = self.vending_machine.list_products()
         self.assertEqual(products, [])
 
+    def test_str_representation_updates(self):
+        """Test the cached state summary reflects balance, currency and inventory changes."""
+        self.vending_machine.add_product(self.product1)
+        self.assertIs(str(self.vending_machine), str(self.vending_machine))
+        self.vending_machine.insert_money(200)
+        self.assertIn("Balance=200", str(self.vending_machine))
+        self.vending_machine.purchase_product(1)
+        self.vending_machine.dispense_change()
+        self.assertIn("Balance=0", str(self.vending_machine))
+        self.assertIn("Stored money: {200: 1}", str(self.vending_machine))
+
+    def test_list_products_json(self):
+        """Test listing products as JSON."""
+        self.vending_machine.add_products(self.product_list)
+        products = json.loads(self.vending_machine.list_products_json())
+        self.assertEqual([product["id"] for product in products], [1, 2, 3])
+
+    def test_snapshot(self):
+        """Test snapshots are reused while nothing changes and share unchanged parts."""
+        self.vending_machine.add_products(self.product_list)
+        first = self.vending_machine.snapshot()
+        self.assertIs(self.vending_machine.snapshot(), first)
+
+        self.vending_machine.insert_money(200)
+        second = self.vending_machine.snapshot()
+        self.assertGreater(second.version, first.version)
+        self.assertEqual(second.balance, 200)
+        self.assertIs(second.products, first.products)
+        self.assertIs(second.denomination_counts, first.denomination_counts)
+        self.assertEqual(second.inserted_money, {200: 1})
+
+        self.vending_machine.purchase_product(1)
+        third = self.vending_machine.snapshot()
+        self.assertEqual(third.products[0].quantity, 4)
+        self.assertIs(third.products[1], first.products[1])
+        self.assertIs(third.inserted_money, second.inserted_money)
+
+    def test_from_snapshot(self):
+        """Test a machine restored from a snapshot has the same state."""
+        self.vending_machine.add_products(self.product_list)
+        self.vending_machine.insert_money(100)
+        self.vending_machine.purchase_product(2)
+        restored = VendingMachine.from_snapshot(self.vending_machine.snapshot())
+        self.assertEqual(restored.list_products(), self.vending_machine.list_products())
+        self.assertEqual(restored.get_stored_money(), {100: 1})
+        self.assertEqual(restored.balance, 0)
+
+    def test_conditional_purchase(self):
+        """Test a purchase with a stale product version is rejected without changing the state."""
+        self.vending_machine.add_products(self.product_list)
+        version = self.vending_machine.snapshot().products[0].version
+        self.vending_machine.insert_money(200)
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(1, expected_version=version)
+        with self.assertRaises(VersionConflict):
+            self.vending_machine.purchase_product(1, expected_version=version)
+        self.assertEqual(self.vending_machine.balance, 280)
+        self.assertEqual(self.product1.quantity, 4)
+
+    def test_conditional_reloads(self):
+        """Test reloads apply only while the product or tube is at the expected version."""
+        self.vending_machine.add_products(self.product_list)
+        snapshot = self.vending_machine.snapshot()
+        self.vending_machine.reload_product(2, 1, expected_version=snapshot.products[1].version)
+        with self.assertRaises(VersionConflict):
+            self.vending_machine.reload_product(2, 1, expected_version=snapshot.products[1].version)
+        self.vending_machine.reload_currency(200, 1, expected_version=snapshot.tube_versions[200])
+        with self.assertRaises(VersionConflict):
+            self.vending_machine.reload_currencies({100: 1, 200: 1}, expected_versions=dict(snapshot.tube_versions))
+        self.assertEqual(self.product2.quantity, 4)
+        self.assertEqual(self.vending_machine.get_denomination_counts()[100], 10)
+        self.assertEqual(self.vending_machine.get_denomination_counts()[200], 11)
+
 
 if __name__ == "__main__":
     unittest.main()
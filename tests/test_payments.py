@@ -0,0 +1,180 @@
+import statistics
+import time
+import unittest
+
+from src.vending_machine.events import OperationFailed
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.payments import (Authorization, GatewayPaymentProvider, MockPaymentGateway,
+                                          PaymentDeclined, PaymentProvider)
+from src.vending_machine.product import Product
+
+
+class SellOutProvider(PaymentProvider):
+    """Provider whose authorization races with another sale of the last item."""
+
+    def __init__(self, vending_machine: VendingMachine):
+        self.vending_machine = vending_machine
+        self.captured = []
+        self.voided = []
+
+    def authorize(self, amount: int) -> Authorization:
+        self.vending_machine._inventory.reduce_stock(1)
+        return Authorization("auth-1", amount)
+
+    def capture(self, authorization: Authorization) -> None:
+        self.captured.append(authorization)
+
+    def void(self, authorization: Authorization) -> None:
+        self.voided.append(authorization)
+
+
+class UnreachableVoidProvider(SellOutProvider):
+    """Provider that cannot reach the gateway to void."""
+
+    def void(self, authorization: Authorization) -> None:
+        raise ConnectionError("Gateway unreachable.")
+
+
+class TestGatewayPaymentProvider(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine and a provider connected to a local gateway."""
+        self.gateway = MockPaymentGateway(declined_amounts=frozenset({999}))
+        self.address = self.gateway.start()
+        self.provider = GatewayPaymentProvider(*self.address, batch_delay=0.05)
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_products([Product(id_=1, name="Coke", price=120, quantity=10),
+                                           Product(id_=2, name="Caviar", price=999, quantity=1)])
+
+    def tearDown(self):
+        """Close the provider and stop the gateway."""
+        self.provider.close()
+        self.gateway.stop()
+
+    def test_purchase_cashless(self):
+        """Test a cashless purchase vends the product and captures the authorized amount."""
+        self.vending_machine.purchase_cashless(1, self.provider)
+        self.assertTrue(self.provider.flush(5))
+        self.assertEqual(self.vending_machine.select_product(1).quantity, 9)
+        self.assertEqual(self.vending_machine.balance, 0)
+        self.assertEqual(self.gateway.captured, ["auth-1"])
+        self.assertEqual(self.gateway.authorized, {"auth-1": 120})
+
+    def test_declined(self):
+        """Test a declined payment vends nothing and publishes a failure."""
+        failures = []
+        self.vending_machine.events.subscribe(failures.extend)
+        with self.assertRaises(PaymentDeclined):
+            self.vending_machine.purchase_cashless(2, self.provider)
+        self.vending_machine.events.flush(5)
+        self.vending_machine.events.close()
+        self.assertEqual(self.vending_machine.select_product(2).quantity, 1)
+        self.assertIsInstance(failures[0], OperationFailed)
+
+    def test_void_when_vend_fails(self):
+        """Test the authorization is voided when the product cannot be vended."""
+        provider = SellOutProvider(self.vending_machine)
+        self.vending_machine._inventory.get_product(1).reduce_quantity(9)
+        with self.assertRaises(ValueError):
+            self.vending_machine.purchase_cashless(1, provider)
+        self.assertEqual((len(provider.voided), provider.captured), (1, []))
+
+    def test_void_failure_does_not_mask_error(self):
+        """Test the vend error is raised even when voiding the authorization fails."""
+        provider = UnreachableVoidProvider(self.vending_machine)
+        self.vending_machine._inventory.get_product(1).reduce_quantity(9)
+        with self.assertLogs("src.vending_machine.machine", "ERROR"):
+            with self.assertRaisesRegex(ValueError, "out of stock"):
+                self.vending_machine.purchase_cashless(1, provider)
+
+    def test_interface(self):
+        """Test providers must implement the whole interface."""
+        class CaptureOnly(PaymentProvider):
+            def capture(self, authorization: Authorization) -> None:
+                pass
+
+        with self.assertRaises(TypeError):
+            CaptureOnly()
+
+    def test_void_request(self):
+        """Test voids are sent to the gateway."""
+        self.provider.void(self.provider.authorize(120))
+        self.assertEqual(self.gateway.voided, ["auth-1"])
+
+    def test_retried_authorization_not_duplicated(self):
+        """Test an authorization whose response was lost is retried without authorizing the customer twice."""
+        self.gateway.dropped_responses = 1
+        self.assertEqual(self.provider.authorize(120), Authorization("auth-1", 120))
+        self.assertEqual(self.gateway.authorized, {"auth-1": 120})
+        self.assertEqual(self.provider.authorize(120).id, "auth-2")  # A new authorization gets a new key
+
+    def test_failed_captures_retried(self):
+        """Test captures the gateway rejects stay queued and are settled once it is back."""
+        provider = GatewayPaymentProvider(*self.address, backoff=0.01, max_backoff=0.05)
+        try:
+            authorization = provider.authorize(120)
+            self.gateway.online = False
+            provider.capture(authorization)
+            self.assertFalse(provider.flush(0.2))
+            self.assertGreater(provider.failures, 1)
+            self.gateway.online = True
+            self.assertTrue(provider.flush(5))
+        finally:
+            provider.close()
+        self.assertEqual((self.gateway.captured, provider.unsettled), (["auth-1"], []))
+
+    def test_unsettled_on_close(self):
+        """Test captures still failing when the provider is closed are kept as unsettled."""
+        authorization = self.provider.authorize(120)
+        self.gateway.online = False
+        self.provider.capture(authorization)
+        self.provider.close()
+        self.assertEqual((self.gateway.captured, self.provider.unsettled), ([], [authorization]))
+        self.provider = GatewayPaymentProvider(*self.address)  # Closed by tearDown
+
+    def test_batched_captures_on_pooled_connections(self):
+        """Test captures are settled in batches and requests reuse the pooled connections."""
+        for _ in range(10):
+            self.vending_machine.purchase_cashless(1, self.provider)
+        self.assertTrue(self.provider.flush(5))
+        self.assertEqual(len(self.gateway.captured), 10)
+        self.assertLess(self.gateway.capture_requests, 10)
+        self.assertLessEqual(self.gateway.connections, 2)
+
+
+class TestPaymentLatency(unittest.TestCase):
+    LATENCY = 0.05
+
+    def setUp(self):
+        """Set up a provider connected to a slow local gateway."""
+        self.gateway = MockPaymentGateway(latency=self.LATENCY)
+        self.provider = GatewayPaymentProvider(*self.gateway.start())
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=Product.MAX_QUANTITY))
+
+    def tearDown(self):
+        """Close the provider and stop the gateway."""
+        self.provider.close()
+        self.gateway.stop()
+
+    def test_capture_adds_no_round_trip(self):
+        """Benchmark: a cashless purchase costs one gateway round trip (the authorization), not two."""
+        durations = []
+        for _ in range(5):
+            start = time.perf_counter()
+            self.vending_machine.purchase_cashless(1, self.provider)
+            durations.append(time.perf_counter() - start)
+        self.assertLess(statistics.median(durations), 1.8 * self.LATENCY)
+        self.assertTrue(self.provider.flush(5))
+        self.assertEqual(len(self.gateway.captured), 5)
+
+    def test_vend_does_not_wait_for_capture(self):
+        """Benchmark: vending after authorization and queueing the capture takes well under a round trip."""
+        authorization = self.provider.authorize(120)
+        start = time.perf_counter()
+        self.vending_machine._inventory.reduce_stock(1)
+        self.provider.capture(authorization)
+        self.assertLess(time.perf_counter() - start, self.LATENCY / 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
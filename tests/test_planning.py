@@ -0,0 +1,126 @@
+import unittest
+
+from src.vending_machine.currency import Currency
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+
+try:
+    import numpy as np
+
+    from src.vending_machine.planning import FloatPlanner, RestockPlanner, stock_levels
+except ImportError:  # NumPy is only needed for fleet planning
+    np = None
+
+DENOMINATION_COUNT = len(Currency.DENOMINATIONS)
+
+
+@unittest.skipUnless(np, "NumPy is not installed")
+class TestFloatPlanner(unittest.TestCase):
+    def setUp(self):
+        """Set up the change history of two machines."""
+        self.planner = FloatPlanner()
+        self.change_vectors = np.zeros((2, 4, DENOMINATION_COUNT), dtype=int)
+        self.change_vectors[0, :, Currency.DENOMINATIONS.index(20)] = -2  # Machine 0 gives lots of 20p coins
+        self.change_vectors[1, :, Currency.DENOMINATIONS.index(50)] = -1  # Machine 1 gives 50p coins
+        self.sales = np.array([4, 4])
+        self.current = np.full((2, DENOMINATION_COUNT), 2)
+        self.expected_sales = np.array([5, 5])
+
+    def test_float_follows_demand(self):
+        """Test the float goes to the tubes that are used for change."""
+        plan = self.planner.plan(self.change_vectors, self.sales, self.current, self.expected_sales, budget=2000)
+        self.assertGreater(plan.targets[0, Currency.DENOMINATIONS.index(20)], 10)
+        self.assertGreater(plan.targets[1, Currency.DENOMINATIONS.index(50)], 2)
+        self.assertEqual(plan.targets[0, Currency.DENOMINATIONS.index(200)], 2)
+
+    def test_constraints(self):
+        """Test the plan respects the budget, the tube capacity and the current counts."""
+        budgets = np.array([1500, 4000])
+        plan = self.planner.plan(self.change_vectors, self.sales, self.current, self.expected_sales, budgets)
+        self.assertTrue(np.all(plan.targets @ np.array(Currency.DENOMINATIONS) <= budgets))
+        self.assertTrue(np.all(plan.targets <= Currency.MAX_DENOMINATION_COUNT))
+        self.assertTrue(np.all(plan.reloads >= 0))
+
+    def test_more_budget_lowers_failure_probability(self):
+        """Test a larger budget never increases the predicted failure probability."""
+        small = self.planner.plan(self.change_vectors, self.sales, self.current, self.expected_sales, 1500)
+        large = self.planner.plan(self.change_vectors, self.sales, self.current, self.expected_sales, 4000)
+        self.assertTrue(np.all(large.failure_probability <= small.failure_probability))
+
+    def test_apply_plan(self):
+        """Test a machine's plan is applied in one call."""
+        vending_machine = VendingMachine()
+        current = np.array([[vending_machine.get_denomination_counts()[denom] for denom in Currency.DENOMINATIONS]])
+        plan = self.planner.plan(self.change_vectors[:1], self.sales[:1], current, self.expected_sales[:1])
+        vending_machine.reload_currencies(plan.for_machine(0))
+        counts = vending_machine.get_denomination_counts()
+        self.assertEqual([counts[denom] for denom in Currency.DENOMINATIONS], plan.targets[0].tolist())
+
+
+@unittest.skipUnless(np, "NumPy is not installed")
+class TestRestockPlanner(unittest.TestCase):
+    def setUp(self):
+        """Set up two weeks of sales for two machines with three products."""
+        self.planner = RestockPlanner()
+        self.product_ids = [1, 2, 3]
+        self.sales_history = np.zeros((2, 3, 14), dtype=np.int16)
+        self.sales_history[:, 0] = 3  # Product 1 sells steadily
+        self.sales_history[0, 1, -3:] = 2  # Product 2 just started selling in machine 0
+        self.current_stock = np.array([[10, 5, 4], [2, 5, 4]])
+
+    def test_restock_plan(self):
+        """Test products are restocked to cover forecast demand."""
+        plan = self.planner.plan(self.product_ids, self.sales_history, self.current_stock, days_until_visit=2)
+        self.assertEqual(plan.for_machine(1), {1: 4})  # 2 days of 3 sales, 2 in stock
+        self.assertEqual(plan.forecast[0, 2], 0)
+        self.assertFalse(plan.needs_restock[:, 2].any())  # Product 3 does not sell
+
+    def test_respects_max_quantity(self):
+        """Test restock never takes a product above its maximum quantity."""
+        plan = self.planner.plan(self.product_ids, self.sales_history, self.current_stock, days_until_visit=30)
+        self.assertTrue(np.all(self.current_stock + plan.quantities <= Product.MAX_QUANTITY))
+        self.assertEqual(plan.for_machine(0)[1], Product.MAX_QUANTITY - 10)
+
+    def test_empty_history(self):
+        """Test machines without sales history are forecast no demand and need no restock."""
+        with np.errstate(all="raise"):
+            plan = self.planner.plan(self.product_ids, self.sales_history[..., :0], self.current_stock, 2)
+        self.assertFalse(plan.forecast.any())
+        self.assertEqual(plan.for_machine(0), {})
+
+    def test_respects_slot_capacity(self):
+        """Test restock fills products up to the capacity of their slots, below or above the default maximum."""
+        machines = []
+        for capacities in ([4, 4], [15, 15]):
+            vending_machine = VendingMachine()
+            vending_machine.add_products([Product(id_=1, name="Coke", price=120, quantity=2),
+                                          Product(id_=2, name="Chips", price=80, quantity=1)])
+            vending_machine.assign_slots(1, capacities)
+            machines.append(vending_machine)
+        current_stock, capacities = stock_levels(machines, self.product_ids)
+        np.testing.assert_array_equal(capacities, [[8, Product.MAX_QUANTITY, 0], [30, Product.MAX_QUANTITY, 0]])
+        plan = self.planner.plan(self.product_ids, self.sales_history, current_stock, 30, capacities)
+        self.assertEqual([plan.for_machine(index).get(1) for index in range(2)], [6, 28])
+        self.assertFalse(plan.needs_restock[:, 2].any())  # Not carried
+        for index, vending_machine in enumerate(machines):
+            for product_id, quantity in plan.for_machine(index).items():
+                vending_machine.reload_product(product_id, quantity)
+            self.assertEqual(vending_machine.snapshot().products[0].quantity, capacities[index, 0])
+
+    def test_chunked_matches_whole(self):
+        """Test processing the fleet in chunks gives the same plan."""
+        whole = self.planner.plan(self.product_ids, self.sales_history, self.current_stock, [3, 5])
+        chunked = RestockPlanner(chunk_size=1).plan(self.product_ids, self.sales_history, self.current_stock,
+                                                    [3, 5])
+        np.testing.assert_array_equal(whole.quantities, chunked.quantities)
+
+    def test_invalid_smoothing(self):
+        """Test an invalid smoothing factor raises an error."""
+        for smoothing in (0, 1.5):
+            with self.subTest(smoothing=smoothing):
+                with self.assertRaises(ValueError):
+                    RestockPlanner(smoothing=smoothing)
+
+
+if __name__ == "__main__":
+    unittest.main()
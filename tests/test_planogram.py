@@ -0,0 +1,227 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date
+
+from src.vending_machine.currency import Currency
+from src.vending_machine.events import PlanogramLoaded
+from src.vending_machine.lots import ExpiryIndex
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.planogram import Planogram, PlannedProduct, load_planogram, parse_planogram
+from src.vending_machine.product import Product
+from src.vending_machine.scheduler import OperationScheduler
+from src.vending_machine.snapshot import VersionConflict
+from src.vending_machine.storage import SQLiteStorage
+
+
+class TestPlanogramParsing(unittest.TestCase):
+    def test_parse(self):
+        """Test a planogram is parsed with its optional fields."""
+        planogram = parse_planogram({"products": [{"id": 1, "name": "Soda", "price": 120, "slots": [5, 5]},
+                                                  {"id": 2, "name": "Water", "price": 90}],
+                                     "accepted_denominations": [10, 200, 100]})
+        self.assertEqual(planogram.products, (PlannedProduct(1, "Soda", 120, (5, 5)), PlannedProduct(2, "Water", 90)))
+        self.assertEqual(planogram.accepted_denominations, (200, 100, 10))
+
+    def test_parse_invalid(self):
+        """Test invalid planograms are rejected."""
+        soda = {"id": 1, "name": "Soda", "price": 120}
+        test_cases = [
+            {},  # No products
+            {"products": [{"id": 1, "name": "Soda"}]},  # Missing price
+            {"products": [{**soda, "price": 0}]},  # Invalid price
+            {"products": [soda, soda]},  # Duplicate product
+            {"products": [{**soda, "slots": [5, 0]}]},  # Empty slot
+            {"products": [soda], "accepted_denominations": [3]},  # Invalid denomination
+            {"products": [soda], "accepted_denominations": []},  # No coins accepted
+        ]
+        for data in test_cases:
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    parse_planogram(data)
+
+    def test_load(self):
+        """Test loading a planogram file, and rejecting a malformed one."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "planogram.json")
+            with open(path, "w", encoding="utf-8") as planogram_file:
+                json.dump({"products": [{"id": 1, "name": "Soda", "price": 120}]}, planogram_file)
+            self.assertEqual(load_planogram(path).products, (PlannedProduct(1, "Soda", 120),))
+            with open(path, "w", encoding="utf-8") as planogram_file:
+                planogram_file.write("{")
+            with self.assertRaises(ValueError):
+                load_planogram(path)
+
+
+class TestPlanogramReload(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine with a customer session in progress."""
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_products([Product(id_=1, name="Coke", price=120, quantity=5),
+                                           Product(id_=2, name="Pepsi", price=100, quantity=3)])
+        self.vending_machine.insert_money(100)
+        self.planogram = Planogram((PlannedProduct(1, "Coke", 90), PlannedProduct(3, "Fanta", 110)))
+
+    def test_stock_and_balance_carried_over(self):
+        """Test stock and the balance survive a reload, removed products go and new products start empty."""
+        self.vending_machine.reload_planogram(self.planogram)
+        self.assertEqual(self.vending_machine.balance, 100)
+        self.assertEqual(str(self.vending_machine.select_product(1)), "Coke (ID: 1) - Price: 90p, Stock: 5")
+        self.assertEqual(self.vending_machine.list_products(), ["Coke (ID: 1) - Price: 90p, Stock: 5",
+                                                                "Fanta (ID: 3) - Price: 110p, Stock: 0"])
+        with self.assertRaises(ValueError):
+            self.vending_machine.select_product(2)
+        self.vending_machine.purchase_product(1)  # At the new price
+        self.assertEqual(self.vending_machine.balance, 10)
+
+    def test_copy_on_write(self):
+        """Test unchanged products are shared while changed ones are copied, leaving the old objects intact."""
+        coke = self.vending_machine.select_product(1)
+        pepsi = self.vending_machine.select_product(2)
+        self.vending_machine.reload_planogram(Planogram((PlannedProduct(1, "Coke", 90),
+                                                         PlannedProduct(2, "Pepsi", 100))))
+        self.assertIsNot(self.vending_machine.select_product(1), coke)
+        self.assertEqual(coke.price, 120)
+        self.assertEqual(self.vending_machine.select_product(1).version, coke.version + 1)
+        self.assertIs(self.vending_machine.select_product(2), pepsi)
+
+    def test_invalid_planogram_leaves_machine_unchanged(self):
+        """Test a planogram that cannot hold the current stock is rejected before anything is swapped."""
+        snapshot = self.vending_machine.snapshot()
+        with self.assertRaises(ValueError):
+            self.vending_machine.reload_planogram(Planogram((PlannedProduct(1, "Coke", 90, (2, 2)),)))
+        self.assertIs(self.vending_machine.snapshot(), snapshot)
+
+    def test_conflict_when_stock_changed(self):
+        """Test a prepared planogram is not swapped in once a sale changed the inventory."""
+        prepared = self.vending_machine.prepare_planogram(self.planogram)
+        self.vending_machine.insert_money(20)
+        self.vending_machine.purchase_product(1)
+        with self.assertRaises(VersionConflict):
+            self.vending_machine.apply_planogram(prepared)
+        self.assertEqual(self.vending_machine.select_product(1).price, 120)
+        self.vending_machine.apply_planogram(self.vending_machine.prepare_planogram(self.planogram))
+        self.assertEqual(self.vending_machine.select_product(1).quantity, 4)
+
+    def test_discarded_planograms_not_tracked(self):
+        """Test planograms that are rejected or never applied do not stop the live inventory seeing changes."""
+        invalid = Planogram((PlannedProduct(2, "Pepsi", 100), PlannedProduct(1, "Coke", 90, (2, 2))))
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.vending_machine.reload_planogram(invalid)
+        self.vending_machine.prepare_planogram(Planogram((PlannedProduct(2, "Pepsi", 100),)))  # Thrown away
+        prepared = self.vending_machine.prepare_planogram(Planogram((PlannedProduct(2, "Pepsi", 90),
+                                                                     PlannedProduct(1, "Coke", 120))))
+        self.assertIn("Pepsi (ID: 2) - Price: 100p, Stock: 3", self.vending_machine.list_products())
+        self.vending_machine.purchase_product(2)
+        self.assertIn("Pepsi (ID: 2) - Price: 100p, Stock: 2", self.vending_machine.list_products())
+        with self.assertRaises(VersionConflict):
+            self.vending_machine.apply_planogram(prepared)
+
+    def test_applied_planogram_tracked(self):
+        """Test the swapped-in inventory sees changes to the products it shares with the previous one."""
+        self.vending_machine.reload_planogram(Planogram((PlannedProduct(2, "Pepsi", 100),)))
+        self.assertEqual(self.vending_machine.list_products(), ["Pepsi (ID: 2) - Price: 100p, Stock: 3"])
+        self.vending_machine.purchase_product(2)
+        self.assertEqual(self.vending_machine.list_products(), ["Pepsi (ID: 2) - Price: 100p, Stock: 2"])
+
+    def test_check_and_swap_atomic(self):
+        """Test a planogram cannot be swapped in while a sale holds the machine, and is rejected after it."""
+        prepared = self.vending_machine.prepare_planogram(self.planogram)
+        errors = []
+
+        def apply():
+            try:
+                self.vending_machine.apply_planogram(prepared)
+            except VersionConflict as e:
+                errors.append(e)
+
+        with self.vending_machine._lock:  # As if a sale were in progress on another thread
+            applier = threading.Thread(target=apply)
+            applier.start()
+            applier.join(0.1)
+            self.assertTrue(applier.is_alive())
+            self.vending_machine.insert_money(20)
+            self.vending_machine.purchase_product(1)
+        applier.join(5)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.vending_machine.select_product(1).price, 120)
+
+    def test_snapshot_version_increases(self):
+        """Test a reload produces a newer snapshot even though products are removed."""
+        version = self.vending_machine.snapshot().version
+        self.vending_machine.reload_planogram(self.planogram)
+        self.assertGreater(self.vending_machine.snapshot().version, version)
+
+    def test_accepted_denominations(self):
+        """Test coins left out of the planogram are no longer accepted."""
+        self.vending_machine.reload_planogram(self.planogram._replace(accepted_denominations=(200, 100, 50)))
+        self.assertEqual(self.vending_machine.get_valid_denominations(), (200, 100, 50))
+        with self.assertRaises(ValueError):
+            self.vending_machine.insert_money(20)
+        self.vending_machine.insert_money(50)
+        self.assertEqual(self.vending_machine.balance, 150)
+
+    def test_slots(self):
+        """Test unchanged slots keep their state and changed slots are reassigned the current stock."""
+        self.vending_machine.assign_slots(1, [4, 4])
+        self.vending_machine.report_jam(1, 0)
+        self.vending_machine.reload_planogram(Planogram((PlannedProduct(1, "Coke", 90, (4, 4)),
+                                                         PlannedProduct(2, "Pepsi", 100, (2, 2)))))
+        self.assertTrue(self.vending_machine.get_slots(1)[0].jammed)
+        self.assertEqual([slot.quantity for slot in self.vending_machine.get_slots(2)], [2, 1])
+        self.assertEqual(self.vending_machine.select_product(2).capacity, 4)
+
+    def test_lots(self):
+        """Test lots are carried over and the lots of removed products leave the expiry index."""
+        expiry_index = ExpiryIndex()
+        self.vending_machine.attach_expiry_index(expiry_index, "machine-1")
+        self.vending_machine.reload_product(1, 2, date(2030, 1, 1))
+        self.vending_machine.reload_product(2, 2, date(2030, 1, 2))
+        self.vending_machine.reload_planogram(self.planogram)
+        self.assertEqual([lot.product_id for lot in expiry_index.expiring(date(2030, 12, 31))], [1])
+        self.assertEqual(self.vending_machine.get_lots(1)[0].quantity, 2)
+
+    def test_event_published(self):
+        """Test a reload publishes the new lineup."""
+        events = []
+        self.vending_machine.events.subscribe(events.extend)
+        self.vending_machine.reload_planogram(self.planogram)
+        self.vending_machine.events.flush()
+        self.assertEqual([(event.product_ids, event.accepted_denominations) for event in events
+                          if isinstance(event, PlanogramLoaded)], [((1, 3), Currency.DENOMINATIONS)])
+
+    def test_scheduled_reload(self):
+        """Test a reload queued as maintenance work is swapped in between customer operations."""
+        scheduler = OperationScheduler(self.vending_machine)
+        try:
+            reload = scheduler.reload_planogram(self.planogram)
+            scheduler.insert_money(20)
+            scheduler.purchase_product(1).result(5)
+            reload.result(5)
+        finally:
+            scheduler.close(5)
+        self.assertEqual(self.vending_machine.select_product(1).price, 90)
+        self.assertEqual(self.vending_machine.select_product(1).quantity, 4)
+
+    def test_persisted(self):
+        """Test the new lineup is written to storage and removed products are deleted."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "machine.db")
+            storage = SQLiteStorage(path)
+            vending_machine = VendingMachine(storage=storage)
+            vending_machine.add_products([Product(id_=1, name="Coke", price=120, quantity=5),
+                                          Product(id_=2, name="Pepsi", price=100, quantity=3)])
+            vending_machine.reload_planogram(self.planogram)
+            storage.close()
+            reader = sqlite3.connect(path)
+            rows = reader.execute("SELECT id, name, price, quantity FROM products ORDER BY id").fetchall()
+            reader.close()
+        self.assertEqual(rows, [(1, "Coke", 90, 5), (3, "Fanta", 110, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
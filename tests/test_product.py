@@ -1,6 +1,8 @@
+import json
 import unittest
 
 from src.vending_machine.product import Product
+from src.vending_machine.snapshot import VersionConflict
 
 
 class TestProduct(unittest.TestCase):
@@ -92,6 +94,33 @@ class TestProduct(unittest.TestCase):
                 with self.assertRaises(ValueError):
                     Product(**case)
 
+    def test_str_representation_updates(self):
+        """Test the cached string representation is rendered again after a stock change."""
+        rendered = str(self.product)
+        self.assertIs(str(self.product), rendered)
+        self.product.reduce_quantity(2)
+        self.assertEqual(str(self.product), "Soda (ID: 1) - Price: 120p, Stock: 8")
+
+    def test_version(self):
+        """Test the version increases with every stock change."""
+        self.product.increase_quantity(1)
+        self.product.reduce_quantity(3)
+        self.assertEqual(self.product.version, 2)
+
+    def test_to_json(self):
+        """Test the JSON representation of the product."""
+        self.product.reduce_quantity()
+        self.assertEqual(json.loads(self.product.to_json()),
+                         {"id": 1, "name": "Soda", "price": 120, "quantity": 9, "version": 1})
+
+    def test_ensure_version(self):
+        """Test a stale version is reported as a conflict."""
+        self.product.ensure_version(0)
+        self.product.reduce_quantity()
+        with self.assertRaises(VersionConflict) as context:
+            self.product.ensure_version(0)
+        self.assertEqual((context.exception.expected, context.exception.actual), (0, 1))
+
 
 if __name__ == "__main__":
     unittest.main()
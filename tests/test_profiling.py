@@ -0,0 +1,108 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+from src.vending_machine.profiling import (DEFAULT_PROFILE_OUTPUT, DETERMINISTIC, PROFILE_ENV, SAMPLING,
+                                          OperationTimings, Profiler, split_profile_options)
+
+
+def busy(seconds: float) -> None:
+    """Keep the CPU busy for a while."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestSplitProfileOptions(unittest.TestCase):
+    def test_options(self):
+        """Test profiling options are taken out of the command line in both forms."""
+        self.assertEqual(split_profile_options(["--profile", "sampling", "status", "--profile-output=out"], {}),
+                         (SAMPLING, "out", ["status"]))
+        self.assertEqual(split_profile_options(["status"], {PROFILE_ENV: "cprofile"}),
+                         (DETERMINISTIC, DEFAULT_PROFILE_OUTPUT, ["status"]))
+        self.assertEqual(split_profile_options([], {}), (None, DEFAULT_PROFILE_OUTPUT, []))
+
+    def test_invalid_options(self):
+        """Test unknown modes and missing values are rejected."""
+        for argv in (["--profile", "tracing"], ["--profile"], ["--profile-output="]):
+            with self.subTest(argv=argv):
+                with self.assertRaises(ValueError):
+                    split_profile_options(argv, {})
+
+
+class TestOperationTimings(unittest.TestCase):
+    def test_instrument(self):
+        """Test the public methods of a vending machine are timed on the instance."""
+        timings = OperationTimings()
+        vending_machine = VendingMachine()
+        timings.instrument(vending_machine)
+        vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=1))
+        vending_machine.insert_money(100)
+        vending_machine.insert_money(20)
+        with self.assertRaises(ValueError):
+            vending_machine.insert_money(3)
+        self.assertEqual(vending_machine.balance, 120)
+        calls = {name: calls for name, calls, *_ in timings.summary()}
+        self.assertEqual(calls, {"VendingMachine.add_product": 1, "VendingMachine.insert_money": 3})
+        self.assertNotIn("insert_money", vars(VendingMachine()))  # Other machines are unaffected
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary output directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "profile.folded")
+
+    def tearDown(self):
+        """Remove the output directory."""
+        self.directory.cleanup()
+
+    def read_stacks(self) -> dict:
+        with open(self.output, encoding="utf-8") as output:
+            return {stack: int(weight) for stack, weight in (line.rsplit(" ", 1) for line in output)}
+
+    def test_deterministic(self):
+        """Test cProfile statistics are written as collapsed stacks and raw statistics."""
+        with self.assertLogs("src.vending_machine.profiling", "INFO"):
+            with Profiler(DETERMINISTIC, self.output):
+                busy(0.02)
+        stacks = self.read_stacks()
+        self.assertTrue(any(stack.endswith(f"busy (test_profiling.py:{busy.__code__.co_firstlineno})")
+                            for stack in stacks))
+        self.assertTrue(os.path.exists(f"{self.output}.pstats"))
+
+    def test_deterministic_total(self):
+        """Test the collapsed stacks add up to the total time cProfile recorded, however many paths share it."""
+        vending_machine = VendingMachine()
+        vending_machine.add_products([Product(id_=id_, name=f"Product {id_}", price=100, quantity=5)
+                                      for id_ in range(1, 11)])
+        with self.assertLogs("src.vending_machine.profiling", "INFO"):
+            with Profiler(DETERMINISTIC, self.output):
+                for _ in range(20):
+                    str(vending_machine)
+                    vending_machine.list_products_json()
+                    busy(0.001)
+        stacks = self.read_stacks()
+        total = round(pstats.Stats(f"{self.output}.pstats").total_tt * 1e6)
+        self.assertAlmostEqual(sum(stacks.values()), total, delta=max(len(stacks), total // 100))
+
+    def test_sampling(self):
+        """Test sampled stacks of the profiled thread are written in collapsed format."""
+        with self.assertLogs("src.vending_machine.profiling", "INFO"):
+            with Profiler(SAMPLING, self.output, interval=0.001):
+                busy(0.1)
+        stacks = self.read_stacks()
+        self.assertTrue(any(";busy (test_profiling.py:" in stack for stack in stacks))
+
+    def test_invalid_mode(self):
+        """Test an unknown mode is rejected."""
+        with self.assertRaises(ValueError):
+            Profiler("tracing", self.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
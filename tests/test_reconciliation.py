@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+
+from src.vending_machine.currency import Currency
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.payments import Authorization, PaymentProvider
+from src.vending_machine.product import Product
+
+try:
+    import numpy as np
+
+    from src.vending_machine.reconciliation import PURCHASED, CashReconciler, journal_records, read_journal
+except ImportError:  # NumPy is only needed for fleet reconciliation
+    np = None
+
+
+class ApprovingProvider(PaymentProvider):
+    """A payment provider approving every payment."""
+
+    def authorize(self, amount: int) -> Authorization:
+        return Authorization("auth-1", amount)
+
+    def capture(self, authorization: Authorization) -> None:
+        pass
+
+    def void(self, authorization: Authorization) -> None:
+        pass
+
+
+@unittest.skipUnless(np, "NumPy is not installed")
+class TestCashReconciler(unittest.TestCase):
+    def setUp(self):
+        """Set up two machines whose published events are journalled."""
+        self.machines = [VendingMachine(), VendingMachine()]
+        self.events = [[], []]
+        for machine, events in zip(self.machines, self.events):
+            machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+            machine.events.subscribe(events.extend)
+        self.opening_counts, self.opening_inserted = self.currency_state()
+
+    def tearDown(self):
+        """Stop the event subscriptions."""
+        for machine in self.machines:
+            machine.events.close()
+
+    def currency_state(self) -> tuple:
+        """Return the tube and stored money counts of both machines in denomination order."""
+        counts = [[machine.get_denomination_counts()[denom] for denom in Currency.DENOMINATIONS]
+                  for machine in self.machines]
+        inserted = [[machine.get_stored_money().get(denom, 0) for denom in Currency.DENOMINATIONS]
+                    for machine in self.machines]
+        return np.array(counts), np.array(inserted)
+
+    def trade(self) -> None:
+        """Sell a product on both machines and reload machine 1."""
+        for machine in self.machines:
+            machine.insert_money(200)
+            machine.purchase_product(1)
+            machine.dispense_change()
+        self.machines[1].reload_currencies({20: 2})
+        for machine in self.machines:
+            machine.events.flush(5)
+
+    def journal(self) -> list:
+        return [journal_records(index, events) for index, events in enumerate(self.events)]
+
+    def reconcile(self, chunks):
+        reconciler = CashReconciler(len(self.machines))
+        reconciler.feed_all(chunks)
+        return reconciler.reconcile(self.opening_counts, self.opening_inserted, *self.currency_state())
+
+    def test_balanced(self):
+        """Test a day matching its journal has no discrepancies."""
+        self.trade()
+        result = self.reconcile(self.journal())
+        self.assertEqual(len(result.flagged), 0)
+        self.assertEqual(result.for_machine(0), {"denomination_counts": {}, "inserted_money": {}})
+
+    def test_missing_coins(self):
+        """Test coins missing from a tube are reported by denomination and as a cash shortfall."""
+        self.trade()
+        self.machines[1].reload_currency(50, 0)
+        self.machines[1]._currency.update_denomination_count(10, -3)  # Coins taken without a journal record
+        result = self.reconcile(self.journal())
+        self.assertEqual(result.flagged.tolist(), [1])
+        self.assertEqual(result.for_machine(1), {"denomination_counts": {10: -3}, "inserted_money": {}})
+        self.assertEqual(result.cash_discrepancies.tolist(), [0, -30])
+
+    def test_unrecorded_sale(self):
+        """Test a sale missing from the journal shows up as a cash surplus."""
+        self.trade()
+        journal = self.journal()
+        journal[0] = journal[0][journal[0]["kind"] != PURCHASED]
+        result = self.reconcile(journal)
+        self.assertEqual(result.cash_discrepancies.tolist(), [120, 0])
+
+    def test_cashless_sale(self):
+        """Test a card sale is not expected in the cash and does not flag the machine."""
+        self.trade()
+        self.machines[0].purchase_cashless(1, ApprovingProvider())
+        self.machines[0].events.flush(5)
+        result = self.reconcile(self.journal())
+        self.assertEqual(len(result.flagged), 0)
+        self.assertEqual(result.cash_discrepancies.tolist(), [0, 0])
+
+    def test_hardware_failures(self):
+        """Test a refunded vend and change credited back after a failed payout keep the journal balanced."""
+        machine = self.machines[0]
+        machine.insert_money(200)
+        machine.purchase_product(1)
+        machine.refund_purchase(1, 120)
+        machine.restore_change(machine.dispense_change())
+        machine.dispense_change()
+        machine.events.flush(5)
+        result = self.reconcile(self.journal())
+        self.assertEqual(len(result.flagged), 0)
+        self.assertEqual(result.cash_discrepancies.tolist(), [0, 0])
+
+    def test_read_journal(self):
+        """Test a journal file is streamed back in chunks."""
+        self.trade()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "journal.bin")
+            np.concatenate(self.journal()).tofile(path)
+            chunks = list(read_journal(path, chunk_records=2))
+            self.assertTrue(all(len(chunk) <= 2 for chunk in chunks))
+            self.assertEqual(len(self.reconcile(chunks).flagged), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
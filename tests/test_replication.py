@@ -0,0 +1,263 @@
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import unittest
+from datetime import date
+from unittest import mock
+
+from src.vending_machine.events import EventBus
+from src.vending_machine.payments import Authorization, PaymentProvider
+from src.vending_machine.planogram import Planogram, PlannedProduct
+from src.vending_machine.product import Product
+from src.vending_machine.replication import PrimaryVendingMachine, Replica
+
+TIMEOUT = 5
+
+
+class ConcurrentProvider(PaymentProvider):
+    """Payment provider inserting a coin on the machine from another thread while authorizing."""
+
+    def __init__(self, machine: PrimaryVendingMachine):
+        self.machine = machine
+        self.inserted = False
+
+    def authorize(self, amount: int) -> Authorization:
+        inserter = threading.Thread(target=self.machine.insert_money, args=(10,))
+        inserter.start()
+        inserter.join(TIMEOUT)
+        self.inserted = not inserter.is_alive()
+        return Authorization("auth-1", amount)
+
+    def capture(self, authorization: Authorization) -> None:
+        pass
+
+    def void(self, authorization: Authorization) -> None:
+        pass
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        """Set up a primary with one connected replica."""
+        self.primary = PrimaryVendingMachine()
+        self.primary.add_products([Product(id_=1, name="Coke", price=120, quantity=5),
+                                   Product(id_=2, name="Pepsi", price=100, quantity=3)])
+        self.primary.insert_money(50)
+        self.address = self.primary.serve()
+        self.replica = Replica(self.address)
+        self.assertTrue(self.replica.wait_for(0, TIMEOUT))
+
+    def tearDown(self):
+        self.replica.promote()
+        self.primary.close()
+
+    def sync(self) -> None:
+        self.assertTrue(self.replica.wait_for(self.primary.flush(TIMEOUT), TIMEOUT))
+
+    def assert_replicated(self) -> None:
+        self.assertEqual(self.replica.list_products(), self.primary.list_products())
+        self.assertEqual(self.replica.get_denomination_counts(), self.primary.get_denomination_counts())
+        self.assertEqual(self.replica.get_stored_money(), self.primary.get_stored_money())
+        self.assertEqual(self.replica.balance, self.primary.balance)
+        self.assertEqual(self.replica.get_valid_denominations(), self.primary.get_valid_denominations())
+
+    def test_snapshot(self):
+        """Test a new replica receives the state made before it connected."""
+        self.assert_replicated()
+
+    def test_deltas_applied_in_order(self):
+        """Test purchases, change and reloads are replicated."""
+        self.primary.insert_money(100)
+        self.primary.purchase_product(1)
+        self.primary.dispense_change()
+        self.primary.reload_product(2, 4)
+        self.primary.reload_currency(200, 3)
+        self.primary.reload_currencies({100: 2, 1: 4})
+        self.primary.add_product(Product(id_=3, name="Fanta", price=90, quantity=7))
+        self.sync()
+        self.assert_replicated()
+
+    def test_planogram_replicated(self):
+        """Test a planogram reload is replicated, and sent to replicas connecting afterwards."""
+        self.primary.reload_planogram(Planogram((PlannedProduct(1, "Coke Zero", 130), PlannedProduct(3, "Fanta", 90)),
+                                                (200, 100, 50)))
+        self.primary.insert_money(100)
+        self.primary.purchase_product(1)
+        self.sync()
+        self.assert_replicated()
+        late_replica = Replica(self.address)
+        self.assertTrue(late_replica.wait_for(self.primary.sequence, TIMEOUT))
+        self.assertEqual(late_replica.list_products(), self.primary.list_products())
+        self.assertEqual(late_replica.get_valid_denominations(), (200, 100, 50))
+        late_replica.promote()
+
+    def assert_slots_and_lots_replicated(self, replica: Replica) -> None:
+        machine = replica._machine
+        for product_id in (1, 2):
+            with self.subTest(product_id=product_id):
+                self.assertEqual(repr(machine.get_slots(product_id)), repr(self.primary.get_slots(product_id)))
+                self.assertEqual([(lot.expiry, lot.quantity) for lot in machine.get_lots(product_id)],
+                                 [(lot.expiry, lot.quantity) for lot in self.primary.get_lots(product_id)])
+
+    def test_slots_and_lots_replicated(self):
+        """Test slot assignments, jams and dated reloads are replicated, and sent to replicas connecting later."""
+        self.primary.assign_slots(1, [3, 3])
+        self.primary.report_jam(1, 0)
+        self.primary.reload_product(2, 2, date(2030, 1, 1))
+        self.primary.reload_product(2, 1, date(2029, 6, 30))
+        self.primary.insert_money(200)
+        self.primary.purchase_product(1)
+        self.primary.purchase_product(2)
+        self.sync()
+        self.assert_replicated()
+        self.assert_slots_and_lots_replicated(self.replica)
+        late_replica = Replica(self.address)
+        try:
+            self.assertTrue(late_replica.wait_for(self.primary.sequence, TIMEOUT))
+            self.assert_slots_and_lots_replicated(late_replica)
+        finally:
+            late_replica.promote()
+
+    def test_refund_replicated(self):
+        """Test a refunded unit returns to the same slot and lot on the replica as on the primary."""
+        self.primary.assign_slots(2, [2, 3])
+        self.primary.reload_product(2, 1, date(2030, 1, 1))
+        self.primary.reload_product(2, 1, date(2030, 6, 30))
+        self.primary.insert_money(200)
+        units = [self.primary.purchase_product(2), self.primary.purchase_product(2)]
+        self.primary.refund_purchase(2, 100, units[1])
+        self.primary.refund_purchase(2, 100, units[0])
+        self.primary.insert_money(200)
+        self.primary.purchase_product(2)
+        self.primary.refund_purchase(2, 100)
+        self.sync()
+        self.assert_replicated()
+        self.assert_slots_and_lots_replicated(self.replica)
+        # The last refund, made without the unit, returns undated stock
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in self.primary.get_lots(2)], [(date(2030, 6, 30), 1)])
+
+    def test_versions_and_capacities_replicated(self):
+        """Test product and tube versions and capacities are replicated, so conditional operations survive failover."""
+        self.primary.reload_product(1, 1)
+        self.primary.reload_currency(50, 2)
+        self.primary.insert_money(200)
+        self.primary.purchase_product(1)
+        self.primary.assign_slots(2, [4, 4])
+        self.sync()
+        late_replica = Replica(self.address)
+        self.assertTrue(late_replica.wait_for(self.primary.sequence, TIMEOUT))
+        expected = self.primary.snapshot()
+        for name, replica in [("deltas", self.replica), ("snapshot", late_replica)]:
+            with self.subTest(name):
+                promoted = replica.promote()
+                snapshot = promoted.snapshot()
+                self.assertEqual(snapshot.products, expected.products)
+                self.assertEqual(snapshot.tube_versions, expected.tube_versions)
+                self.assertEqual(promoted.select_product(2).capacity, 8)
+                promoted.reload_product(1, 1, expected_version=self.primary.select_product(1).version)
+                promoted.reload_currency(50, 1, expected_version=expected.tube_versions[50])
+
+    def test_large_stored_money(self):
+        """Test stored money counts beyond 16 bits reach new replicas."""
+        self.primary._currency.load_counts({}, {200: 70_000})
+        late_replica = Replica(self.address)
+        try:
+            self.assertTrue(late_replica.wait_for(self.primary.sequence, TIMEOUT))
+            self.assertEqual(late_replica.get_stored_money(), {200: 70_000})
+        finally:
+            late_replica.promote()
+
+    def test_snapshot_encoding_error(self):
+        """Test a snapshot that cannot be encoded drops the new replica without stopping the sender."""
+        with mock.patch.object(self.primary, "_encode_snapshot", side_effect=struct.error("out of range")):
+            with self.assertLogs("src.vending_machine.replication", "ERROR"):
+                late_replica = Replica(self.address)
+                self.assertFalse(late_replica.wait_for(0, TIMEOUT))
+        late_replica.promote()
+        self.primary.insert_money(100)
+        self.sync()
+        self.assert_replicated()
+
+    def test_events_passed_through(self):
+        """Test the primary publishes its operations and failures on the bus it is given once it is unlocked."""
+        events = EventBus()
+        primary = PrimaryVendingMachine(events=events)
+        self.assertIs(primary.events, events)
+        received = []
+        events.subscribe(received.extend)
+        primary.insert_money(100)
+        with self.assertRaises(ValueError):
+            primary.insert_money(3)
+        self.assertTrue(events.flush(TIMEOUT))
+        self.assertEqual([type(event).__name__ for event in received], ["CoinInserted", "OperationFailed"])
+        events.close()
+
+    def test_payments_not_imported(self):
+        """Test importing the replication module does not load the HTTP payment client."""
+        code = "import sys, src.vending_machine.replication; print('http.client' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+    def test_resync_after_gap(self):
+        """Test a replica that misses a frame logs it and catches up from a new snapshot, reconnecting unlocked."""
+        locked = []
+        create_connection = socket.create_connection
+
+        def connect(*args, **kwargs):
+            locked.append(self.replica._applied._is_owned())
+            return create_connection(*args, **kwargs)
+
+        with self.primary._lock:
+            self.primary._sequence += 1  # As if a frame had been lost
+        with self.assertLogs("src.vending_machine.replication", "ERROR"), \
+                mock.patch("src.vending_machine.replication.socket.create_connection", connect):
+            self.primary.insert_money(100)
+            self.sync()
+        self.assertEqual(locked, [False])
+        self.assert_replicated()
+        self.primary.purchase_product(1)
+        self.sync()
+        self.assert_replicated()
+
+    def test_cashless_authorized_outside_lock(self):
+        """Test other operations proceed while a cashless payment is authorized, and the sale is replicated."""
+        provider = ConcurrentProvider(self.primary)
+        self.primary.purchase_cashless(1, provider)
+        self.assertTrue(provider.inserted)
+        self.sync()
+        self.assert_replicated()
+
+    def test_failed_operation_not_replicated(self):
+        """Test an operation that fails on the primary leaves the replica unchanged."""
+        with self.assertRaises(ValueError):
+            self.primary.purchase_product(1)
+        self.primary.insert_money(2)
+        self.sync()
+        self.assert_replicated()
+
+    def test_promote_after_primary_dies(self):
+        """Test a replica can be promoted and serve replicas of its own."""
+        self.primary.insert_money(100)
+        self.primary.purchase_product(2)
+        self.sync()
+        self.primary.close()
+        self.replica.wait_for(self.primary.sequence + 1, TIMEOUT)  # Returns once the connection drops
+        self.assertFalse(self.replica.primary_alive)
+
+        promoted = self.replica.promote()
+        self.assertEqual(promoted.balance, 50)
+        promoted.insert_money(100)
+        promoted.purchase_product(1)
+        second_replica = Replica(promoted.serve())
+        try:
+            self.assertTrue(second_replica.wait_for(promoted.flush(TIMEOUT), TIMEOUT))
+            self.assertEqual(second_replica.list_products(), promoted.list_products())
+            self.assertEqual(second_replica.balance, 30)
+        finally:
+            second_replica.promote()
+            promoted.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
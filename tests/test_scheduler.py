@@ -0,0 +1,95 @@
+import threading
+import unittest
+
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+from src.vending_machine.scheduler import CUSTOMER, MAINTENANCE, OperationScheduler
+
+
+class TestOperationScheduler(unittest.TestCase):
+    def setUp(self):
+        """Set up a scheduler in front of a vending machine with products."""
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_products([Product(id_=id_, name=f"Product {id_}", price=100, quantity=1)
+                                           for id_ in range(1, 6)])
+        self.scheduler = OperationScheduler(self.vending_machine, customer_slo=1.0, maintenance_slo=1.0)
+
+    def tearDown(self):
+        """Stop the scheduler."""
+        self.scheduler.close(timeout=5)
+
+    def block_worker(self) -> threading.Event:
+        """Occupy the worker until the returned event is set."""
+        release = threading.Event()
+        started = threading.Event()
+        self.scheduler.submit(MAINTENANCE, [lambda: (started.set(), release.wait(5))])
+        started.wait(5)
+        return release
+
+    def test_operations(self):
+        """Test queued operations are applied to the machine and resolve their futures."""
+        self.scheduler.insert_money(200).result(5)
+        self.scheduler.purchase_product(1).result(5)
+        self.assertEqual(self.scheduler.dispense_change().result(5).to_dict(), {100: 1})
+        self.scheduler.reload_products({2: 3, 3: 4}).result(5)
+        self.scheduler.reload_currencies({200: 1, 1: 2}).result(5)
+        self.scheduler.add_products([Product(id_=6, name="Water", price=80)]).result(5)
+        self.assertEqual(self.vending_machine.snapshot().products[1].quantity, 4)
+        self.assertEqual(self.vending_machine.get_denomination_counts()[1], 12)
+        self.assertEqual(len(self.vending_machine.snapshot().products), 6)
+
+    def test_customer_operations_preempt_maintenance(self):
+        """Test customer operations run between the steps of queued maintenance."""
+        order = []
+        release = self.block_worker()
+        maintenance = self.scheduler.submit(MAINTENANCE, [lambda i=i: order.append(f"reload {i}") for i in range(3)])
+        customer = self.scheduler.submit(CUSTOMER, [lambda: order.append("purchase")])
+        release.set()
+        maintenance.result(5)
+        customer.result(5)
+        self.assertEqual(order, ["purchase", "reload 0", "reload 1", "reload 2"])
+
+    def test_failed_step_skips_the_rest(self):
+        """Test the first failing step resolves the future with its exception."""
+        future = self.scheduler.reload_products({1: 1, 99: 1, 2: 1})
+        with self.assertRaises(ValueError):
+            future.result(5)
+        self.assertEqual([product.quantity for product in self.vending_machine.snapshot().products[:2]], [2, 1])
+
+    def test_cancelled_job_skipped(self):
+        """Test a job cancelled while queued is skipped and later jobs still complete."""
+        release = self.block_worker()
+        cancelled = self.scheduler.insert_money(200)
+        later = self.scheduler.insert_money(100)
+        self.assertTrue(cancelled.cancel())
+        release.set()
+        later.result(5)
+        self.assertEqual(self.vending_machine.balance, 100)
+        self.scheduler.purchase_product(1).result(5)
+        self.assertTrue(cancelled.cancelled())
+
+    def test_metrics(self):
+        """Test latencies are tracked per priority class against their SLO."""
+        release = self.block_worker()
+        self.scheduler.submit(MAINTENANCE, [lambda: None])
+        future = self.scheduler.insert_money(100)
+        release.set()
+        future.result(5)
+        self.scheduler.close(timeout=5)
+        customer = self.scheduler.metrics(CUSTOMER)
+        maintenance = self.scheduler.metrics(MAINTENANCE)
+        self.assertEqual((customer.count, customer.slo_violations), (1, 0))
+        self.assertEqual(maintenance.count, 2)
+        self.assertLessEqual(customer.p50, customer.p99)
+
+    def test_submit_invalid(self):
+        """Test unknown priorities and submissions after closing are rejected."""
+        with self.assertRaises(ValueError):
+            self.scheduler.submit("urgent", [])
+        self.scheduler.close(timeout=5)
+        with self.assertRaises(ValueError):
+            self.scheduler.insert_money(100)
+
+
+if __name__ == "__main__":
+    unittest.main()
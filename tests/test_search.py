@@ -0,0 +1,51 @@
+import unittest
+
+from src.vending_machine.product import Product
+from src.vending_machine.search import ProductSearchIndex
+
+
+class TestProductSearchIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up an index of products."""
+        self.index = ProductSearchIndex()
+        self.products = [Product(id_=1, name="Coke", price=120, quantity=5),
+                         Product(id_=2, name="Coke Zero", price=120),
+                         Product(id_=3, name="Diet Coke", price=120, quantity=2),
+                         Product(id_=4, name="Chocolate Bar", price=90, quantity=1),
+                         Product(id_=5, name="Bio Banana", price=200, quantity=3)]
+        for product in self.products:
+            self.index.add(product)
+
+    def search(self, query: str, **kwargs) -> list[int]:
+        return [product.id for product in self.index.search(query, **kwargs)]
+
+    def test_prefix_ranking(self):
+        """Test exact names rank before name prefixes, which rank before word prefixes."""
+        self.assertEqual(self.search("coke"), [1, 2, 3])
+        self.assertEqual(self.search("CH"), [4])
+
+    def test_multiple_words(self):
+        """Test prefix matches need every query word, with other names only following as fuzzy matches."""
+        self.assertEqual(self.search("coke z"), [2, 1, 3])
+        self.assertEqual(self.search("  diet   COKE ", limit=1), [3])
+
+    def test_fuzzy(self):
+        """Test misspelt queries find similar names."""
+        self.assertEqual(self.search("bananna"), [5])
+        self.assertEqual(self.search("xyz"), [])
+
+    def test_limit_and_filter(self):
+        """Test results are limited and filtered."""
+        self.assertEqual(self.search("coke", limit=2), [1, 2])
+        self.assertEqual(self.search("coke", where=lambda product: product.quantity > 0), [1, 3])
+        self.assertEqual(self.search(""), [])
+
+    def test_duplicate(self):
+        """Test indexing a product ID twice raises an error."""
+        with self.assertRaises(ValueError):
+            self.index.add(Product(id_=1, name="Soda", price=100))
+        self.assertEqual(len(self.index), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
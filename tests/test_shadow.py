@@ -0,0 +1,220 @@
+import threading
+import time
+import unittest
+from datetime import date
+
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.payments import Authorization, PaymentDeclined, PaymentProvider
+from src.vending_machine.planogram import Planogram, PlannedProduct
+from src.vending_machine.product import Product
+from src.vending_machine.shadow import ShadowedVendingMachine
+from src.vending_machine.snapshot import VersionConflict
+
+
+class OverchargingMachine(VendingMachine):
+    """A candidate charging 10p more than the price."""
+
+    def purchase_product(self, product_id: int, expected_version: int = None) -> None:
+        super().purchase_product(product_id, expected_version)
+        self._balance -= 10
+
+
+class StrictMachine(VendingMachine):
+    """A candidate rejecting 20p coins."""
+
+    def insert_money(self, denom: int) -> None:
+        if denom == 20:
+            raise ValueError("20p coins are not accepted.")
+        super().insert_money(denom)
+
+
+class SlowMachine(VendingMachine):
+    """A candidate blocking its sales until released."""
+
+    released = threading.Event()
+
+    def purchase_product(self, product_id: int, expected_version: int = None) -> None:
+        self.released.wait(5)
+        super().purchase_product(product_id, expected_version)
+
+
+class FixedProvider(PaymentProvider):
+    """A payment provider approving or declining every payment."""
+
+    def __init__(self, approve: bool):
+        self.approve = approve
+        self.captured = []
+
+    def authorize(self, amount: int) -> Authorization:
+        if not self.approve:
+            raise PaymentDeclined("Card declined.")
+        return Authorization("auth-1", amount)
+
+    def capture(self, authorization: Authorization) -> None:
+        self.captured.append(authorization)
+
+    def void(self, authorization: Authorization) -> None:
+        pass
+
+
+class TestShadowedVendingMachine(unittest.TestCase):
+    def setUp(self):
+        """Set up the shadowed machines, closed after each test."""
+        self.machines = []
+
+    def tearDown(self):
+        SlowMachine.released.set()
+        for vending_machine in self.machines:
+            vending_machine.close()
+        SlowMachine.released.clear()
+
+    def create(self, candidate_factory=VendingMachine.from_snapshot, **kwargs) -> ShadowedVendingMachine:
+        """Create a shadowed machine stocked with a product."""
+        vending_machine = ShadowedVendingMachine(candidate_factory, **kwargs)
+        self.machines.append(vending_machine)
+        vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+        return vending_machine
+
+    def sell(self, vending_machine: VendingMachine):
+        """Sell a product and dispense the change."""
+        vending_machine.insert_money(200)
+        vending_machine.purchase_product(1)
+        return vending_machine.dispense_change()
+
+    def test_identical_candidate(self):
+        """Test an identical candidate replays every operation, including failures, without divergences."""
+        vending_machine = self.create()
+        self.assertEqual(self.sell(vending_machine).to_dict(), {50: 1, 20: 1, 10: 1})
+        with self.assertRaises(ValueError):
+            vending_machine.purchase_product(99)
+        vending_machine.reload_currency(50, 5)
+        vending_machine.reload_planogram(Planogram((PlannedProduct(1, "Coke", 90),)))
+        self.assertTrue(vending_machine.flush(5))
+        stats = vending_machine.stats()
+        self.assertEqual((stats.operations, stats.divergences, stats.desynchronized), (7, 0, False))
+        self.assertGreater(stats.relative_latency, 0)
+        self.assertEqual(vending_machine.divergences, [])
+
+    def test_divergent_candidate(self):
+        """Test differences in results and state are recorded against the operation that caused them."""
+        vending_machine = self.create(OverchargingMachine.from_snapshot)
+        self.sell(vending_machine)
+        self.assertTrue(vending_machine.flush(5))
+        divergences = vending_machine.divergences
+        self.assertEqual([(divergence.operation, divergence.field) for divergence in divergences],
+                         [("purchase_product", "balance")])
+        self.assertEqual((divergences[0].primary, divergences[0].candidate), (80, 70))
+        self.assertEqual(vending_machine.stats().divergences, 1)  # The change is compared from the resynced state
+
+    def test_single_divergence_counted_once(self):
+        """Test one bad operation is counted once, as the candidate is resynced before the next comparison."""
+        vending_machine = self.create(StrictMachine.from_snapshot)
+        vending_machine.insert_money(20)
+        for _ in range(3):
+            self.sell(vending_machine)
+        vending_machine.reload_currency(10, 5)
+        self.assertTrue(vending_machine.flush(5))
+        stats = vending_machine.stats()
+        self.assertEqual((stats.operations, stats.divergences), (12, 1))
+        self.assertEqual({divergence.operation for divergence in vending_machine.divergences}, {"insert_money"})
+
+    def test_error_divergence(self):
+        """Test an operation failing on only one side is recorded."""
+        vending_machine = self.create(StrictMachine.from_snapshot)
+        vending_machine.insert_money(20)
+        self.assertTrue(vending_machine.flush(5))
+        self.assertEqual([(divergence.field, divergence.primary, divergence.candidate)
+                          for divergence in vending_machine.divergences[:2]],
+                         [("error", None, ("ValueError", "20p coins are not accepted.")), ("balance", 20, 0)])
+
+    def test_cashless_mirrored(self):
+        """Test cashless sales reach the candidate without charging twice, and declined ones are not replayed."""
+        vending_machine = self.create()
+        provider = FixedProvider(approve=True)
+        vending_machine.purchase_cashless(1, provider)
+        with self.assertRaises(PaymentDeclined):
+            vending_machine.purchase_cashless(1, FixedProvider(approve=False))
+        self.assertTrue(vending_machine.flush(5))
+        self.assertEqual(len(provider.captured), 1)
+        self.assertEqual((vending_machine.stats().operations, vending_machine.divergences), (2, []))
+
+    def test_hardware_recovery_mirrored(self):
+        """Test refunded vends and restored change are replayed, so later comparisons stay in sync."""
+        vending_machine = self.create()
+        vending_machine.insert_money(200)
+        vending_machine.purchase_product(1)
+        vending_machine.refund_purchase(1, 120)
+        change = vending_machine.dispense_change()
+        vending_machine.restore_change(change)
+        self.sell(vending_machine)
+        self.assertTrue(vending_machine.flush(5))
+        self.assertEqual((vending_machine.stats().operations, vending_machine.divergences), (9, []))
+
+    def test_refund_to_slot_and_lot_mirrored(self):
+        """Test a refund returning the unit to its slot and lot is replayed with the unit the primary sold."""
+        vending_machine = self.create()
+        vending_machine.assign_slots(1, [3, 3])
+        vending_machine.reload_product(1, 1, date(2030, 1, 31))
+        vending_machine.insert_money(200)
+        unit = vending_machine.purchase_product(1)
+        self.assertEqual(unit.expiry, date(2030, 1, 31))
+        vending_machine.refund_purchase(1, 120, unit)
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in vending_machine.get_lots(1)], [(date(2030, 1, 31), 1)])
+        self.sell(vending_machine)
+        self.assertTrue(vending_machine.flush(5))
+        self.assertEqual((vending_machine.stats().operations, vending_machine.divergences), (9, []))
+
+    def test_version_conflict_mirrored(self):
+        """Test conditional operations are replayed with their expected versions, failing on both sides."""
+        vending_machine = self.create()
+        stale = vending_machine.select_product(1).version
+        vending_machine.reload_product(1, 1)
+        vending_machine.insert_money(200)
+        test_cases = [
+            ("purchase_product", lambda: vending_machine.purchase_product(1, expected_version=stale)),
+            ("reload_product", lambda: vending_machine.reload_product(1, 1, expected_version=stale)),
+            ("reload_currency", lambda: vending_machine.reload_currency(50, 1, expected_version=99)),
+        ]
+        for operation, call in test_cases:
+            with self.subTest(operation=operation):
+                with self.assertRaises(VersionConflict):
+                    call()
+        self.assertTrue(vending_machine.flush(5))
+        self.assertEqual(vending_machine.divergences, [])
+
+    def test_concurrent_clients_replayed_in_order(self):
+        """Test operations from several threads are replayed in the order the primary applied them."""
+        vending_machine = self.create()
+
+        def insert(denom):
+            for _ in range(100):
+                vending_machine.insert_money(denom)
+
+        threads = [threading.Thread(target=insert, args=(denom,)) for denom in (10, 20, 50, 100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(vending_machine.flush(5))
+        self.assertEqual((vending_machine.stats().operations, vending_machine.divergences), (401, []))
+
+    def test_primary_not_slowed(self):
+        """Test a slow candidate neither delays the primary nor blocks it once the queue is full."""
+        vending_machine = self.create(SlowMachine.from_snapshot, capacity=3)
+        self.assertTrue(vending_machine.flush(5))
+        start = time.perf_counter()
+        for _ in range(3):
+            vending_machine.insert_money(200)
+            vending_machine.purchase_product(1)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(vending_machine.select_product(1).quantity, 2)
+        self.assertFalse(vending_machine.flush(0.05))
+        SlowMachine.released.set()
+        self.assertTrue(vending_machine.flush(5))
+        stats = vending_machine.stats()
+        self.assertTrue(stats.desynchronized)
+        self.assertLess(stats.operations, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from src.vending_machine.slots import SlotBank
+
+
+class TestSlotBank(unittest.TestCase):
+    def setUp(self):
+        """Set up a product spread over three slots."""
+        self.slots = SlotBank([4, 8, 8])
+
+    def quantities(self) -> list[int]:
+        return [slot.quantity for slot in self.slots.slots]
+
+    def test_invalid_capacities(self):
+        """Test slots without capacity are rejected."""
+        for capacities in ([], [4, 0], [-1]):
+            with self.subTest(capacities=capacities):
+                with self.assertRaises(ValueError):
+                    SlotBank(capacities)
+
+    def test_fill_emptiest_first(self):
+        """Test reloads go to the emptiest slots relative to their capacity."""
+        self.slots.fill(10)
+        self.assertEqual(self.quantities(), [2, 4, 4])
+        self.slots.fill(10)
+        self.assertEqual(self.quantities(), [4, 8, 8])
+        self.assertEqual((self.slots.quantity, self.slots.available), (20, 20))
+
+    def test_fill_over_capacity(self):
+        """Test a reload exceeding the total slot capacity is rejected without changes."""
+        self.slots.fill(15)
+        with self.assertRaises(ValueError):
+            self.slots.fill(6)
+        self.assertEqual(self.slots.quantity, 15)
+
+    def test_take_balances_wear(self):
+        """Test consecutive vends rotate over the slots."""
+        self.slots.fill(9)
+        vended = [self.slots.take().index for _ in range(6)]
+        self.assertEqual(sorted(vended[:3]), [0, 1, 2])
+        self.assertEqual(sorted(vended[3:]), [0, 1, 2])
+        self.assertEqual(self.slots.available, 3)
+
+    def test_jammed_slot_skipped(self):
+        """Test a jammed slot is not vended from and its stock is not available until cleared."""
+        self.slots.fill(3)
+        self.slots.set_jammed(1, True)
+        self.assertEqual(self.slots.available, 2)
+        self.assertNotEqual(self.slots.take().index, 1)
+        self.assertNotEqual(self.slots.take().index, 1)
+        with self.assertRaises(ValueError):
+            self.slots.take()
+        self.slots.set_jammed(1, False)
+        self.assertEqual(self.slots.take().index, 1)
+
+    def test_put_back(self):
+        """Test an undelivered unit returns to its slot, or to the emptiest slot if that one is full or unknown."""
+        self.slots.fill(19)
+        self.assertEqual(self.quantities(), [4, 8, 7])
+        self.slots.put_back(1)  # Full, so the emptiest slot gets it
+        self.assertEqual(self.quantities(), [4, 8, 8])
+        for index in (None, 3):
+            with self.subTest(index=index):
+                self.slots.take()
+                self.slots.put_back(index)
+                self.assertEqual(self.quantities(), [4, 8, 8])
+        first, second = self.slots.take().index, self.slots.take().index
+        self.assertEqual((first, second, self.quantities()), (0, 1, [3, 7, 8]))
+        self.slots.put_back(second)
+        self.assertEqual(self.quantities(), [3, 8, 8])  # Not the emptiest slot
+        self.slots.put_back(first)
+        self.assertEqual((self.slots.quantity, self.slots.available), (20, 20))
+        self.assertEqual(sum(slot.vends for slot in self.slots.slots), 4)  # The motor turned for every take
+
+    def test_put_back_jammed(self):
+        """Test a unit returned to a jammed slot is not available until the slot is cleared."""
+        self.slots.fill(3)
+        index = self.slots.take().index
+        self.slots.set_jammed(index, True)
+        self.slots.put_back(index)
+        self.assertEqual((self.slots.quantity, self.slots.available), (3, 2))
+        self.slots.set_jammed(index, False)
+        self.assertEqual(self.slots.available, 3)
+
+    def test_set_jammed_invalid_slot(self):
+        """Test jamming a slot that does not exist raises an error."""
+        with self.assertRaises(ValueError):
+            self.slots.set_jammed(3, True)
+
+
+if __name__ == "__main__":
+    unittest.main()
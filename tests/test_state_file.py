@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.planogram import PlannedProduct, Planogram
+from src.vending_machine.product import Product
+from src.vending_machine.state_file import load_state, save_state
+
+
+class TestStateFile(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine mid-session and a temporary state file path."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "state.json")
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_products([Product(id_=1, name="Coke", price=120, quantity=5),
+                                           Product(id_=2, name="Crisps", price=80, quantity=3)])
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(2)
+        self.vending_machine.reload_currency(5, 3)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        """Test a saved machine is restored with the same state."""
+        save_state(self.vending_machine, self.path)
+        restored = load_state(self.path)
+        self.assertEqual(restored.balance, 120)
+        self.assertEqual(restored.list_products(), self.vending_machine.list_products())
+        self.assertEqual(restored.get_denomination_counts(), self.vending_machine.get_denomination_counts())
+        self.assertEqual(restored.get_stored_money(), {200: 1})
+
+    def test_lots(self):
+        """Test dated lots are restored with their expiry and remaining quantity, and sold earliest first."""
+        self.vending_machine.reload_product(2, 5, date(2030, 6, 30))
+        self.vending_machine.reload_product(2, 2, date(2030, 1, 31))
+        self.vending_machine.insert_money(100)
+        self.vending_machine.purchase_product(2)
+        save_state(self.vending_machine, self.path)
+        restored = load_state(self.path)
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in restored.get_lots(2)],
+                         [(date(2030, 1, 31), 1), (date(2030, 6, 30), 5)])
+        self.assertEqual(restored.list_products(), self.vending_machine.list_products())
+        restored.purchase_product(2)
+        self.assertEqual([lot.expiry for lot in restored.get_lots(2)], [date(2030, 6, 30)])
+
+    def test_versions(self):
+        """Test product and tube versions survive a save, so conditional operations read before it still apply."""
+        snapshot = self.vending_machine.snapshot()
+        save_state(self.vending_machine, self.path)
+        restored = load_state(self.path)
+        self.assertEqual([product.version for product in restored.snapshot().products],
+                         [product.version for product in snapshot.products])
+        self.assertEqual(restored.snapshot().tube_versions, snapshot.tube_versions)
+        restored.reload_product(2, 1, expected_version=snapshot.products[1].version)
+        restored.reload_currency(5, 1, expected_version=snapshot.tube_versions[5])
+
+    def test_slots_and_accepted_denominations(self):
+        """Test slots and the denominations accepted under a planogram are restored."""
+        self.vending_machine.assign_slots(1, [3, 4])
+        self.vending_machine.purchase_product(1)
+        self.vending_machine.report_jam(1, 1)
+        self.vending_machine.reload_planogram(Planogram((PlannedProduct(1, "Coke", 120, (3, 4)),
+                                                         PlannedProduct(2, "Crisps", 80)), (200, 100, 50)))
+        save_state(self.vending_machine, self.path)
+        restored = load_state(self.path)
+        self.assertEqual(restored.get_valid_denominations(), (200, 100, 50))
+        self.assertEqual([repr(slot) for slot in restored.get_slots(1)],
+                         [repr(slot) for slot in self.vending_machine.get_slots(1)])
+        self.assertEqual(restored.get_slots(2), [])
+        self.assertEqual(restored.get_capacities(), self.vending_machine.get_capacities())
+        with self.assertRaises(ValueError):
+            restored.insert_money(20)
+
+    def test_restored_machine_operates(self):
+        """Test a restored machine continues the session."""
+        save_state(self.vending_machine, self.path)
+        restored = load_state(self.path)
+        restored.purchase_product(1)
+        self.assertFalse(restored.dispense_change())
+
+    def test_missing_file(self):
+        """Test loading a missing state file raises an error."""
+        with self.assertRaises(FileNotFoundError):
+            load_state(self.path)
+
+    def test_invalid_file(self):
+        """Test loading an invalid state file raises an error."""
+        products = '"balance": 0, "denomination_counts": [], "inserted_money": [], "products": [[1, "Coke", 120, 5]]'
+        test_cases = ["not json", '{"balance": 0}', '{"balance": 0, "denomination_counts": [[3, 1]], '
+                                                     '"inserted_money": [], "products": []}',
+                      '{%s, "slots": [[1, [[3, 2, 0, false]]]]}' % products,
+                      '{%s, "slots": [[1, [[3, 2]]]]}' % products,
+                      '{%s, "accepted_denominations": [3]}' % products,
+                      '{%s, "accepted_denominations": []}' % products]
+        for content in test_cases:
+            with self.subTest(content=content):
+                with open(self.path, "w", encoding="utf-8") as state_file:
+                    state_file.write(content)
+                with self.assertRaises(ValueError):
+                    load_state(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
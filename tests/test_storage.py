@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+
+from src.vending_machine.currency import Currency
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+from src.vending_machine.storage import SQLiteStorage
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine backed by a temporary database."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "machine.db")
+        self.storage = SQLiteStorage(self.path)
+        self.vending_machine = VendingMachine(storage=self.storage)
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+        self.reader = sqlite3.connect(self.path)  # Back office connection
+
+    def tearDown(self):
+        self.reader.close()
+        self.storage.close()
+        self.tmp_dir.cleanup()
+
+    def query(self, sql: str) -> list:
+        return self.reader.execute(sql).fetchall()
+
+    def test_wal_mode(self):
+        """Test the database runs in WAL mode."""
+        self.assertEqual(self.storage.journal_mode, "wal")
+
+    def test_initial_state_written(self):
+        """Test a new database is seeded with the machine state."""
+        self.assertEqual(self.query("SELECT id, name, price, quantity FROM products"), [(1, "Coke", 120, 5)])
+        self.assertEqual(dict(self.query("SELECT denom, count FROM denominations")),
+                         {denom: Currency.INITIAL_DENOMINATION_COUNT for denom in Currency.DENOMINATIONS})
+
+    def trace(self) -> list[str]:
+        """Record the statements the storage executes from now on."""
+        statements = []
+        self.storage._connection.set_trace_callback(statements.append)
+        return statements
+
+    def test_session_committed_once(self):
+        """Test session mutations are only written when the session ends."""
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(1)
+        self.assertEqual(self.query("SELECT quantity FROM products WHERE id = 1"), [(5,)])
+        self.assertEqual(self.query("SELECT inserted FROM denominations WHERE denom = 200"), [(0,)])
+
+        self.vending_machine.dispense_change()
+        self.assertEqual(self.query("SELECT quantity FROM products WHERE id = 1"), [(4,)])
+        self.assertEqual(self.query("SELECT inserted FROM denominations WHERE denom = 200"), [(1,)])
+        self.assertEqual(self.query("SELECT denom, count FROM denominations WHERE denom IN (50, 20, 10)"),
+                         [(10, 9), (20, 9), (50, 9)])
+        self.assertEqual(self.query("SELECT value FROM machine_state WHERE key = 'balance'"), [(0,)])
+
+    def test_single_transaction_per_session(self):
+        """Test a session of several coins and a sale makes exactly one transaction."""
+        statements = self.trace()
+        for denom in (100, 50, 20):
+            self.vending_machine.insert_money(denom)
+        self.vending_machine.purchase_product(1)
+        self.vending_machine.dispense_change()
+        self.assertEqual(statements.count("BEGIN"), 1)
+        self.assertEqual(statements.count("COMMIT"), 1)
+
+    def test_only_changed_rows_written(self):
+        """Test a sale only rewrites the slot and lot it was taken from."""
+        self.vending_machine.reload_product(1, 2, expiry=date(2024, 6, 30))
+        self.vending_machine.reload_product(1, 2, expiry=date(2024, 7, 31))
+        self.vending_machine.assign_slots(1, [5, 5, 5])
+        statements = self.trace()
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(1)
+        self.vending_machine.dispense_change()
+        for table, count in [("slots", 1), ("lots", 1)]:
+            with self.subTest(table=table):
+                self.assertEqual(sum(f"INTO {table} " in statement for statement in statements), count)
+                self.assertFalse(any(statement.startswith(f"DELETE FROM {table}") for statement in statements))
+        self.assertEqual(self.query("SELECT expiry, quantity FROM lots ORDER BY expiry"),
+                         [("2024-06-30", 1), ("2024-07-31", 2)])
+
+    def test_maintenance_committed(self):
+        """Test maintenance operations are written immediately."""
+        self.vending_machine.reload_product(1, 3)
+        self.vending_machine.reload_currency(100, 5)
+        self.assertEqual(self.query("SELECT quantity FROM products WHERE id = 1"), [(8,)])
+        self.assertEqual(self.query("SELECT count FROM denominations WHERE denom = 100"), [(15,)])
+
+    def test_restore_state(self):
+        """Test a new machine restores the persisted state."""
+        self.vending_machine.insert_money(100)
+        self.vending_machine.insert_money(50)
+        self.vending_machine.purchase_product(1)
+        self.storage.close()
+
+        self.storage = SQLiteStorage(self.path)
+        restored = VendingMachine(storage=self.storage)
+        self.assertEqual(restored.balance, 30)
+        self.assertEqual(restored.select_product(1).quantity, 4)
+        self.assertEqual(restored.get_stored_money(), {100: 1, 50: 1})
+        self.assertEqual(restored.get_denomination_counts(), self.vending_machine.get_denomination_counts())
+
+    def test_restore_slots_and_lots(self):
+        """Test slot capacities, quantities, jams and dated lots survive a restart, and sales keep them current."""
+        self.vending_machine.reload_product(1, 2, expiry=date(2024, 6, 30))
+        self.vending_machine.assign_slots(1, [4, 4])
+        self.vending_machine.report_jam(1, 0)
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(1)
+        self.storage.close()
+
+        self.storage = SQLiteStorage(self.path)
+        restored = VendingMachine(storage=self.storage)
+        for original, copy in zip(self.vending_machine.get_slots(1), restored.get_slots(1), strict=True):
+            with self.subTest(slot=original.index):
+                self.assertEqual((copy.capacity, copy.quantity, copy.vends, copy.jammed),
+                                 (original.capacity, original.quantity, original.vends, original.jammed))
+        self.assertEqual([(lot.expiry, lot.quantity) for lot in restored.get_lots(1)], [(date(2024, 6, 30), 1)])
+        self.assertEqual(restored.select_product(1).capacity, 8)
+
+    def test_restore_versions(self):
+        """Test product versions survive a restart, so conditional operations keep working."""
+        self.vending_machine.reload_product(1, 3)
+        version = self.vending_machine.select_product(1).version
+        self.storage.close()
+
+        self.storage = SQLiteStorage(self.path)
+        restored = VendingMachine(storage=self.storage)
+        self.assertEqual(restored.select_product(1).version, version)
+        restored.reload_product(1, 1, expected_version=version)
+
+
+if __name__ == "__main__":
+    unittest.main()
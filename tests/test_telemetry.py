@@ -0,0 +1,195 @@
+import os
+import tempfile
+import unittest
+
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+from src.vending_machine.telemetry import MockTelemetryServer, TelemetrySpool, TelemetryUploader, encode_event
+
+
+class TestTelemetrySpool(unittest.TestCase):
+    def setUp(self):
+        """Set up a spool in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "telemetry.db")
+        self.spool = TelemetrySpool(self.path, max_records=5)
+
+    def tearDown(self):
+        self.spool.close()
+        self.tmp_dir.cleanup()
+
+    def test_peek_and_remove(self):
+        """Test events are read oldest first and only removed once acknowledged."""
+        self.spool.append(["a", "b", "c"])
+        last_id, lines = self.spool.peek(2, 1024)
+        self.assertEqual(lines, ["a", "b"])
+        self.assertEqual(len(self.spool), 3)
+        self.spool.remove(last_id)
+        self.assertEqual(self.spool.peek(10, 1024)[1], ["c"])
+
+    def test_peek_bounded_by_size(self):
+        """Test a peek stops before exceeding the byte limit, but always returns at least one event."""
+        self.spool.append(["x" * 10, "y" * 10, "z" * 10])
+        self.assertEqual(self.spool.peek(10, 25)[1], ["x" * 10, "y" * 10])
+        self.assertEqual(self.spool.peek(10, 5)[1], ["x" * 10])
+
+    def test_oldest_dropped_when_full(self):
+        """Test the oldest events are dropped beyond the maximum number of records."""
+        self.spool.append([str(i) for i in range(4)])
+        self.spool.append([str(i) for i in range(4, 8)])
+        self.assertEqual(self.spool.peek(10, 1024)[1], ["3", "4", "5", "6", "7"])
+        self.assertEqual(self.spool.dropped, 3)
+
+    def test_survives_restart(self):
+        """Test spooled events are still queued after reopening the database."""
+        self.spool.append(["a", "b"])
+        self.spool.close()
+        self.spool = TelemetrySpool(self.path)
+        self.assertEqual(self.spool.peek(10, 1024)[1], ["a", "b"])
+
+
+class TestTelemetryUploader(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine uploading to a local telemetry server."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spool = TelemetrySpool(os.path.join(self.tmp_dir.name, "telemetry.db"))
+        self.server = MockTelemetryServer()
+        self.address = self.server.start()
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=20))
+        self.uploader = None
+
+    def tearDown(self):
+        if self.uploader is not None:
+            self.uploader.close()
+        self.server.stop()
+        self.spool.close()
+        self.tmp_dir.cleanup()
+
+    def start_uploader(self, **kwargs):
+        """Start uploading the vending machine's events with fast retries."""
+        kwargs = {"upload_interval": 0.0, "backoff": 0.01, "max_backoff": 0.05, **kwargs}
+        self.uploader = TelemetryUploader(self.vending_machine.events, self.spool, *self.address,
+                                          machine_id="machine-7", **kwargs)
+
+    def sell(self, count: int):
+        """Sell a number of products, dispensing the change of each sale."""
+        for _ in range(count):
+            self.vending_machine.insert_money(200)
+            self.vending_machine.purchase_product(1)
+            self.vending_machine.dispense_change()
+
+    def collect_events(self) -> list:
+        """Sell a product on another machine and return its purchase event."""
+        events = []
+        vending_machine = VendingMachine()
+        vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=1))
+        vending_machine.events.subscribe(events.extend)
+        vending_machine.insert_money(200)
+        vending_machine.purchase_product(1)
+        vending_machine.events.flush()
+        return [event for event in events if type(event).__name__ == "ProductPurchased"]
+
+    def test_events_uploaded(self):
+        """Test sales and change events reach the server compressed, over one connection."""
+        self.start_uploader()
+        self.sell(3)
+        self.assertTrue(self.uploader.flush(5))
+        events = self.server.events
+        self.assertEqual([event["type"] for event in events], ["ProductPurchased", "ChangeDispensed"] * 3)
+        self.assertEqual(events[1]["change"], {"50": 1, "20": 1, "10": 1})
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.machine_ids, {"machine-7"})
+        self.assertEqual(len(self.spool), 0)
+
+    def test_offline_buffering(self):
+        """Test events are kept while the server is down and uploaded in order, once, when it is back."""
+        self.server.online = False
+        self.start_uploader()
+        self.sell(5)
+        self.assertFalse(self.uploader.flush(0.2))
+        self.assertEqual(len(self.spool), 10)
+        self.assertGreater(self.server.rejected, 1)  # Retried
+        self.server.online = True
+        self.assertTrue(self.uploader.flush(5))
+        self.assertEqual([event["type"] for event in self.server.events], ["ProductPurchased", "ChangeDispensed"] * 5)
+
+    def test_rejected_batches_dropped(self):
+        """Test a batch rejected with a client error is dropped and counted, and later events still go through."""
+        self.server.online = False
+        self.server.offline_status = 400
+        self.start_uploader()
+        with self.assertLogs("src.vending_machine.telemetry", "ERROR"):
+            self.sell(1)
+            self.assertTrue(self.uploader.flush(5))
+        self.assertEqual((self.server.rejected, self.uploader.dropped, len(self.spool)), (1, 2, 0))
+        self.server.online = True
+        self.sell(1)
+        self.assertTrue(self.uploader.flush(5))
+        self.assertEqual([event["type"] for event in self.server.events], ["ProductPurchased", "ChangeDispensed"])
+
+    def test_throttled_batches_retried(self):
+        """Test batches answered with a timeout or throttling status are retried, not dropped."""
+        for status in (408, 429):
+            with self.subTest(status=status):
+                self.server.online = False
+                self.server.offline_status = status
+                self.server.rejected = 0
+                self.start_uploader()
+                self.sell(1)
+                self.assertFalse(self.uploader.flush(0.2))
+                self.assertGreater(self.server.rejected, 1)
+                self.server.online = True
+                self.assertTrue(self.uploader.flush(5))
+                self.assertEqual(self.uploader.dropped, 0)
+                self.uploader.close()
+                self.uploader = None
+
+    def test_buffer_overflow_counted(self):
+        """Test events dropped before reaching a stalled spool are counted, without stalling the sales."""
+        self.start_uploader(capacity=2)
+        with self.spool._lock:  # As if the disk were stalled
+            self.sell(5)
+        self.assertTrue(self.uploader.flush(5))
+        self.assertGreater(self.uploader.dropped, 0)  # Coin insertions included, they share the buffer
+        self.assertLess(len(self.server.events), 10)
+
+    def test_bounded_payloads(self):
+        """Test a backlog is drained in batches within the record and size limits."""
+        self.server.online = False
+        self.start_uploader(batch_records=8, max_payload_bytes=600)
+        self.sell(10)
+        self.assertFalse(self.uploader.flush(0.1))
+        self.server.online = True
+        self.assertTrue(self.uploader.flush(5))
+        self.assertEqual(len(self.server.events), 20)
+        self.assertGreater(len(self.server.batches), 2)
+        for batch, (compressed, uncompressed) in zip(self.server.batches, self.server.payload_sizes):
+            self.assertLessEqual(len(batch), 8)
+            self.assertLessEqual(uncompressed, 600)
+            self.assertLess(compressed, uncompressed)
+
+    def test_resumes_from_spool(self):
+        """Test events spooled before a restart are uploaded by the next uploader."""
+        self.spool.append([encode_event(event) for event in self.collect_events()])
+        self.start_uploader()
+        self.assertTrue(self.uploader.flush(5))
+        self.assertEqual([event["type"] for event in self.server.events], ["ProductPurchased"])
+
+    def test_untracked_events_skipped(self):
+        """Test coin insertions and failures are not uploaded."""
+        self.start_uploader()
+        self.vending_machine.insert_money(200)
+        with self.assertRaises(ValueError):
+            self.vending_machine.purchase_product(99)
+        self.assertTrue(self.uploader.flush(5))
+        self.assertEqual(self.server.events, [])
+
+    def test_invalid_limits(self):
+        """Test non-positive batch limits are rejected."""
+        with self.assertRaises(ValueError):
+            self.start_uploader(batch_records=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
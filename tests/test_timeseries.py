@@ -0,0 +1,78 @@
+import unittest
+
+from src.vending_machine.machine import VendingMachine
+from src.vending_machine.product import Product
+from src.vending_machine.timeseries import LevelRecorder, RingSeries
+
+
+class TestRingSeries(unittest.TestCase):
+    def setUp(self):
+        """Set up a small series."""
+        self.series = RingSeries(capacity=4)
+
+    def test_append_and_iterate(self):
+        """Test samples are decoded in order."""
+        samples = [(100, 10), (160, 9), (220, 9), (280, 15)]
+        for timestamp, level in samples:
+            self.series.append(timestamp, level)
+        self.assertEqual(list(self.series), samples)
+
+    def test_overwrites_oldest(self):
+        """Test a full series keeps only the newest samples."""
+        samples = [(timestamp, timestamp % 7) for timestamp in range(0, 100, 10)]
+        for timestamp, level in samples:
+            self.series.append(timestamp, level)
+        self.assertEqual(len(self.series), 4)
+        self.assertEqual(list(self.series), samples[-4:])
+
+    def test_downsample(self):
+        """Test samples are aggregated into buckets over a window."""
+        for timestamp, level in [(0, 10), (10, 8), (20, 6), (30, 4)]:
+            self.series.append(timestamp, level)
+        self.assertEqual(self.series.downsample(0, 39, buckets=2), [(0, 9, 8, 10), (20, 5, 4, 6)])
+        self.assertEqual(self.series.downsample(15, 25, buckets=1), [(15, 6, 6, 6)])
+        self.assertEqual(RingSeries(4).downsample(), [])
+
+    def test_invalid_capacity(self):
+        """Test a non-positive capacity raises an error."""
+        with self.assertRaises(ValueError):
+            RingSeries(0)
+
+
+class TestLevelRecorder(unittest.TestCase):
+    def setUp(self):
+        """Set up a vending machine with one product."""
+        self.vending_machine = VendingMachine()
+        self.vending_machine.add_product(Product(id_=1, name="Coke", price=120, quantity=5))
+
+    def test_machine_levels(self):
+        """Test the machine records stock and coin tube levels."""
+        self.vending_machine.sample_levels(timestamp=0)
+        self.vending_machine.insert_money(200)
+        self.vending_machine.purchase_product(1)
+        self.vending_machine.dispense_change()
+        self.vending_machine.sample_levels(timestamp=60)
+        self.assertEqual(self.vending_machine.levels.stock_levels(1, buckets=2), [(0, 5, 5, 5), (30.5, 4, 4, 4)])
+        self.assertEqual(self.vending_machine.levels.coin_levels(50, buckets=1), [(0, 9.5, 9, 10)])
+
+    def test_bounded_memory(self):
+        """Test memory does not grow once every series is full."""
+        recorder = LevelRecorder(capacity=10)
+        counts = self.vending_machine.get_denomination_counts()
+        products = self.vending_machine.snapshot().products
+        for timestamp in range(10):
+            recorder.sample(counts, products, timestamp)
+        memory = recorder.memory_bytes
+        for timestamp in range(10, 1000):
+            recorder.sample(counts, products, timestamp)
+        self.assertEqual(recorder.memory_bytes, memory)
+        self.assertEqual(len(recorder.stock_levels(1, buckets=1000)), 10)
+
+    def test_unknown_series(self):
+        """Test querying a series that was never sampled raises an error."""
+        with self.assertRaises(ValueError):
+            LevelRecorder().stock_levels(1)
+
+
+if __name__ == "__main__":
+    unittest.main()